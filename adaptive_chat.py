@@ -15,15 +15,26 @@ from ryu.lib.packet import tcp
 from ryu.lib.packet import udp,arp
 from ryu.lib import hub
 
+from ecmp.failover import uplink_group_mods
+from ecmp.wcmp import WcmpWeights
+
 
 class SimpleSwitch13(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    FAILOVER_MODE = 'chained'  # 'none', 'watch' (live select buckets) or 'chained' (OFPGT_FF per uplink)
+    UPLINK_PORTS = (1, 2)
+    UPLINK_GROUP_ID = 50
+    UPLINK_CAPACITY_BPS = 3e6  # bw=3 TCLinks in simple_topo
+    WCMP_BUCKET_BUDGET = 64  # total bucket weight the switch can realize per group
+    WCMP_MIN_DELTA = 0.05  # share change on some uplink below which weights are not re-sent
 
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.logger.info('SimpleSwitch13 initialized')
         self.mac_to_port = {}
         self.group_mod_flag = {}
+        self.uplink_groups = set()  # dpids whose group 50 exists
+        self.wcmp = WcmpWeights(self.WCMP_BUCKET_BUDGET, self.WCMP_MIN_DELTA)
 
         # monitor
         self.sleep = 2
@@ -46,6 +57,8 @@ class SimpleSwitch13(app_manager.RyuApp):
             if datapath.id in self.datapaths:
                 self.logger.debug('unregister datapath: %016x', datapath.id)
                 del self.datapaths[datapath.id]
+                self.uplink_groups.discard(datapath.id)
+                self.wcmp.forget(datapath.id)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -97,37 +110,17 @@ class SimpleSwitch13(app_manager.RyuApp):
         datapath.send_msg(mod)
 
     def send_group_mod(self, datapath, port_weights=None):
-            ofproto = datapath.ofproto
-            ofp_parser = datapath.ofproto_parser
-
-            # Default ports
-            port_1 = 1
-            port_2 = 2
-            queue_1 = ofp_parser.OFPActionSetQueue(0)
-            actions_1 = [queue_1, ofp_parser.OFPActionOutput(port_1)]
-            queue_2 = ofp_parser.OFPActionSetQueue(0)
-            actions_2 = [queue_2, ofp_parser.OFPActionOutput(port_2)]
-            # Default weights
-            weight_1 = 50
-            weight_2 = 50
-            if port_weights:
-                weight_1 = port_weights.get(port_1, 1)
-                weight_2 = port_weights.get(port_2, 1)
-            watch_port = ofproto_v1_3.OFPP_ANY
-            watch_group = ofproto_v1_3.OFPQ_ALL
-            buckets = [
-                ofp_parser.OFPBucket(weight_1, watch_port, watch_group, actions_1),
-                ofp_parser.OFPBucket(weight_2, watch_port, watch_group, actions_2)]
-            group_id = 50
-            # Use MODIFY if group already exists, else ADD
-            if hasattr(ofproto, 'OFPFC_MODIFY'):  # Defensive
-                command = ofproto.OFPFC_MODIFY
-            else:
-                command = ofproto.OFPFC_ADD
-            req = ofp_parser.OFPGroupMod(datapath, command,
-                                        ofproto.OFPGT_SELECT, group_id, buckets)
-
-            datapath.send_msg(req)
+            ports = list(self.UPLINK_PORTS)
+            # ADD the first time (with the fast-failover groups behind the
+            # buckets and equal weights), then MODIFY only the weights of the
+            # select group
+            add = datapath.id not in self.uplink_groups
+            if add or not port_weights:
+                port_weights = self.wcmp.reset(datapath.id, ports)
+            for req in uplink_group_mods(datapath, self.UPLINK_GROUP_ID, ports, port_weights,
+                                         mode=self.FAILOVER_MODE, add=add):
+                datapath.send_msg(req)
+            self.uplink_groups.add(datapath.id)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -187,11 +180,11 @@ class SimpleSwitch13(app_manager.RyuApp):
                         actions = [parser.OFPActionOutput(out_port)]
                     else:
                         # Inter-leaf: group action (uplink)
-                        actions = [parser.OFPActionGroup(group_id=50)]
+                        actions = [parser.OFPActionGroup(group_id=self.UPLINK_GROUP_ID)]
                 else:
                     # Unknown: flood to other host port and group
                     actions = [parser.OFPActionOutput(4 if in_port == 3 else 3),
-                               parser.OFPActionGroup(group_id=50)]
+                               parser.OFPActionGroup(group_id=self.UPLINK_GROUP_ID)]
             elif in_port in [1, 2]:  # From spine
                 if dst in self.mac_to_port[dpid]:
                     out_port = self.mac_to_port[dpid][dst]
@@ -275,8 +268,6 @@ class SimpleSwitch13(app_manager.RyuApp):
         if dpid == 201:
             self.logger.info('datapath         port     tx-pkts  tx-bytes')
             self.logger.info('---------------- -------- -------- --------')
-        max_bw = 1  # Avoid division by zero
-        port_bw = {}
         for stat in sorted(body, key=attrgetter('port_no')):
             port_no = stat.port_no
             self.tx_pkt_cur.setdefault(dpid, {})
@@ -293,22 +284,19 @@ class SimpleSwitch13(app_manager.RyuApp):
                 if self.tx_byte_int[dpid][port_no] < 0:
                     self.logger.warning('Negative value of interval TX bytes')
             self.tx_byte_cur[dpid][port_no] = stat.tx_bytes
-            # Calculate available bandwidth as inverse of tx_bytes in interval
-            bw = max(1, 1000000 - self.tx_byte_int[dpid].get(port_no, 0))
-            port_bw[port_no] = bw
-            if bw > max_bw:
-                max_bw = bw
             if dpid == 201:
                 if port_no in self.tx_pkt_int[dpid] and port_no in self.tx_byte_int[dpid]:
                     self.logger.info('%016x %8x %8d %8d', dpid, port_no,
                                     self.tx_pkt_int[dpid][port_no],
                                     self.tx_byte_int[dpid][port_no])
-        # Only update group table on leaves
-        if dpid in [201, 202]:
-            total_bw = sum(port_bw.values())
-            if total_bw > 0:
-                port_weights = {p: int((bw / total_bw) * 100) for p, bw in port_bw.items()}
-            else:
-                port_weights = {p: 50 for p in port_bw}  # fallback
-            datapath = ev.msg.datapath
-            self.send_group_mod(datapath, port_weights=port_weights)
\ No newline at end of file
+        # Only update group table on leaves: uplink weights follow residual
+        # bandwidth, shifts below WCMP_MIN_DELTA are not worth a GroupMod
+        if dpid in self.uplink_groups:
+            tx_bytes = self.tx_byte_int[dpid]
+            capacity = {port: self.UPLINK_CAPACITY_BPS for port in self.UPLINK_PORTS}
+            used = {port: tx_bytes.get(port, 0) * 8.0 / self.sleep for port in self.UPLINK_PORTS}
+            port_weights = self.wcmp.update(dpid, capacity, used)
+            if port_weights is not None:
+                self.send_group_mod(ev.msg.datapath, port_weights=port_weights)
+                self.logger.info("Group ID %d on switch %d re-weighted: %s",
+                                 self.UPLINK_GROUP_ID, dpid, port_weights)
\ No newline at end of file
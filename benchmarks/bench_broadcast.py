@@ -0,0 +1,194 @@
+"""
+Broadcast duplication: OFPP_FLOOD on every switch vs flooding along the spanning tree.
+
+Run from the repository root:  python -m benchmarks.bench_broadcast --spines 4 --leaves 16
+
+Ethernet frames carry no TTL, so with OFPP_FLOOD a single broadcast circulates
+around every leaf-spine-leaf cycle forever. The simulation follows it for
+``--max-hops`` switch hops and counts every copy a switch or host receives
+beyond the first as a duplicate.
+
+``bring-up`` replays a fabric coming up: switches connect ``--join-interval``
+seconds apart, and LLDP reports each link ``--lldp-delay`` seconds after both
+ends are connected. Halfway through, one leaf-spine cable is unplugged and
+plugged straight back in, and discovery takes ``--lldp-delay`` to see it
+again. Every ``--sample`` seconds of that timeline one broadcast per host is
+followed over the physical wiring with the flood ports the tree would have
+installed at that moment (switches that are not connected yet drop it).
+The run is repeated with no settle time, where every port without a
+discovered link is flooded as a host port, and with ``--settle`` seconds.
+Counts are summed over the samples; hosts stay unreached while their
+ports settle.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, Tuple
+
+from benchmarks.fabric import StandInFabric
+from ecmp.broadcast_tree import BroadcastTree
+from ecmp.topology import Topology
+
+
+def build_topology(fabric: StandInFabric) -> Topology:
+    topology = Topology()
+    for dpid in fabric.switches:
+        ports = [port for src, port, _, _ in fabric.links if src == dpid]
+        ports += [port for _, (leaf, port, _) in fabric.hosts.items() if leaf == dpid]
+        topology.add_switch(dpid, ports)
+    for src, src_port, dst, _ in fabric.links:
+        topology.add_link(src, dst, src_port)
+    return topology
+
+
+def flood(fabric: StandInFabric, out_ports: Callable[[int], Tuple[int, ...]],
+          max_hops: int) -> Dict[str, int]:
+    """Frames received per switch and host for one broadcast from every host."""
+    wiring = {(src, src_port): (dst, dst_port) for src, src_port, dst, dst_port in fabric.links}
+    host_at = {(leaf, port): mac for mac, (leaf, port, _) in fabric.hosts.items()}
+    totals = Counter()
+    for sender, (leaf, port, _) in fabric.hosts.items():
+        # Copies in flight, aggregated by (switch, ingress port)
+        frames = Counter({(leaf, port): 1})
+        switch_rx, host_rx = Counter(), Counter()
+        for _ in range(max_hops):
+            if not frames:
+                break
+            nxt = Counter()
+            for (dpid, in_port), copies in frames.items():
+                switch_rx[dpid] += copies
+                for out in out_ports(dpid):
+                    if out == in_port:
+                        continue
+                    if (dpid, out) in wiring:
+                        nxt[wiring[(dpid, out)]] += copies
+                    elif (dpid, out) in host_at:
+                        host_rx[host_at[(dpid, out)]] += copies
+            frames = nxt
+        totals["switch_frames"] += sum(switch_rx.values())
+        totals["host_frames"] += sum(host_rx.values())
+        # Any copy looping back to the sender is a duplicate as well
+        totals["duplicates"] += host_rx.pop(sender, 0)
+        totals["duplicates"] += sum(switch_rx.values()) - len(switch_rx)
+        totals["duplicates"] += sum(host_rx.values()) - len(host_rx)
+        totals["unreached_hosts"] += len(fabric.hosts) - 1 - len(host_rx)
+        totals["still_circulating"] += sum(frames.values())
+    return dict(totals)
+
+
+def link_flaps(topology: Topology, fabric: StandInFabric, events: int, seed: int = 7) -> Dict[str, float]:
+    """Per-event cost of keeping the tree current, incrementally vs rebuilding it."""
+    rng = random.Random(seed)
+    flaps = [rng.choice(fabric.links) for _ in range(events)]
+    tree = BroadcastTree(topology)
+    topology.subscribe(tree)
+    start = time.perf_counter()
+    touched = 0
+    for src, src_port, dst, _ in flaps:
+        topology.remove_link(src, dst)
+        touched += len(tree.take_changed())
+        topology.add_link(src, dst, src_port)
+        touched += len(tree.take_changed())
+    incremental = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for src, src_port, dst, _ in flaps:
+        topology.remove_link(src, dst)
+        BroadcastTree(topology)
+        topology.add_link(src, dst, src_port)
+        BroadcastTree(topology)
+    rebuild = time.perf_counter() - start
+    return {"incremental_us": round(incremental / (2 * events) * 1e6, 1),
+            "rebuild_us": round(rebuild / (2 * events) * 1e6, 1),
+            "switches_reprogrammed_per_event": round(touched / (2 * events), 2),
+            "switches": len(fabric.switches)}
+
+
+def bring_up(fabric: StandInFabric, settle: float, args) -> Dict[str, int]:
+    """Broadcast duplicates summed over the samples of a bring-up and one re-plugged link."""
+    now = 0.0
+    topology = Topology()
+    tree = BroadcastTree(topology, settle=settle, clock=lambda: now)
+    topology.subscribe(tree)
+    ports = {dpid: [port for src, port, _, _ in fabric.links if src == dpid] +
+             [port for _, (leaf, port, _) in fabric.hosts.items() if leaf == dpid] for dpid in fabric.switches}
+
+    joined = {dpid: i * args.join_interval for i, dpid in enumerate(fabric.switches)}
+    timeline = [(at, 0, ("switch", dpid)) for dpid, at in joined.items()]
+    timeline += [(max(joined[src], joined[dst]) + args.lldp_delay, 1, ("add", src, src_port, dst, dst_port))
+                 for src, src_port, dst, dst_port in fabric.links]
+    discovered = max(at for at, _, _ in timeline)
+    # A leaf-spine cable re-plugged once the fabric is up: both directions
+    # time out together and are rediscovered lldp_delay later
+    replug = discovered + args.settle + args.sample
+    leaf, spine = fabric.leaf_dpid(0), fabric.spine_dpid(0)
+    cable = [link for link in fabric.links if {link[0], link[2]} == {leaf, spine}]
+    timeline += [(replug, 2, ("remove",) + link) for link in cable]
+    timeline += [(replug + args.lldp_delay, 3, ("add",) + link) for link in cable]
+    timeline.sort(key=lambda item: (item[0], item[1]))
+    end = replug + args.lldp_delay + args.settle + args.sample
+
+    def out_ports(dpid):
+        return flood_ports.get(dpid, ())
+
+    totals = Counter()
+    pending = 0
+    samples = 0
+    while now <= end:
+        while pending < len(timeline) and timeline[pending][0] <= now:
+            event = timeline[pending][2]
+            if event[0] == "switch":
+                topology.add_switch(event[1], ports[event[1]])
+            elif event[0] == "add":
+                topology.add_link(event[1], event[3], event[2], dst_port=event[4])
+            else:
+                topology.remove_link(event[1], event[3])
+            pending += 1
+        tree.take_changed()
+        flood_ports = {dpid: tree.flood_ports(dpid) for dpid in topology.graph}
+        result = flood(fabric, out_ports, args.max_hops)
+        totals["duplicates"] += result.get("duplicates", 0)
+        totals["still_circulating"] += result.get("still_circulating", 0)
+        totals["unreached_hosts"] += result.get("unreached_hosts", 0)
+        samples += 1
+        now += args.sample
+    return {"samples": samples, **totals, "unreached_at_end": result.get("unreached_hosts", 0)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spines", type=int, default=4)
+    parser.add_argument("--leaves", type=int, default=16)
+    parser.add_argument("--hosts-per-leaf", type=int, default=2)
+    parser.add_argument("--max-hops", type=int, default=6)
+    parser.add_argument("--flaps", type=int, default=500)
+    parser.add_argument("--join-interval", type=float, default=0.2)
+    parser.add_argument("--lldp-delay", type=float, default=2.0)
+    parser.add_argument("--settle", type=float, default=5.0)
+    parser.add_argument("--sample", type=float, default=0.5)
+    args = parser.parse_args()
+
+    fabric = StandInFabric(spines=args.spines, leaves=args.leaves, hosts_per_leaf=args.hosts_per_leaf)
+    topology = build_topology(fabric)
+    tree = BroadcastTree(topology)
+    all_ports: Dict[int, Tuple[int, ...]] = {
+        dpid: tuple(sorted(topology.edge_ports(dpid) +
+                           [attrs["port"] for attrs in topology.graph[dpid].values()]))
+        for dpid in fabric.switches}
+
+    print(f"fabric: {args.spines} spines x {args.leaves} leaves, {len(fabric.hosts)} hosts, "
+          f"one broadcast per host, followed for {args.max_hops} hops")
+    for name, ports in (("OFPP_FLOOD", all_ports.__getitem__),
+                        ("spanning tree", tree.flood_ports)):
+        print(f"{name:>14}: {flood(fabric, ports, args.max_hops)}")
+    print(f"{'link flap':>14}: {link_flaps(topology, fabric, args.flaps)}")
+    for settle in (0.0, args.settle):
+        print(f"{f'bring-up {settle:g}s':>14}: {bring_up(fabric, settle, args)}")
+
+
+if __name__ == "__main__":
+    main()
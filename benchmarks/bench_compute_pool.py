@@ -0,0 +1,95 @@
+"""
+Hub responsiveness while all-pairs paths are recomputed: inline vs on the compute pool.
+
+Run from the repository root:  python -m benchmarks.bench_compute_pool --k 12 --rounds 5
+
+The "hub" is the main thread handling a stand-in event every ``--tick-ms``
+(the work of a port stats reply). Every ``--interval-ms`` the topology
+changes and the equal-cost paths between all edge switches of a k-ary fat-tree are
+recomputed, either inside the hub loop, as ``PathCache.sync`` does without
+a pool, or as a ``ComputePool`` job (paths and their edge index) that
+``drain()`` hands to ``PathCache.adopt``.
+Event latency is how late each event is handled relative to its schedule.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import networkx as nx
+
+from benchmarks.fabric import fat_tree
+from ecmp.compute_pool import ComputePool, HandlerMetrics
+from ecmp.path_cache import PathCache, all_pairs_paths, path_table
+
+
+def run(graph: nx.DiGraph, nodes, rounds: int, tick: float, interval: float, pool: bool) -> dict:
+    metrics = HandlerMetrics()
+    compute = ComputePool(workers=1, max_pending=4, metrics=metrics) if pool else None
+    cache = PathCache(graph)
+    snapshot = nx.freeze(graph.copy())
+    loaded = []
+
+    def load(entries):
+        cache.clear()
+        cache.load(entries)
+        loaded.append(len(cache))
+
+    def adopt(table):
+        cache.adopt(table, len(loaded))
+        loaded.append(len(cache))
+
+    start = time.perf_counter()
+    due, change = start, start
+    changes = 0
+    while len(loaded) < rounds:
+        now = time.perf_counter()
+        if changes < rounds and now >= change:
+            # Topology changed: recompute the equal-cost paths
+            changes += 1
+            change += interval
+            if compute is None:
+                load(all_pairs_paths(graph, nodes))
+            else:
+                compute.submit(path_table, (snapshot, nodes), on_done=adopt, kind="warm")
+            continue
+        if now < due:
+            time.sleep(min(due, change) - now if changes < rounds else due - now)
+            continue
+        metrics.record("event_lateness", now - due)
+        due += tick
+        sum(range(200))  # stand-in event work
+        if compute is not None:
+            compute.drain()
+    elapsed = time.perf_counter() - start
+    if compute is not None:
+        compute.shutdown()
+    summary = metrics.summary()
+    lateness = summary["event_lateness"]
+    result = {"seconds": round(elapsed, 2), "events": lateness["count"],
+              "late_p50_ms": lateness["p50_ms"], "late_p99_ms": lateness["p99_ms"],
+              "late_max_ms": lateness["max_ms"], "pairs": loaded[-1]}
+    if pool:
+        result["warm_compute_ms"] = summary["warm.compute"]["mean_ms"]
+        result["warm_apply_wait_ms"] = summary["warm.apply_wait"]["mean_ms"]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--k", type=int, default=12, help="fat-tree arity")
+    parser.add_argument("--rounds", type=int, default=5, help="topology changes to recompute")
+    parser.add_argument("--tick-ms", type=float, default=5.0, help="time between hub events")
+    parser.add_argument("--interval-ms", type=float, default=1000.0, help="time between topology changes")
+    args = parser.parse_args()
+
+    graph, edges = fat_tree(args.k)
+    print(f"fat-tree k={args.k}: {graph.number_of_nodes()} switches, {len(edges)} edge switches, "
+          f"{args.rounds} recomputations {args.interval_ms} ms apart, one event every {args.tick_ms} ms")
+    for name, pool in (("inline", False), ("pool", True)):
+        print(f"{name:>7}: {run(graph, edges, args.rounds, args.tick_ms / 1e3, args.interval_ms / 1e3, pool)}")
+
+
+if __name__ == "__main__":
+    main()
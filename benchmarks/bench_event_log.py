@@ -0,0 +1,106 @@
+"""
+Packet-in handler throughput with per-packet logging off, through the logging module, and through the event log.
+
+Run from the repository root:  python -m benchmarks.bench_event_log --packets 200000
+
+The stand-in handler parses each frame with the fast parser and learns the
+source host, then logs what ``dynamic_ecmp`` used to log per packet: the
+packet-in, the selected path and the flow being programmed. ``logging``
+formats three ``logger.info`` lines into a file as Ryu's default handler
+does (to stderr). ``event log`` emits the same three events through
+``ecmp.event_log.EventLog`` into a file, first keeping every record, then
+with the controller's sampling (1 in ``--sample`` packet-ins) and
+``--rate`` records/s per type. The writer thread runs during the timing,
+so its share of the GIL is included. ``written`` counts the lines that
+reached the file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.bench_parse import make_frames
+from ecmp.event_log import EventLog
+from ecmp.fast_parse import parse_headers
+from ecmp.host_table import HostTable
+
+FIELDS = {
+    "pktin": ("sw", "in_port", "src", "dst"),
+    "path": ("mode", "path"),
+    "flow": ("path", "src", "dst", "ports"),
+}
+
+
+def handler(hosts: HostTable, log):
+    def handle(i: int, data: bytes) -> None:
+        eth, arp_pkt, ip_pkt = parse_headers(data)
+        dpid, in_port = 1 + i % 16, 3
+        hosts.learn(eth.src, dpid, in_port)
+        log(dpid, in_port, eth.src, eth.dst, [dpid, 100 + i % 4, 1 + (i + 1) % 16])
+    return handle
+
+
+def run(frames, log) -> float:
+    handle = handler(HostTable(), log)
+    start = time.perf_counter()
+    for i, data in enumerate(frames):
+        handle(i, data)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--packets", type=int, default=200000)
+    parser.add_argument("--sample", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=200.0)
+    args = parser.parse_args()
+
+    frames = make_frames(args.packets)
+    directory = tempfile.mkdtemp()
+
+    def lines(path: str) -> int:
+        with open(path, encoding="utf-8") as f:
+            return sum(1 for _ in f)
+
+    base = run(frames, lambda *fields: None)
+    print(f"{'off':>20}: {base:10,.0f} pkts/s")
+
+    path = os.path.join(directory, "logging.log")
+    logger = logging.getLogger("bench_event_log")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(file_handler)
+
+    def with_logging(dpid, in_port, src, dst, path_):
+        logger.info("[PKTIN] sw=%s in_port=%s src=%s dst=%s", dpid, in_port, src, dst)
+        logger.info("[PATH] Traditional ECMP selected: %s", path_)
+        logger.info("[FLOW] Programming %s: %s → %s via ports %s", path_, src, dst, [2, 3])
+
+    rate = run(frames, with_logging)
+    file_handler.close()
+    print(f"{'logging':>20}: {rate:10,.0f} pkts/s  ({base / rate:.2f}x slower), written {lines(path):,}")
+
+    for name, sample, limit in (("event log, all", {}, None),
+                                ("event log, sampled", {"pktin": args.sample}, args.rate)):
+        path = os.path.join(directory, name.replace(", ", "_").replace(" ", "_") + ".jsonl")
+        events = EventLog(path, FIELDS, sample, default_rate=limit)
+
+        def with_events(dpid, in_port, src, dst, path_, emit=events.emit):
+            emit("pktin", dpid, in_port, src, dst)
+            emit("path", "traditional", path_)
+            emit("flow", path_, src, dst, [2, 3])
+
+        rate = run(frames, with_events)
+        events.close()
+        print(f"{name:>20}: {rate:10,.0f} pkts/s  ({base / rate:.2f}x slower), written {lines(path):,}, "
+              f"dropped {events.stats()['dropped']:,}")
+
+
+if __name__ == "__main__":
+    main()
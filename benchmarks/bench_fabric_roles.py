@@ -0,0 +1,105 @@
+"""
+Leaf/spine role inference and per-leaf uplink groups while a fabric comes up and loses a spine.
+
+Run from the repository root:  python -m benchmarks.bench_fabric_roles --fabrics 2x2 4x16 16x96
+
+Switches join one by one and links are reported as soon as both ends are
+connected, as with ``ryu-manager --observe-links``. After every event the
+controller asks ``ecmp.fabric_roles.FabricRoles`` for the leaves whose
+uplink group has to be (re)sent. ``misclassified`` counts switches that
+were ever given the wrong role, ``adds``/``modifies`` the select group
+programs sent during bring-up and after the first spine fails, and
+``correct`` checks the final roles, uplinks and host ports against the
+wiring. ``lookup_ns`` is the per-packet-in cost of the host port and
+group id lookups.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from benchmarks.fabric import StandInFabric
+from ecmp.fabric_roles import LEAF, SPINE, FabricRoles
+from ecmp.topology import Topology
+
+
+def expected_roles(fabric: StandInFabric) -> dict:
+    leaves = set(fabric.leaf_dpids)
+    return {dpid: LEAF if dpid in leaves else SPINE for dpid in fabric.switches}
+
+
+def run(fabric: StandInFabric, lookups: int) -> dict:
+    topology = Topology()
+    roles = FabricRoles(topology)
+    expected = expected_roles(fabric)
+    wrong, adds, modifies, groups = set(), 0, 0, {}
+
+    def settle():
+        nonlocal adds, modifies
+        for dpid in topology.graph:
+            role = roles.role(dpid)
+            if role is not None and role != expected[dpid]:
+                wrong.add(dpid)
+        for dpid, group in roles.take_changed().items():
+            if group.previous:
+                modifies += 1
+            else:
+                adds += 1
+            groups[dpid] = group
+
+    start = time.perf_counter()
+    events = 0
+    for event in fabric.bring_up():
+        if event[0] == "switch":
+            topology.add_switch(event[1], fabric.ports(event[1]))
+        else:
+            topology.add_link(event[1], event[3], event[2], dst_port=event[4])
+        settle()
+        events += 1
+    bring_up_s = time.perf_counter() - start
+    up = {"adds": adds, "modifies": modifies}
+
+    correct = all(roles.role(dpid) == role for dpid, role in expected.items())
+    for leaf in fabric.leaf_dpids:
+        correct &= roles.uplinks(leaf) == tuple(range(1, fabric.spines + 1))
+        correct &= roles.host_ports(leaf) == tuple(range(fabric.spines + 1, fabric.spines + fabric.hosts_per_leaf + 1))
+        correct &= groups[leaf].ports == roles.uplinks(leaf)
+    correct &= len({group.group_id for group in groups.values()}) == fabric.leaves
+
+    adds = modifies = 0
+    failed = fabric.spine_dpid(0)
+    topology.remove_switch(failed)
+    settle()
+    if fabric.spines > 1:
+        correct &= all(groups[leaf].ports == tuple(range(2, fabric.spines + 1)) for leaf in fabric.leaf_dpids)
+
+    host_port = fabric.spines + 1
+    leaf = fabric.leaf_dpids[-1]
+    start = time.perf_counter()
+    for _ in range(lookups):
+        if roles.is_host_port(leaf, host_port):
+            roles.group_id(leaf)
+    lookup_ns = (time.perf_counter() - start) / lookups * 1e9
+
+    return {"switches": len(expected), "events": events, "misclassified": len(wrong),
+            "bring_up": up, "spine_failure": {"adds": adds, "modifies": modifies},
+            "correct": bool(correct), "us_per_event": round(bring_up_s / events * 1e6, 1),
+            "lookup_ns": round(lookup_ns)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fabrics", nargs="+", default=["2x2", "4x16", "16x96"], help="SPINESxLEAVES")
+    parser.add_argument("--hosts-per-leaf", type=int, default=2)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    for spec in args.fabrics:
+        spines, leaves = (int(n) for n in spec.split("x"))
+        fabric = StandInFabric(spines=spines, leaves=leaves, hosts_per_leaf=args.hosts_per_leaf)
+        print(f"{spines} spines x {leaves} leaves: {run(fabric, args.lookups)}")
+
+
+if __name__ == "__main__":
+    main()
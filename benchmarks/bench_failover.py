@@ -0,0 +1,169 @@
+"""
+Black-holed packets on a leaf uplink failure, per uplink group style.
+
+Run from the repository root:  python -m benchmarks.bench_failover --uplinks 2 --pps 100000
+
+A stand-in switch receives the exact GroupMods ``ecmp.failover`` builds
+(through a minimal parser that records them) and forwards packets of many
+flows through the select group. At ``t=0`` one uplink goes down. The switch
+notices after ``--carrier-ms`` (loss of carrier); the controller notices
+after ``--controller-ms`` (the adaptive apps only see it in the next port
+stats reply) and re-sends the group without the dead uplink. Every packet
+hashed onto the dead uplink before one of those happens is black-holed.
+``survivors_moved`` is the fraction of flows on healthy uplinks that the
+switch moves anyway when it drops the dead bucket (reordering risk).
+"""
+
+from __future__ import annotations
+
+import argparse
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+
+from ecmp.failover import MODES, uplink_group_mods
+from ecmp.flow_hash import fmix32
+
+OFPP_ANY = 0xFFFFFFFF
+OFPG_ANY = 0xFFFFFFFF
+
+
+def _record(kind: str):
+    def build(*args, **kwargs):
+        return SimpleNamespace(kind=kind, args=args, **kwargs)
+    return build
+
+
+class _Parser:
+    OFPActionOutput = staticmethod(lambda port: SimpleNamespace(kind="output", port=port))
+    OFPActionGroup = staticmethod(lambda group_id: SimpleNamespace(kind="group", group_id=group_id))
+    OFPActionSetQueue = staticmethod(lambda queue_id: SimpleNamespace(kind="queue", queue_id=queue_id))
+    OFPBucket = staticmethod(_record("bucket"))
+
+    @staticmethod
+    def OFPGroupMod(datapath, command, type_, group_id, buckets):
+        return SimpleNamespace(kind="group_mod", command=command, type=type_,
+                               group_id=group_id, buckets=buckets)
+
+
+class StandInSwitch:
+    """Applies OpenFlow 1.3 GroupMods and forwards packets through the group table.
+
+    A bucket is live unless it watches a port the switch knows is down (or a
+    group with no live bucket). Select groups hash over live buckets by
+    weight; fast-failover groups use their first live bucket.
+    """
+
+    ofproto = SimpleNamespace(OFPGC_ADD=0, OFPGC_MODIFY=1, OFPGC_DELETE=2,
+                              OFPGT_ALL=0, OFPGT_SELECT=1, OFPGT_INDIRECT=2, OFPGT_FF=3,
+                              OFPP_ANY=OFPP_ANY, OFPG_ANY=OFPG_ANY)
+    ofproto_parser = _Parser
+
+    def __init__(self, dpid: int = 1) -> None:
+        self.id = dpid
+        self.groups: Dict[int, SimpleNamespace] = {}
+        self.down: set = set()  # ports the switch has detected as down
+        self.errors: List[str] = []
+
+    def send_msg(self, msg) -> None:
+        if msg.command == self.ofproto.OFPGC_DELETE:
+            self.groups.pop(msg.group_id, None)
+            return
+        if msg.command == self.ofproto.OFPGC_ADD and msg.group_id in self.groups:
+            self.errors.append(f"group {msg.group_id} exists")
+        elif msg.command == self.ofproto.OFPGC_MODIFY and msg.group_id not in self.groups:
+            self.errors.append(f"group {msg.group_id} unknown")
+        self.groups[msg.group_id] = msg
+
+    def _live(self, bucket) -> bool:
+        if bucket.watch_port != OFPP_ANY and bucket.watch_port in self.down:
+            return False
+        if bucket.watch_group != OFPG_ANY:
+            return self._group_live(bucket.watch_group)
+        return True
+
+    def _group_live(self, group_id: int) -> bool:
+        return any(self._live(b) for b in self.groups[group_id].buckets)
+
+    def output(self, group_id: int, flow_hash: int) -> Optional[int]:
+        """Egress port for a flow sent to ``group_id``, or None if the group drops it."""
+        group = self.groups[group_id]
+        live = [b for b in group.buckets if self._live(b)]
+        if not live:
+            return None
+        if group.type == self.ofproto.OFPGT_FF:
+            bucket = live[0]
+        else:
+            total = sum(getattr(b, "weight", 1) for b in live)
+            point = flow_hash % total if total else 0
+            for bucket in live:
+                point -= getattr(bucket, "weight", 1)
+                if point < 0:
+                    break
+        for action in bucket.actions:
+            if action.kind == "output":
+                return action.port
+            if action.kind == "group":
+                return self.output(action.group_id, fmix32(flow_hash))
+        return None
+
+
+def _switch(mode: str, uplinks: Sequence[int], group_id: int) -> StandInSwitch:
+    switch = StandInSwitch()
+    for msg in uplink_group_mods(switch, group_id, uplinks, mode=mode):
+        switch.send_msg(msg)
+    return switch
+
+
+def simulate(mode: str, uplinks: Sequence[int], pps: int, flows: int,
+             carrier_ms: float, controller_ms: float, group_id: int = 50) -> Dict[str, float]:
+    switch = _switch(mode, uplinks, group_id)
+    failed = uplinks[0]
+    packets = int(pps * (max(carrier_ms, controller_ms) + 1.0) / 1000)
+    lost = 0
+    detected = reprogrammed = False
+    for i in range(packets):
+        t_ms = i * 1000.0 / pps
+        if not detected and t_ms >= carrier_ms:
+            switch.down.add(failed)
+            detected = True
+        if not reprogrammed and t_ms >= controller_ms:
+            for msg in uplink_group_mods(switch, group_id, [p for p in uplinks if p != failed],
+                                         mode=mode, add=False):
+                switch.send_msg(msg)
+            reprogrammed = True
+        if switch.output(group_id, fmix32(i % flows)) in (failed, None):
+            lost += 1
+    return {"black_holed": lost, "sent": packets, "outage_ms": round(lost * 1000.0 / pps, 3),
+            "errors": len(switch.errors)}
+
+
+def survivors_moved(mode: str, uplinks: Sequence[int], flows: int, group_id: int = 50) -> float:
+    """Fraction of flows not on the failed uplink that change uplink when the switch detects the failure."""
+    switch = _switch(mode, uplinks, group_id)
+    before = [switch.output(group_id, fmix32(f)) for f in range(flows)]
+    switch.down.add(uplinks[0])
+    after = [switch.output(group_id, fmix32(f)) for f in range(flows)]
+    survivors = [f for f in range(flows) if before[f] != uplinks[0]]
+    return round(sum(before[f] != after[f] for f in survivors) / max(len(survivors), 1), 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uplinks", type=int, default=2)
+    parser.add_argument("--pps", type=int, default=100000, help="packets per second through the leaf")
+    parser.add_argument("--flows", type=int, default=1000)
+    parser.add_argument("--carrier-ms", type=float, default=0.1)
+    parser.add_argument("--controller-ms", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    uplinks = list(range(1, args.uplinks + 1))
+    print(f"{args.uplinks} uplinks, {args.pps} pps over {args.flows} flows; uplink {uplinks[0]} fails at t=0, "
+          f"switch detects after {args.carrier_ms} ms, controller after {args.controller_ms} ms")
+    for mode in MODES:
+        stats = simulate(mode, uplinks, args.pps, args.flows, args.carrier_ms, args.controller_ms)
+        stats["survivors_moved"] = survivors_moved(mode, uplinks, args.flows)
+        print(f"{mode:>8}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Memory and speed of the installed-flow registry: one object per flow vs NumPy columns.
+
+Run from the repository root:  python -m benchmarks.bench_flow_registry --flows 100000 1000000
+
+Flows are (ingress leaf, src MAC, dst MAC) rule sets between random hosts
+of a stand-in leaf-spine fabric, each on one of the leaf-spine-leaf paths.
+Each MAC is a fresh string per flow, as it would be after parsing a packet.
+``objects`` is the previous registry layout: one dataclass per flow with
+its own switch set, dicts by cookie and by key, and a set of cookies per
+link. ``columns`` is ``ecmp.flow_registry.FlowRegistry``. Memory is what
+``tracemalloc`` sees allocated once all flows are registered.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import itertools
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from benchmarks.fabric import StandInFabric
+from ecmp.flow_registry import FlowRegistry
+
+
+@dataclass
+class _Flow:
+    cookie: int
+    key: Hashable
+    path: Tuple[int, ...]
+    priority: int
+    installed: float
+    switches: Set[int] = field(default_factory=set)
+    rerouted: Optional[float] = None
+
+
+class ObjectRegistry:
+    """The per-object layout the registry started with, reduced to what is measured."""
+
+    def __init__(self) -> None:
+        self._flows: Dict[int, _Flow] = {}
+        self._by_key: Dict[Hashable, int] = {}
+        self._by_link: Dict[Tuple[int, int], Set[int]] = {}
+        self._cookies = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def add(self, src: str, dst: str, path: Tuple[int, ...], priority: int = 0) -> _Flow:
+        flow = _Flow(next(self._cookies), (path[0], src, dst), path, priority, time.monotonic(), set(path))
+        self._flows[flow.cookie] = flow
+        self._by_key[flow.key] = flow.cookie
+        for link in zip(path, path[1:]):
+            self._by_link.setdefault(link, set()).add(flow.cookie)
+        return flow
+
+    def removed(self, dpid: int, cookie: int) -> Optional[_Flow]:
+        flow = self._flows.pop(cookie)
+        del self._by_key[flow.key]
+        for link in zip(flow.path, flow.path[1:]):
+            self._by_link[link].discard(cookie)
+        return flow
+
+    def affected(self, links) -> List[_Flow]:
+        cookies = set()
+        for link in links:
+            cookies.update(self._by_link.get(link, ()))
+        flows = [self._flows[cookie] for cookie in cookies]
+        flows.sort(key=lambda flow: (-flow.priority, flow.installed, flow.cookie))
+        return flows
+
+    def flows_at(self, dpid: int):
+        return (flow for flow in self._flows.values() if dpid in flow.switches)
+
+
+def workload(fabric: StandInFabric, count: int, seed: int = 1):
+    """``count`` distinct (src MAC, dst MAC, path) triples as columns."""
+    rng = np.random.default_rng(seed)
+    macs = list(fabric.hosts)
+    leaf_of = np.array([fabric.hosts[mac][0] for mac in macs])
+    pairs = rng.choice(len(macs) * len(macs), size=int(count * 1.2), replace=False)
+    src, dst = pairs // len(macs), pairs % len(macs)
+    keep = leaf_of[src] != leaf_of[dst]
+    src, dst = src[keep][:count], dst[keep][:count]
+    if len(src) < count:
+        raise SystemExit("not enough host pairs for %d flows; raise --hosts-per-leaf" % count)
+    spine = rng.integers(0, fabric.spines, count)
+    paths = {}
+    for s in range(fabric.spines):
+        for a in fabric.leaf_dpids:
+            for b in fabric.leaf_dpids:
+                paths[(s, a, b)] = (a, fabric.spine_dpid(s), b)
+    flows = [(macs[i], macs[j], paths[(int(s), int(leaf_of[i]), int(leaf_of[j]))])
+             for i, j, s in zip(src, dst, spine)]
+    return flows
+
+
+def measure(make, flows) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    registry = make()
+    cookies = []
+    for src, dst, path in flows:
+        # Fresh strings per flow, as parsed from packets
+        cookies.append(registry.add("".join(src), "".join(dst), path, 10).cookie)
+    insert = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cookie_bytes = sum(c.__sizeof__() for c in cookies) + cookies.__sizeof__()
+    memory = current - cookie_bytes
+
+    spine_link = flows[0][2][:2]
+    start = time.perf_counter()
+    affected = len(registry.affected([spine_link]))
+    affected_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    at_switch = sum(1 for _ in registry.flows_at(flows[0][2][1]))
+    flows_at_s = time.perf_counter() - start
+
+    doomed = cookies[::10]
+    start = time.perf_counter()
+    for (src, dst, path), cookie in zip(flows[::10], doomed):
+        registry.removed(path[0], cookie)
+    delete = time.perf_counter() - start
+
+    return {
+        "MB": round(memory / 2 ** 20, 1),
+        "bytes_per_flow": round(memory / len(flows)),
+        "insert_us": round(insert / len(flows) * 1e6, 2),
+        "delete_us": round(delete / len(doomed) * 1e6, 2),
+        "affected_ms": round(affected_s * 1e3, 1),
+        "affected": affected,
+        "flows_at_ms": round(flows_at_s * 1e3, 1),
+        "at_switch": at_switch,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--flows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--spines", type=int, default=4)
+    parser.add_argument("--leaves", type=int, default=32)
+    parser.add_argument("--hosts-per-leaf", type=int, default=40)
+    args = parser.parse_args()
+
+    fabric = StandInFabric(spines=args.spines, leaves=args.leaves, hosts_per_leaf=args.hosts_per_leaf)
+    print(f"{args.spines} spines, {args.leaves} leaves, {len(fabric.hosts)} hosts")
+    for count in args.flows:
+        flows = workload(fabric, count)
+        for name, make in (("objects", ObjectRegistry), ("columns", FlowRegistry)):
+            print(f"{count:>8} {name:>8}: {measure(make, flows)}")
+        del flows
+
+
+if __name__ == "__main__":
+    main()
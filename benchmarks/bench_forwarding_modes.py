@@ -0,0 +1,99 @@
+"""
+Flow-table size and packet-in count: (eth_src, eth_dst) pair rules vs destination rules.
+
+Every host opens a conversation to every other host, in random order, on a
+generated leaf-spine fabric. Run from the repository root:
+
+    python -m benchmarks.bench_forwarding_modes --hosts 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+from collections import defaultdict
+
+from benchmarks.fabric import StandInFabric
+from ecmp.dst_forwarding import DestinationForwarding
+from ecmp.path_cache import PathCache
+from ecmp.topology import Topology
+
+
+def build_topology(fabric: StandInFabric) -> Topology:
+    topology = Topology()
+    for dpid in fabric.switches:
+        topology.add_switch(dpid)
+    for src, src_port, dst, _ in fabric.links:
+        topology.add_link(src, dst, src_port)
+    return topology
+
+
+def run_pair_mode(fabric: StandInFabric, topology: Topology, flows, rng) -> dict:
+    cache = PathCache(topology.graph)
+    tables = defaultdict(set)
+    packet_ins = 0
+    for src_mac, dst_mac in flows:
+        src_dpid, _, _ = fabric.hosts[src_mac]
+        dst_dpid, _, _ = fabric.hosts[dst_mac]
+        if (src_mac, dst_mac) in tables[src_dpid]:
+            continue
+        packet_ins += 1
+        path = (src_dpid,) if src_dpid == dst_dpid else rng.choice(cache.get(src_dpid, dst_dpid))
+        for sw in path:
+            tables[sw].add((src_mac, dst_mac))
+    return {"packet_ins": packet_ins, "flows": sum(len(t) for t in tables.values()),
+            "max_flows": max(len(t) for t in tables.values()), "groups": 0}
+
+
+def run_destination_mode(fabric: StandInFabric, topology: Topology, flows, prefixes: bool) -> dict:
+    leaf_prefixes = {fabric.leaf_dpid(l): fabric.leaf_prefix(l) for l in range(fabric.leaves)} \
+        if prefixes else None
+    planner = DestinationForwarding(topology, match_on="ipv4_dst", leaf_prefixes=leaf_prefixes)
+    packet_ins = 0
+    for src_mac, dst_mac in flows:
+        src_dpid, _, _ = fabric.hosts[src_mac]
+        dst_dpid, dst_port, dst_ip = fabric.hosts[dst_mac]
+        if src_dpid == dst_dpid:
+            key = planner.host_match(dst_mac, dst_ip)
+        else:
+            key = planner.transit_match(dst_mac, dst_ip, dst_dpid)
+        if planner.is_installed(src_dpid, key):
+            continue
+        packet_ins += 1
+        planner.plan(dst_mac, dst_ip, dst_dpid, dst_port, force=(src_dpid,))
+    sizes = planner.table_sizes().values()
+    return {"packet_ins": packet_ins, "flows": sum(f for f, _ in sizes),
+            "max_flows": max(f for f, _ in sizes), "groups": sum(g for _, g in sizes)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--hosts-per-leaf", type=int, default=10)
+    parser.add_argument("--spines", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    leaves = -(-args.hosts // args.hosts_per_leaf)
+    fabric = StandInFabric(spines=args.spines, leaves=leaves, hosts_per_leaf=args.hosts_per_leaf)
+    topology = build_topology(fabric)
+    rng = random.Random(args.seed)
+    macs = list(fabric.hosts)[:args.hosts]
+    flows = [(s, d) for s in macs for d in macs if s != d]
+    rng.shuffle(flows)
+
+    print(f"{len(macs)} hosts on {args.spines} spines x {leaves} leaves, {len(flows)} new conversations")
+    print(f"{'mode':>22} {'packet-ins':>11} {'per 1k conv':>12} {'flow entries':>13} "
+          f"{'max/switch':>11} {'groups':>7}")
+    results = [
+        ("pair (src, dst)", run_pair_mode(fabric, topology, flows, rng)),
+        ("destination /32", run_destination_mode(fabric, topology, flows, prefixes=False)),
+        ("destination + prefix", run_destination_mode(fabric, topology, flows, prefixes=True)),
+    ]
+    for name, r in results:
+        print(f"{name:>22} {r['packet_ins']:>11} {1000 * r['packet_ins'] / len(flows):>12.1f} "
+              f"{r['flows']:>13} {r['max_flows']:>11} {r['groups']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Per-pair path computation time on a 3-tier fat-tree: equal-cost paths vs Yen's k shortest paths.
+
+Run from the repository root:  python -m benchmarks.bench_k_paths --k 8 12 --pairs 200
+
+For random pairs of edge switches (a quarter of them inside one pod), each
+row computes the pair's candidate paths: ``ecmp`` is the equal-cost set the
+path cache holds, ``yen+N`` is ``ecmp.k_paths.unequal_cost_paths`` (every
+shortest path plus up to ``N`` longer ones within ``--stretch``),
+``networkx+N`` takes as many paths from ``nx.shortest_simple_paths`` (Yen's
+without a stretch bound) and ``cached+N`` is a ``KPathCache`` lookup once
+the topology version has been seen.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import random
+import time
+
+import networkx as nx
+
+from benchmarks.fabric import fat_tree
+from ecmp.compute_pool import LatencyStats
+from ecmp.k_paths import KPathCache, unequal_cost_paths
+from ecmp.path_cache import shortest_paths
+
+
+class _Topology:
+    def __init__(self, graph: nx.DiGraph) -> None:
+        self.graph = graph
+        self.version = 1
+
+
+def sample_pairs(edges, k: int, count: int, seed: int = 1):
+    rng = random.Random(seed)
+    per_pod = k // 2
+    pairs = []
+    while len(pairs) < count:
+        a = rng.choice(edges)
+        if len(pairs) % 4 == 0:
+            pod = edges.index(a) // per_pod
+            b = rng.choice(edges[pod * per_pod:(pod + 1) * per_pod])
+        else:
+            b = rng.choice(edges)
+        if a != b:
+            pairs.append((a, b))
+    return pairs
+
+
+def measure(name: str, compute, pairs) -> None:
+    stats = LatencyStats(len(pairs))
+    counts, longest = 0, 0
+    for src, dst in pairs:
+        start = time.perf_counter()
+        paths = compute(src, dst)
+        stats.add(time.perf_counter() - start)
+        counts += len(paths)
+        longest = max(longest, max(len(path) - 1 for path in paths))
+    summary = stats.summary()
+    print(f"  {name:>12}: mean {summary['mean_ms']:7.3f} ms  p99 {summary['p99_ms']:7.3f} ms  "
+          f"{counts / len(pairs):5.1f} paths/pair  longest {longest} hops")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--k", type=int, nargs="+", default=[8, 12], help="fat-tree arities")
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--extra", type=int, nargs="+", default=[4, 16], help="longer paths per pair")
+    parser.add_argument("--stretch", type=float, default=2.0, help="longest path over the shortest, in hops")
+    args = parser.parse_args()
+
+    for k in args.k:
+        graph, edges = fat_tree(k)
+        pairs = sample_pairs(edges, k, args.pairs)
+        print(f"fat-tree k={k}: {graph.number_of_nodes()} switches, {graph.number_of_edges()} links, "
+              f"{len(pairs)} edge switch pairs")
+        measure("ecmp", lambda s, d: shortest_paths(graph, s, d), pairs)
+        for extra in args.extra:
+            measure(f"yen+{extra}", lambda s, d: unequal_cost_paths(graph, s, d, extra, args.stretch), pairs)
+
+            def reference(s, d, extra=extra):
+                wanted = len(shortest_paths(graph, s, d)) + extra
+                return [tuple(p) for p in itertools.islice(nx.shortest_simple_paths(graph, s, d), wanted)]
+
+            measure(f"networkx+{extra}", reference, pairs)
+            cache = KPathCache(_Topology(graph), extra, args.stretch)
+            for src, dst in pairs:
+                cache.get(src, dst)
+            measure(f"cached+{extra}", cache.get, pairs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Packet-in header parsing throughput: in-place fast parser vs Ryu's packet library.
+
+Run from the repository root:  python -m benchmarks.bench_parse --packets 200000
+
+Each parser decodes the frame and reads the fields the ECMP apps use
+(Ethernet src/dst, ARP sender/target or IPv4 src/dst). Single thread, so the
+rate is packets per second per core. The Ryu row is skipped when Ryu is not
+installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import socket
+import struct
+import time
+
+from ecmp.fast_parse import parse_fast, parse_ryu
+
+
+def _mac(rng: random.Random) -> bytes:
+    return bytes([rng.randrange(256) & 0xFE]) + bytes(rng.randrange(256) for _ in range(5))
+
+
+def make_frames(count: int, seed: int = 1) -> list:
+    """A packet-in mix: TCP and UDP over IPv4 (some VLAN tagged) and ARP requests."""
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        dst, src = _mac(rng), _mac(rng)
+        ip_src = socket.inet_aton("10.0.%d.%d" % (rng.randrange(256), rng.randrange(1, 255)))
+        ip_dst = socket.inet_aton("10.1.%d.%d" % (rng.randrange(256), rng.randrange(1, 255)))
+        kind = rng.random()
+        if kind < 0.1:
+            arp = struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 1, src, ip_src, bytes(6), ip_dst)
+            frames.append(b"\xff" * 6 + src + struct.pack("!H", 0x0806) + arp + bytes(18))
+            continue
+        proto = 6 if kind < 0.7 else 17
+        l4 = struct.pack("!HH", rng.randrange(1024, 65535), rng.choice((80, 443, 5001)))
+        l4 += bytes(16 if proto == 6 else 4)
+        ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(l4) + 64, rng.randrange(65536), 0x4000,
+                         64, proto, 0, ip_src, ip_dst)
+        eth = dst + src
+        if kind > 0.95:
+            eth += struct.pack("!HH", 0x8100, rng.randrange(1, 4095))
+        frames.append(eth + struct.pack("!H", 0x0800) + ip + l4 + bytes(64))
+    return frames
+
+
+def touch(headers) -> None:
+    eth, arp, ip = headers
+    eth.src, eth.dst
+    if arp is not None:
+        arp.src_ip, arp.src_mac, arp.dst_ip
+    elif ip is not None:
+        ip.src, ip.dst
+
+
+def rate(parse, frames, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in frames:
+            touch(parse(data))
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--packets", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_frames(args.packets)
+    fast = rate(parse_fast, frames, args.repeat)
+    print(f"{'fast parser':>12}: {fast:12,.0f} pkts/s")
+    try:
+        import ryu  # noqa: F401
+    except ImportError:
+        print(f"{'ryu':>12}: skipped (ryu not installed)")
+        return
+    # Ryu is two orders of magnitude slower; a tenth of the frames is plenty
+    slow = rate(parse_ryu, frames[:max(1, len(frames) // 10)], args.repeat)
+    print(f"{'ryu':>12}: {slow:12,.0f} pkts/s  ({fast / slow:.1f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
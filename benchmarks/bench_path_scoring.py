@@ -0,0 +1,70 @@
+"""
+Path scoring cost: per-hop dict walk vs incidence-matrix scoring on a fat-tree.
+
+Run from the repository root:  python -m benchmarks.bench_path_scoring --k 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import timeit
+
+from benchmarks.fabric import fat_tree
+from ecmp.link_load import LinkLoad
+from ecmp.path_cache import PathCache
+from ecmp.path_scoring import PathScorer
+
+
+class _StaticLoad(LinkLoad):
+    def __init__(self, values: dict) -> None:
+        super().__init__()
+        self.values = values
+
+    def utilization(self, dpid: int, port: int) -> float:
+        return self.values.get((dpid, port), 0.0)
+
+
+def score_loop(graph, load: _StaticLoad, paths) -> list:
+    # The pre-vectorization _get_best_path inner loop.
+    return [max(load.utilization(path[i], graph[path[i]][path[i + 1]]['port'])
+                for i in range(len(path) - 1)) for path in paths]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--k", type=int, default=16)
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--score", default="max")
+    args = parser.parse_args()
+
+    graph, edge_switches = fat_tree(args.k)
+    rng = random.Random(7)
+    load = _StaticLoad({(u, port): rng.random() for u, _, port in graph.edges(data="port")})
+    cache = PathCache(graph)
+    scorer = PathScorer(graph, load, score=args.score)
+
+    half = args.k // 2
+    pairs = []
+    while len(pairs) < args.pairs:
+        src, dst = rng.sample(edge_switches, 2)
+        if edge_switches.index(src) // half != edge_switches.index(dst) // half:
+            pairs.append((src, dst))
+    path_sets = [(src, dst, cache.get(src, dst)) for src, dst in pairs]
+    for src, dst, paths in path_sets:
+        scorer.compile(src, dst, paths)
+        if args.score == "max":
+            assert abs(max(score_loop(graph, load, paths)) - scorer.scores(src, dst, paths).max()) < 1e-9
+
+    n_paths = len(path_sets[0][2])
+    loop = min(timeit.repeat(lambda: [score_loop(graph, load, p) for _, _, p in path_sets],
+                             number=10, repeat=5)) / (10 * len(path_sets))
+    vector = min(timeit.repeat(lambda: [scorer.scores(s, d, p) for s, d, p in path_sets],
+                               number=10, repeat=5)) / (10 * len(path_sets))
+    print(f"fat-tree k={args.k}: {graph.number_of_nodes()} switches, {n_paths} paths per inter-pod pair")
+    print(f"  per-hop loop : {loop * 1e6:8.2f} us per pair")
+    print(f"  incidence    : {vector * 1e6:8.2f} us per pair ({args.score})")
+
+
+if __name__ == "__main__":
+    main()
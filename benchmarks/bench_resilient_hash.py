@@ -0,0 +1,139 @@
+"""
+Flows remapped per topology event: modulo hashing vs rendezvous vs a resilient bucket table.
+
+Run from the repository root:  python -m benchmarks.bench_resilient_hash --spines 8 --flows 20000
+
+The equal-cost paths between two leaves go through one spine each. A
+sequence of spine link failures and recoveries changes the path set; after
+every event each flow is re-selected and compared with its previous path.
+``minimum`` is the fraction that has to move: flows whose path disappeared,
+or the new path's fair share when one appears.
+
+The second table replays the same spine events as link removals and
+additions on a ``--leaves`` fabric, with the flows spread over random leaf
+pairs and installed the way ``traditional_ecmp`` installs them: selected
+from the path cache and recorded in ``ecmp.resilient_hash.InstalledPaths``.
+After each event the cache is re-synced and ``InstalledPaths.remap`` says
+which installed flows get their rules moved; the fraction is of all
+installed flows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+from typing import List, Tuple
+
+from benchmarks.fabric import StandInFabric
+from ecmp.flow_hash import FiveTuple, FlowHasher
+from ecmp.path_cache import PathCache
+from ecmp.resilient_hash import MODES, InstalledPaths, PathSelector
+from ecmp.topology import Topology
+
+Path = Tuple[int, ...]
+
+
+def make_flows(count: int, seed: int = 1) -> List[FiveTuple]:
+    rng = random.Random(seed)
+    return [FiveTuple("10.0.%d.%d" % (rng.randrange(256), rng.randrange(1, 255)),
+                      "10.1.%d.%d" % (rng.randrange(256), rng.randrange(1, 255)),
+                      rng.choice((6, 17)), rng.randrange(32768, 61000), rng.choice((80, 443, 5001)))
+            for _ in range(count)]
+
+
+def events(paths: List[Path]):
+    """(label, path set) after each event, starting from all paths up."""
+    up = list(paths)
+    yield "spine 1 down", [p for p in up if p != paths[0]]
+    yield "spine 1 up", up
+    yield "spine 2+3 down", [p for p in up if p not in paths[1:3]]
+    yield "spine 3 up", [p for p in up if p != paths[1]]
+    yield "spine 2 up", up
+
+
+def run(mode: str, flows: List[FiveTuple], paths: List[Path], ingress: int):
+    selector = PathSelector(FlowHasher(), mode)
+    current = [selector.select(paths, flow, ingress) for flow in flows]
+    live = set(paths)
+    for label, path_set in events(paths):
+        after = [selector.select(sorted(path_set), flow, ingress) for flow in flows]
+        moved = sum(a != b for a, b in zip(current, after)) / len(flows)
+        gone = live - set(path_set)
+        added = set(path_set) - live
+        minimum = sum(path in gone for path in current) / len(flows) + len(added) / len(path_set)
+        yield label, moved, minimum
+        current, live = after, set(path_set)
+
+
+def run_installed(mode: str, flows: List[FiveTuple], fabric: StandInFabric, seed: int = 2):
+    topology = Topology()
+    cache = PathCache(topology.graph)
+    topology.subscribe(cache)
+    for event in fabric.bring_up():
+        if event[0] == "switch":
+            topology.add_switch(event[1], fabric.ports(event[1]))
+        else:
+            topology.add_link(event[1], event[3], event[2], dst_port=event[4])
+    cache.sync(topology.version)
+
+    selector = PathSelector(FlowHasher(), mode)
+    installed = InstalledPaths(selector)
+    rng = random.Random(seed)
+    for flow in flows:
+        src, dst = rng.sample(fabric.leaf_dpids, 2)
+        paths = cache.get(src, dst)
+        installed.add(flow, paths, selector.select(paths, flow, src))
+
+    def spine_links(index):
+        spine = fabric.spine_dpid(index)
+        return [link for link in fabric.links if spine in (link[0], link[2])]
+
+    def down(*spines):
+        for index in spines:
+            for src, _, dst, _ in spine_links(index):
+                topology.remove_link(src, dst)
+
+    def up(*spines):
+        for index in spines:
+            for src, src_port, dst, dst_port in spine_links(index):
+                topology.add_link(src, dst, src_port, dst_port=dst_port)
+
+    for label, apply in (("spine 1 down", lambda: down(0)), ("spine 1 up", lambda: up(0)),
+                         ("spine 2+3 down", lambda: down(1, 2)), ("spine 3 up", lambda: up(2)),
+                         ("spine 2 up", lambda: up(1))):
+        apply()
+        cache.sync(topology.version)
+        total = len(installed)
+        yield label, len(installed.remap(cache.get)) / total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spines", type=int, default=8)
+    parser.add_argument("--flows", type=int, default=20000)
+    parser.add_argument("--leaves", type=int, default=16)
+    args = parser.parse_args()
+
+    fabric = StandInFabric(spines=args.spines, leaves=2)
+    src, dst = fabric.leaf_dpids
+    paths = [(src, fabric.spine_dpid(s), dst) for s in range(args.spines)]
+    flows = make_flows(args.flows)
+
+    print(f"{args.flows} flows between two leaves over {args.spines} spines; fraction of flows remapped")
+    results = {mode: list(run(mode, flows, paths, src)) for mode in MODES}
+    labels = [label for label, _, _ in results[MODES[0]]]
+    print(f"{'event':>16} {'minimum':>8} " + " ".join(f"{mode:>10}" for mode in MODES))
+    for i, label in enumerate(labels):
+        minimum = results[MODES[0]][i][2]
+        print(f"{label:>16} {minimum:8.3f} " + " ".join(f"{results[mode][i][1]:10.3f}" for mode in MODES))
+
+    fabric = StandInFabric(spines=args.spines, leaves=args.leaves)
+    print(f"\n{args.flows} installed flows over {args.leaves} leaves; fraction of installed flows moved")
+    installed = {mode: list(run_installed(mode, flows, fabric)) for mode in MODES}
+    print(f"{'event':>16} " + " ".join(f"{mode:>10}" for mode in MODES))
+    for i, label in enumerate(labels):
+        print(f"{label:>16} " + " ".join(f"{installed[mode][i][1]:10.3f}" for mode in MODES))
+
+
+if __name__ == "__main__":
+    main()
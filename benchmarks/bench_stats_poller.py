@@ -0,0 +1,123 @@
+"""
+Request burstiness, hot uplink sampling and slow-switch backoff of staggered vs burst stats polling.
+
+Run from the repository root:  python -m benchmarks.bench_stats_poller --fabrics 4x16 16x96 --seconds 60
+
+Every switch of a leaf/spine fabric is polled for port, flow and group
+statistics every ``--interval`` seconds, in simulated time. ``burst`` is
+what the controllers used to do: all requests to all switches at the top of
+each interval. ``staggered`` is ``ecmp.stats_poller.StatsPoller``. The
+first ``--hot`` uplinks of every leaf run above the hot threshold, and
+``--slow`` spines take ``--slow-latency`` seconds to answer; the rest
+answer after ``--latency``. ``peak_per_slot`` is the most requests sent
+in any ``--slot``-second window, ``hot_samples_per_s`` the port samples
+per second each hot uplink gets, ``slow_share`` the fraction of requests
+that went to the slow switches and ``final_backoff`` their poll period
+multiplier at the end.
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import time
+from collections import Counter
+
+from benchmarks.fabric import StandInFabric
+from ecmp.stats_poller import KINDS, StatsPoller
+
+
+def run(fabric: StandInFabric, staggered: bool, args) -> dict:
+    now = 0.0
+    poller = StatsPoller(args.interval, args.hot_interval, clock=lambda: now)
+    slow = {fabric.spine_dpid(i) for i in range(args.slow)}
+    hot = {(leaf, port) for leaf in fabric.leaf_dpids for port in range(1, args.hot + 1)}
+    leaves = set(fabric.leaf_dpids)
+    if staggered:
+        for dpid in fabric.switches:
+            for kind in KINDS:
+                poller.watch(dpid, kind)
+
+    slots, samples, per_switch = Counter(), Counter(), Counter()
+    replies = []  # (arrival, seq, dpid, xid)
+    xid = 0
+    start = time.perf_counter()
+
+    def send(dpid, kind, port, job=None):
+        nonlocal xid
+        xid += 1
+        slots[int(now / args.slot)] += 1
+        per_switch[dpid] += 1
+        if kind == "port":
+            if port is None:
+                samples.update((dpid, port) for port in range(1, args.hot + 1) if dpid in leaves)
+            else:
+                samples[(dpid, port)] += 1
+        if job is not None:
+            poller.sent(job, xid)
+        latency = args.slow_latency if dpid in slow else args.latency
+        heapq.heappush(replies, (now + latency, xid, dpid, xid))
+
+    while now < args.seconds:
+        if staggered:
+            for job in poller.due():
+                send(job.dpid, job.kind, job.port, job)
+            step = max(poller.sleep_for(), 1e-3)
+        else:
+            for dpid in fabric.switches:
+                for kind in KINDS:
+                    send(dpid, kind, None)
+            step = args.interval
+        horizon = now + step
+        while replies and replies[0][0] <= horizon:
+            now, _, dpid, reply_xid = heapq.heappop(replies)
+            if staggered:
+                poller.replied(dpid, reply_xid)
+                if dpid in leaves:
+                    for port in range(1, fabric.spines + 1):
+                        poller.port_load(dpid, port, 0.8 if (dpid, port) in hot else 0.1)
+            if poller.sleep_for() <= 0:
+                break
+        else:
+            now = horizon
+    elapsed = time.perf_counter() - start
+
+    sent = sum(per_switch.values())
+    hot_rate = sum(samples[key] for key in hot) / max(len(hot), 1) / args.seconds
+    result = {"sent": sent, "peak_per_slot": max(slots.values()),
+              "mean_per_slot": round(sent / (args.seconds / args.slot), 1),
+              "hot_samples_per_s": round(hot_rate, 2),
+              "slow_share": round(sum(per_switch[dpid] for dpid in slow) / sent, 3)}
+    if staggered:
+        stats = poller.stats()
+        result.update(final_backoff=sorted(set(stats["backed_off"].values())),
+                      timeouts=stats["timeouts"], skipped=stats["skipped"],
+                      us_per_request=round(elapsed / sent * 1e6, 1))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fabrics", nargs="+", default=["4x16", "16x96"], help="SPINESxLEAVES")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--hot-interval", type=float, default=0.5)
+    parser.add_argument("--slot", type=float, default=0.1)
+    parser.add_argument("--hot", type=int, default=1, help="hot uplinks per leaf")
+    parser.add_argument("--slow", type=int, default=1, help="slow spines")
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    for spec in args.fabrics:
+        spines, leaves = (int(n) for n in spec.split("x"))
+        fabric = StandInFabric(spines=spines, leaves=leaves, hosts_per_leaf=2)
+        total = len(fabric.switches)
+        slow_fair = round(args.slow / total, 3)
+        print(f"{spines} spines x {leaves} leaves ({total} switches, fair slow_share {slow_fair})")
+        print(f"  burst:     {run(fabric, False, args)}")
+        print(f"  staggered: {run(fabric, True, args)}")
+
+
+if __name__ == "__main__":
+    main()
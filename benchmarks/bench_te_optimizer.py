@@ -0,0 +1,149 @@
+"""
+Maximum link utilization of equal splits, greedy placement and the global TE optimizer.
+
+Run from the repository root:  python -m benchmarks.bench_te_optimizer --spines 16 --leaves 96 --k 12
+
+Every pair of edge switches exchanges a heavy-tailed (Pareto) demand and a
+fraction of the links is degraded to ``--degraded-capacity`` of the rest,
+the case where an equal split overloads the weak links. Demands are scaled
+so that ``bound`` (below) is ``--load``. ``ecmp`` splits every demand
+equally over its equal-cost paths, ``greedy`` puts each demand (largest
+first) whole on the path that keeps the maximum lowest, as per-flow
+adaptive path selection would, and ``te`` is ``ecmp.te_optimizer``. ``te_buckets`` is what the switches actually do with
+the optimizer's splits quantized into integer select group weights and
+applied hop by hop. ``bound`` is a lower bound: the busiest edge switch's
+demand over its uplink (or downlink) capacity.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import networkx as nx
+import numpy as np
+
+from benchmarks.fabric import StandInFabric, fat_tree
+from ecmp.path_cache import all_pairs_paths
+from ecmp.te_optimizer import bucket_weights, build_problem, min_max_utilization, next_hop_shares
+
+
+def leaf_spine(spines: int, leaves: int):
+    fabric = StandInFabric(spines=spines, leaves=leaves)
+    graph = nx.DiGraph()
+    for src, src_port, dst, _ in fabric.links:
+        graph.add_edge(src, dst, port=src_port, weight=1)
+    return graph, fabric.leaf_dpids
+
+
+def lower_bound(graph: nx.DiGraph, edges, demands, capacity) -> float:
+    out, into = {}, {}
+    for (src, dst), demand in demands.items():
+        out[src] = out.get(src, 0.0) + demand
+        into[dst] = into.get(dst, 0.0) + demand
+    up = max(out[a] / sum(capacity[(a, n)] for n in graph.successors(a)) for a in edges)
+    down = max(into[b] / sum(capacity[(n, b)] for n in graph.predecessors(b)) for b in edges)
+    return max(up, down)
+
+
+def workload(graph: nx.DiGraph, edges, load: float, degraded: float, degraded_capacity: float,
+             seed: int = 1):
+    rng = np.random.default_rng(seed)
+    demands = {(a, b): float(rng.pareto(1.5) + 0.1) for a in edges for b in edges if a != b}
+    capacity = {link: 10e6 * (degraded_capacity if rng.random() < degraded else 1.0) for link in graph.edges}
+    scale = load / lower_bound(graph, edges, demands, capacity)
+    return {pair: demand * scale for pair, demand in demands.items()}, capacity
+
+
+def greedy(problem) -> np.ndarray:
+    load = np.zeros(len(problem.links))
+    fractions = np.zeros(len(problem.paths))
+    links_of = [[] for _ in problem.paths]
+    for path, link in zip(problem.entry_path.tolist(), problem.entry_link.tolist()):
+        links_of[path].append(link)
+    ends = np.append(problem.starts[1:], len(problem.paths))
+    for k in np.argsort(-problem.demand, kind="stable").tolist():
+        demand = problem.demand[k]
+        best, best_peak = None, None
+        for p in range(problem.starts[k], ends[k]):
+            peak = ((load[links_of[p]] + demand) / problem.capacity[links_of[p]]).max()
+            if best_peak is None or peak < best_peak:
+                best, best_peak = p, peak
+        load[links_of[best]] += demand
+        fractions[best] = 1.0
+    return fractions
+
+
+def bucket_utilization(graph: nx.DiGraph, problem, shares, capacity) -> float:
+    """Maximum utilization when every switch splits by its integer bucket weights."""
+    load = {}
+    by_dst = {}
+    for (src, dst), demand in zip(problem.pairs, problem.demand.tolist()):
+        by_dst.setdefault(dst, {})[src] = demand
+    nbr_by_port = {(u, attrs["port"]): v for u, v, attrs in graph.edges(data=True)}
+    reverse = graph.reverse(copy=False)
+    for dst, sources in by_dst.items():
+        distance = nx.single_source_shortest_path_length(reverse, dst)
+        carried = dict(sources)
+        for sw in sorted(carried.keys() | {sw for sw, d in shares if d == dst},
+                         key=lambda node: -distance.get(node, -1)):
+            traffic = carried.get(sw, 0.0)
+            split = shares.get((sw, dst))
+            if not traffic or not split:
+                continue
+            ports = sorted(split)
+            weights = np.array(bucket_weights(split, ports), dtype=np.float64)
+            for out_port, weight in zip(ports, weights / weights.sum()):
+                nxt = nbr_by_port[(sw, out_port)]
+                load[(sw, nxt)] = load.get((sw, nxt), 0.0) + traffic * weight
+                if nxt != dst:
+                    carried[nxt] = carried.get(nxt, 0.0) + traffic * weight
+    return max(value / capacity[link] for link, value in load.items())
+
+
+def run(name: str, graph: nx.DiGraph, edges, args) -> None:
+    demands, capacity = workload(graph, edges, args.load, args.degraded, args.degraded_capacity)
+    paths = all_pairs_paths(graph, edges)
+    port = {(u, v): attrs["port"] for u, v, attrs in graph.edges(data=True)}
+
+    start = time.perf_counter()
+    problem = build_problem(demands, paths, capacity)
+    built = time.perf_counter()
+    solution = min_max_utilization(problem, args.iterations)
+    solved = time.perf_counter()
+    shares = next_hop_shares(problem, solution.fractions, port)
+    mapped = time.perf_counter()
+
+    greedy_start = time.perf_counter()
+    greedy_max = float(problem.utilization(greedy(problem)).max())
+    greedy_s = time.perf_counter() - greedy_start
+
+    print(f"{name}: {graph.number_of_nodes()} switches, {len(problem.pairs)} demands, "
+          f"{len(problem.paths)} paths, {len(problem.links)} links")
+    print(f"  max utilization  ecmp {solution.equal_split_utilization:.2f}  greedy {greedy_max:.2f}  "
+          f"te {solution.max_utilization:.2f}  te_buckets {bucket_utilization(graph, problem, shares, capacity):.2f}  "
+          f"bound {args.load:.2f}")
+    print(f"  seconds  build {built - start:.2f}  solve {solved - built:.2f} ({solution.iterations} iterations)  "
+          f"shares {mapped - solved:.2f}  greedy {greedy_s:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spines", type=int, default=16)
+    parser.add_argument("--leaves", type=int, default=96)
+    parser.add_argument("--k", type=int, default=12, help="fat-tree arity; 0 skips it")
+    parser.add_argument("--load", type=float, default=0.6, help="utilization lower bound to scale demands to")
+    parser.add_argument("--degraded", type=float, default=0.1, help="fraction of links degraded")
+    parser.add_argument("--degraded-capacity", type=float, default=0.4, help="their share of full capacity")
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    graph, edges = leaf_spine(args.spines, args.leaves)
+    run(f"leaf-spine {args.spines}x{args.leaves}", graph, edges, args)
+    if args.k:
+        graph, edges = fat_tree(args.k)
+        run(f"fat-tree k={args.k}", graph, edges, args)
+
+
+if __name__ == "__main__":
+    main()
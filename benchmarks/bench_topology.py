@@ -0,0 +1,84 @@
+"""
+Fabric bring-up cost: full re-discovery on every EventSwitchEnter vs incremental events.
+
+Run from the repository root:  python -m benchmarks.bench_topology --leaves 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import networkx as nx
+
+from benchmarks.fabric import StandInFabric
+from ecmp.path_cache import PathCache
+from ecmp.topology import Topology
+
+
+def bring_up_full_rediscovery(fabric: StandInFabric) -> dict:
+    # Mirrors the old get_topology(): get_switch()/get_link() return everything
+    # known so far and every node and edge is re-added on each switch join.
+    graph = nx.DiGraph()
+    switches, links = [], []
+    operations = 0
+    start = time.perf_counter()
+    for event in fabric.bring_up():
+        if event[0] == "switch":
+            switches.append(event[1])
+            graph.add_nodes_from(switches)
+            for src, src_port, dst, _ in links:
+                graph.add_edge(src, dst, port=src_port, weight=1)
+            operations += len(switches) + len(links)
+        else:
+            links.append(event[1:])
+    # Links discovered after the last join are only picked up by one more
+    # re-discovery pass.
+    for src, src_port, dst, _ in links:
+        graph.add_edge(src, dst, port=src_port, weight=1)
+    operations += len(links)
+    return {"seconds": time.perf_counter() - start, "operations": operations,
+            "edges": graph.number_of_edges()}
+
+
+def bring_up_incremental(fabric: StandInFabric) -> dict:
+    topology = Topology()
+    cache = PathCache(topology.graph)
+    topology.subscribe(cache)
+    operations = 0
+    start = time.perf_counter()
+    for event in fabric.bring_up():
+        if event[0] == "switch":
+            topology.add_switch(event[1])
+        else:
+            src, src_port, dst, _ = event[1:]
+            topology.add_link(src, dst, src_port)
+        operations += 1
+    elapsed = time.perf_counter() - start
+    warm_start = time.perf_counter()
+    cache.sync(topology.version)
+    return {"seconds": elapsed, "operations": operations,
+            "edges": topology.graph.number_of_edges(), "version": topology.version,
+            "path_warm_ms": round((time.perf_counter() - warm_start) * 1e3, 2),
+            "cached_pairs": len(cache)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spines", type=int, default=4)
+    parser.add_argument("--leaves", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fabric = StandInFabric(spines=args.spines, leaves=args.leaves)
+    print(f"fabric: {args.spines} spines x {args.leaves} leaves, {len(fabric.links)} directed links")
+    for name, fn in (("full re-discovery", bring_up_full_rediscovery),
+                     ("incremental", bring_up_incremental)):
+        runs = [fn(fabric) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        extra = {k: v for k, v in best.items() if k != "seconds"}
+        print(f"{name:>18}: {best['seconds'] * 1e3:8.2f} ms  {extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+GroupMod churn and weight error of WCMP uplink weights vs re-sending raw percentages every interval.
+
+Run from the repository root:  python -m benchmarks.bench_wcmp --leaves 96 --uplinks 4 8 16 --intervals 300
+
+Each leaf's uplinks carry a slowly drifting load with per-interval noise,
+one of them at reduced capacity. ``percent`` is what ``adaptive_chat``
+used to do: integer percentages of the residual bandwidth (up to 100
+buckets) sent as an ``OFPGC_MODIFY`` on every stats reply. ``wcmp`` is
+``ecmp.wcmp.WcmpWeights`` with ``--budget`` buckets and ``--min-delta``. ``error`` is the largest
+deviation of any uplink's installed share from its ideal residual share,
+averaged over intervals; ``buckets`` is the mean total weight per group.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from ecmp.wcmp import WcmpWeights, residual_shares
+
+
+def loads(leaves: int, uplinks: int, intervals: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    capacity = np.full((leaves, uplinks), 10e9)
+    capacity[:, 0] = 4e9
+    drift = np.cumsum(rng.normal(0.0, 0.02, (intervals, leaves, uplinks)), axis=0)
+    utilization = np.clip(0.5 + drift + rng.normal(0.0, 0.03, drift.shape), 0.0, 1.2)
+    return capacity, utilization * capacity[None, :, :]
+
+
+def run(name: str, capacity: np.ndarray, used: np.ndarray, decide) -> dict:
+    intervals, leaves, uplinks = used.shape
+    installed = [None] * leaves
+    mods, error, buckets = 0, 0.0, 0.0
+    start = time.perf_counter()
+    for t in range(intervals):
+        for leaf in range(leaves):
+            ideal = residual_shares(capacity[leaf], used[t, leaf])
+            weights = decide(leaf, capacity[leaf], used[t, leaf])
+            if weights is not None:
+                mods += 1
+                installed[leaf] = np.asarray(weights, dtype=np.float64)
+            current = installed[leaf] if installed[leaf] is not None else np.ones(uplinks)
+            error += np.abs(current / current.sum() - ideal).max()
+            buckets += current.sum()
+    samples = intervals * leaves
+    return {"name": name, "groupmods": mods, "per_group_per_interval": round(mods / samples, 3),
+            "error": round(float(error) / samples, 4), "buckets": round(float(buckets) / samples, 1),
+            "us_per_update": round((time.perf_counter() - start) / samples * 1e6, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--leaves", type=int, default=96)
+    parser.add_argument("--uplinks", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--intervals", type=int, default=300)
+    parser.add_argument("--budget", type=int, default=64)
+    parser.add_argument("--min-delta", type=float, nargs="+", default=[0.02, 0.05])
+    args = parser.parse_args()
+
+    for uplinks in args.uplinks:
+        capacity, used = loads(args.leaves, uplinks, args.intervals)
+        print(f"{args.leaves} leaves x {uplinks} uplinks, {args.intervals} intervals")
+
+        def percent(leaf, cap, rate):
+            free = np.maximum(cap - rate, 1.0)
+            return tuple(int(share * 100) for share in free / free.sum())
+
+        print(f"  {run('percent', capacity, used, percent)}")
+        for delta in args.min_delta:
+            wcmp = WcmpWeights(args.budget, delta)
+            ports = list(range(1, uplinks + 1))
+            for leaf in range(args.leaves):
+                wcmp.reset(leaf, ports)
+
+            def decide(leaf, cap, rate, wcmp=wcmp):
+                weights = wcmp.update(leaf, dict(zip(ports, cap)), dict(zip(ports, rate)))
+                return None if weights is None else [weights[p] for p in ports]
+
+            print(f"  {run(f'wcmp d={delta}', capacity, used, decide)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Stand-in leaf-spine fabrics for exercising controller logic without Mininet or Ryu.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+SPINE_BASE = 0x100
+LEAF_BASE = 0x200
+
+
+@dataclass
+class StandInFabric:
+    """Leaf-spine wiring in the same numbering scheme as ``git_topo.MyTopo``.
+
+    Spine ``i`` has dpid ``0x101 + i`` and reaches leaf ``j`` on port ``j + 1``;
+    leaf ``j`` has dpid ``0x201 + j``, reaches spine ``i`` on port ``i + 1`` and
+    hosts on ports ``spines + 1`` onwards.
+    """
+
+    spines: int = 2
+    leaves: int = 2
+    hosts_per_leaf: int = 2
+    capacity_bps: float = 3e6
+    links: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    hosts: Dict[str, Tuple[int, int, str]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        for s in range(self.spines):
+            for l in range(self.leaves):
+                spine, leaf = self.spine_dpid(s), self.leaf_dpid(l)
+                self.links.append((leaf, s + 1, spine, l + 1))
+                self.links.append((spine, l + 1, leaf, s + 1))
+        for l in range(self.leaves):
+            for h in range(self.hosts_per_leaf):
+                index = l * self.hosts_per_leaf + h + 1
+                mac = "00:00:%02x:%02x:%02x:%02x" % (
+                    (index >> 24) & 0xFF, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+                ip = "10.%d.%d.%d" % (l >> 8, l & 0xFF, h + 1)
+                self.hosts[mac] = (self.leaf_dpid(l), self.spines + h + 1, ip)
+
+    @staticmethod
+    def spine_dpid(index: int) -> int:
+        return SPINE_BASE + index + 1
+
+    @staticmethod
+    def leaf_dpid(index: int) -> int:
+        return LEAF_BASE + index + 1
+
+    def leaf_prefix(self, index: int) -> Tuple[str, str]:
+        """The /24 that hosts behind leaf ``index`` are numbered from."""
+        return "10.%d.%d.0" % (index >> 8, index & 0xFF), "255.255.255.0"
+
+    @property
+    def switches(self) -> List[int]:
+        return [self.spine_dpid(s) for s in range(self.spines)] + \
+               [self.leaf_dpid(l) for l in range(self.leaves)]
+
+    @property
+    def leaf_dpids(self) -> List[int]:
+        return [self.leaf_dpid(l) for l in range(self.leaves)]
+
+    def ports(self, dpid: int) -> List[int]:
+        """Port numbers the switch reports when it joins."""
+        if dpid in self.leaf_dpids:
+            return list(range(1, self.spines + self.hosts_per_leaf + 1))
+        return list(range(1, self.leaves + 1))
+
+    def bring_up(self):
+        """Yield ``("switch", dpid)`` and ``("link", src, src_port, dst, dst_port)`` events
+        in the order Ryu would report them as switches connect one by one."""
+        joined = set()
+        for dpid in self.switches:
+            joined.add(dpid)
+            yield ("switch", dpid)
+            for src, src_port, dst, dst_port in self.links:
+                if dpid in (src, dst) and src in joined and dst in joined:
+                    yield ("link", src, src_port, dst, dst_port)
+
+
+def fat_tree(k: int):
+    """k-ary fat-tree as ``(graph, edge_switches)``; ``(k/2)**2`` equal-cost paths between pods."""
+    import networkx as nx
+
+    half = k // 2
+    graph = nx.DiGraph()
+    next_port: Dict[int, int] = {}
+
+    def connect(a: int, b: int) -> None:
+        for u, v in ((a, b), (b, a)):
+            next_port[u] = next_port.get(u, 0) + 1
+            graph.add_edge(u, v, port=next_port[u], weight=1)
+
+    core = [0x1000 + i for i in range(half * half)]
+    edges = []
+    for pod in range(k):
+        aggs = [0x2000 + pod * half + i for i in range(half)]
+        pod_edges = [0x3000 + pod * half + i for i in range(half)]
+        for i, agg in enumerate(aggs):
+            for e in pod_edges:
+                connect(e, agg)
+            for j in range(half):
+                connect(agg, core[i * half + j])
+        edges.extend(pod_edges)
+    return graph, edges
@@ -0,0 +1,101 @@
+"""
+Monte Carlo estimate of ECMP hash collisions and imbalance for a flow mix.
+
+Run from the repository root:  python -m benchmarks.hash_monte_carlo --flows 64 --paths 4
+
+Every trial draws a fresh flow mix (a few heavy-tailed elephants among many
+mice) entering at random leaves, hashes each flow to one of ``--paths``
+uplinks at its leaf, then again at the spine it reached to one of
+``--paths`` next hops (as a three-tier fabric would). All trials are hashed
+at once with the vectorized functions in ``ecmp.flow_hash``.
+
+  imbalance    max / mean bytes per uplink (1.0 is perfect)
+  collisions   fraction of elephants sharing an uplink with another elephant
+  stage2_used  fraction of spine next hops that carry any traffic; with one
+               shared seed the spine repeats the leaf's choice (polarization)
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import Dict
+
+import numpy as np
+
+from ecmp.flow_hash import HASH_FUNCTIONS, hash_keys, pack_keys, seeds_for
+
+
+def flow_mix(rng: np.random.Generator, trials: int, flows: int, elephants: float, leaves: int) -> Dict:
+    n = trials * flows
+    size = rng.pareto(1.2, n) + 1.0
+    heavy = rng.random(n) < elephants
+    size[heavy] *= 1000
+    return {
+        "src_ip": (10 << 24) | rng.integers(0, 1 << 16, n),
+        "dst_ip": (10 << 24) | (1 << 16) | rng.integers(0, 1 << 16, n),
+        "proto": rng.choice(np.array([6, 17]), n, p=[0.9, 0.1]),
+        "src_port": rng.integers(32768, 61000, n),
+        "dst_port": rng.choice(np.array([80, 443, 5001, 8080]), n),
+        "leaf": rng.integers(0, leaves, n),
+        "bytes": size,
+        "elephant": heavy,
+    }
+
+
+def evaluate(choice: np.ndarray, mix: Dict, trials: int, flows: int, paths: int) -> Dict[str, float]:
+    trial = np.repeat(np.arange(trials), flows)
+    # Uplinks are per (trial, leaf, choice)
+    leaves = int(mix["leaf"].max()) + 1
+    slot = (trial * leaves + mix["leaf"]) * paths + choice
+    load = np.bincount(slot, weights=mix["bytes"], minlength=trials * leaves * paths).reshape(-1, paths)
+    active = load.sum(axis=1) > 0
+    imbalance = (load[active].max(axis=1) / load[active].mean(axis=1)).mean()
+
+    eleph = np.bincount(slot[mix["elephant"]], minlength=trials * leaves * paths)
+    per_elephant = eleph[slot[mix["elephant"]]]
+    collisions = float((per_elephant > 1).mean()) if len(per_elephant) else 0.0
+    return {"imbalance": round(float(imbalance), 3), "collisions": round(collisions, 3)}
+
+
+def simulate(function: str, mix: Dict, trials: int, flows: int, paths: int,
+             per_switch: bool, seed: int) -> Dict[str, float]:
+    keys = pack_keys(mix["src_ip"], mix["dst_ip"], mix["proto"], mix["src_port"], mix["dst_port"])
+    leaf_dpid = 0x201 + mix["leaf"]
+    leaf_seed = seeds_for(leaf_dpid, seed) if per_switch else seed
+    uplink = (hash_keys(keys, function, leaf_seed) % paths).astype(np.int64)
+    result = evaluate(uplink, mix, trials, flows, paths)
+
+    spine_dpid = 0x101 + uplink
+    spine_seed = seeds_for(spine_dpid, seed) if per_switch else seed
+    next_hop = (hash_keys(keys, function, spine_seed) % paths).astype(np.int64)
+    pairs = np.unique(uplink * paths + next_hop)
+    result["stage2_used"] = round(len(pairs) / (paths * paths), 3)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--flows", type=int, default=64, help="flows per trial")
+    parser.add_argument("--paths", type=int, default=4)
+    parser.add_argument("--leaves", type=int, default=8)
+    parser.add_argument("--elephants", type=float, default=0.1, help="fraction of flows that are elephants")
+    parser.add_argument("--seed", type=int, default=0x5EED)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    mix = flow_mix(rng, args.trials, args.flows, args.elephants, args.leaves)
+    print(f"{args.trials} trials x {args.flows} flows over {args.leaves} leaves, "
+          f"{args.paths} uplinks, {args.elephants:.0%} elephants")
+
+    uniform = rng.integers(0, args.paths, args.trials * args.flows)
+    print(f"{'uniform random (ideal)':>32}: {evaluate(uniform, mix, args.trials, args.flows, args.paths)}")
+    for function in HASH_FUNCTIONS:
+        for per_switch in (False, True):
+            label = f"{function} ({'per-switch' if per_switch else 'shared'} seed)"
+            stats = simulate(function, mix, args.trials, args.flows, args.paths, per_switch, args.seed)
+            print(f"{label:>32}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
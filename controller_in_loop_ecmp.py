@@ -1,26 +1,62 @@
+import time
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet, ipv4, arp
+from ryu.lib.packet import arp
 from ryu.lib import hub
 from ryu.topology import event
-from ryu.topology.api import get_switch, get_link
-import networkx as nx
-import random
+
+from ecmp.arp_proxy import ArpProxy
+from ecmp.fast_parse import parse_headers
+from ecmp.flow_hash import FlowHasher, five_tuple
+from ecmp.host_table import HostTable
+from ecmp.link_load import LinkLoad
+from ecmp.packet_in import PacketInDispatcher, metered_table_miss
+from ecmp.path_cache import PathCache
+from ecmp.path_scoring import PathScorer
+from ecmp.resilient_hash import PathSelector
+from ecmp.stats_poller import StatsPoller, stats_request
+from ecmp.topology import Topology
 
 class ControllerInLoopECMP(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
     STATS_INTERVAL = 2
-    UTILIZATION_THRESHOLD = 50  # example threshold
+    STATS_HOT_INTERVAL = 0.5  # seconds between polls of an inter-switch port above STATS_HOT_THRESHOLD; 0 disables
+    STATS_HOT_THRESHOLD = 0.5  # fraction of link capacity
+    STATS_SLOW_REPLY = 0.5  # seconds; slower stats replies back off polling of that switch
+    UTILIZATION_THRESHOLD = 0.5  # fraction of link capacity
+    LINK_CAPACITY_BPS = 3e6  # bw=3 TCLinks in simple_topo
+    PATH_SCORE = 'max'  # 'sum', 'max' or 'bottleneck'
+    HASH_FUNCTION = 'crc32'  # 'crc32', 'fnv1a' or 'murmur' over the 5-tuple
+    HASH_SEED = 0
+    HASH_PER_SWITCH = True  # seed each switch differently to avoid hash polarization
+    HASH_MODE = 'rendezvous'  # 'modulo', 'rendezvous' or 'buckets' (resilient table)
+    FAST_PARSER = True  # read headers in place; False decodes every packet with Ryu
+    PACKET_IN_METER = True  # rate-limit table misses on the switch (needs OF1.3 meter support)
+    PACKET_IN_RATE = 1000  # packets/s per switch let through by the meter
+    PACKET_IN_BURST = 200
+    PACKET_IN_BUDGET = 2000  # packet-ins/s handled by the controller, the rest is shed
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.graph = nx.DiGraph()
+        self.topology = Topology()
+        self.graph = self.topology.graph
         self.datapaths = {}
-        self.port_stats = {}
-        self.mac_to_port = {}
+        self.link_load = LinkLoad(default_capacity_bps=self.LINK_CAPACITY_BPS)
+        self.stats_poller = StatsPoller(self.STATS_INTERVAL, self.STATS_HOT_INTERVAL, self.STATS_HOT_THRESHOLD,
+                                        slow_reply=self.STATS_SLOW_REPLY)
+        self.hosts = HostTable()
+        self.arp_proxy = ArpProxy()
+        self.path_cache = PathCache(self.graph)
+        self.topology.subscribe(self.path_cache)
+        self.path_scorer = PathScorer(self.graph, self.link_load, score=self.PATH_SCORE)
+        self.flow_hasher = FlowHasher(self.HASH_FUNCTION, self.HASH_SEED, self.HASH_PER_SWITCH)
+        self.path_selector = PathSelector(self.flow_hasher, self.HASH_MODE)
+        self.packet_in_dispatcher = PacketInDispatcher(self._handle_packet_in, budget=self.PACKET_IN_BUDGET)
         self.monitor_thread = hub.spawn(self._monitor)
+        self.dispatch_thread = hub.spawn(self.packet_in_dispatcher.run, hub.sleep)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -28,70 +64,170 @@ class ControllerInLoopECMP(app_manager.RyuApp):
         ofproto = dp.ofproto
         parser = dp.ofproto_parser
         self.datapaths[dp.id] = dp
+        self.stats_poller.forget_switch(dp.id)
+        self.stats_poller.watch(dp.id, 'port')
 
-        # Lowest priority rule: flood unknown packets
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER)]
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=dp, priority=0, match=match, instructions=inst)
-        dp.send_msg(mod)
+        # Lowest priority rule: send unknown packets to the controller
+        if self.PACKET_IN_METER:
+            for mod in metered_table_miss(dp, self.PACKET_IN_RATE, self.PACKET_IN_BURST):
+                dp.send_msg(mod)
+        else:
+            match = parser.OFPMatch()
+            actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER)]
+            inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+            mod = parser.OFPFlowMod(datapath=dp, priority=0, match=match, instructions=inst)
+            dp.send_msg(mod)
         self.logger.info("[BOOT] Controller rule set for switch %s", dp.id)
 
     @set_ev_cls(event.EventSwitchEnter)
     def on_switch_enter(self, ev):
-        switch_list = get_switch(self, None)
-        switches = [sw.dp.id for sw in switch_list]
-        self.graph.add_nodes_from(switches)
-
-        link_list = get_link(self, None)
-        for link in link_list:
-            src = link.src.dpid
-            dst = link.dst.dpid
-            port = link.src.port_no
-            self.graph.add_edge(src, dst, port=port, weight=1)
-
-        self.logger.info("[TOPO] Topology updated: switches=%s", switches)
+        dpid = ev.switch.dp.id
+        if self.topology.add_switch(dpid, [p.port_no for p in ev.switch.ports]):
+            self.logger.info("[TOPO] Switch joined: %s (version %s)", dpid, self.topology.version)
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def on_switch_leave(self, ev):
+        dpid = ev.switch.dp.id
+        self.hosts.forget_switch(dpid)
+        self.link_load.forget_switch(dpid)
+        self.stats_poller.forget_switch(dpid)
+        if self.topology.remove_switch(dpid):
+            self.logger.info("[TOPO] Switch left: %s (version %s)", dpid, self.topology.version)
+
+    @set_ev_cls(event.EventLinkAdd)
+    def on_link_add(self, ev):
+        src = ev.link.src.dpid
+        dst = ev.link.dst.dpid
+        port = ev.link.src.port_no
+        self.hosts.forget_port(src, port)
+        self.hosts.forget_port(dst, ev.link.dst.port_no)
+        if self.topology.add_link(src, dst, port, dst_port=ev.link.dst.port_no):
+            self.logger.info("[TOPO] Link added: %s -> %s via port %s", src, dst, port)
+
+    @set_ev_cls(event.EventLinkDelete)
+    def on_link_delete(self, ev):
+        src = ev.link.src.dpid
+        dst = ev.link.dst.dpid
+        if self.topology.remove_link(src, dst):
+            self.logger.info("[TOPO] Link removed: %s -> %s", src, dst)
 
     def _monitor(self):
+        housekeeping = 0.0
         while True:
-            for dp in self.datapaths.values():
-                parser = dp.ofproto_parser
-                req = parser.OFPPortStatsRequest(dp, 0, dp.ofproto.OFPP_ANY)
+            if time.monotonic() - housekeeping >= self.STATS_INTERVAL:
+                housekeeping = time.monotonic()
+                self.path_cache.sync(self.topology.version)
+                self.hosts.expire()
+                self.arp_proxy.expire()
+                self._log_packet_in_stats()
+                self.logger.debug("[METRICS] stats polling %s", self.stats_poller.stats())
+            # Requests are spread over the interval instead of sent in one
+            # burst; hot links are polled more often and slow switches less
+            for job in self.stats_poller.due():
+                dp = self.datapaths.get(job.dpid)
+                if dp is None:
+                    continue
+                req = stats_request(dp, job)
+                dp.set_xid(req)
+                self.stats_poller.sent(job, req.xid)
                 dp.send_msg(req)
-            hub.sleep(self.STATS_INTERVAL)
+            hub.sleep(self.stats_poller.sleep_for())
+
+    def _log_packet_in_stats(self):
+        stats = self.packet_in_dispatcher.stats()
+        self.logger.debug("[PKTIN] %s", stats)
+        dropped = {cls: c["dropped"] for cls, c in stats.items() if c["dropped"]}
+        if dropped:
+            self.logger.warning("[PKTIN] Packet-ins shed so far: %s", dropped)
 
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
     def stats_reply_handler(self, ev):
         dpid = ev.msg.datapath.id
-        self.port_stats[dpid] = {stat.port_no: stat.tx_bytes for stat in ev.msg.body}
-
-    def _get_best_path(self, src, dst):
-        try:
-            paths = list(nx.all_shortest_paths(self.graph, src, dst))
-        except nx.NetworkXNoPath:
+        more = bool(ev.msg.flags & ev.msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+        self.stats_poller.replied(dpid, ev.msg.xid, more)
+        self.link_load.update(dpid, ev.msg.body)
+        self.path_scorer.refresh(dpid)
+        for attrs in self.graph.adj.get(dpid, {}).values():
+            self.stats_poller.port_load(dpid, attrs['port'], self.link_load.utilization(dpid, attrs['port']))
+
+    def _get_best_path(self, src, dst, flow=None):
+        paths = self.path_cache.get(src, dst)
+        if not paths:
             return []
 
-        path_loads = []
-        for path in paths:
-            load = 0
-            for i in range(len(path) - 1):
-                sw = path[i]
-                next_sw = path[i + 1]
-                port = self.graph[sw][next_sw]['port']
-                load += self.port_stats.get(sw, {}).get(port, 0)
-            path_loads.append((load, path))
-
-        if all(load > self.UTILIZATION_THRESHOLD for load, _ in path_loads):
-            best = min(path_loads, key=lambda x: x[0])[1]
+        loads = self.path_scorer.scores(src, dst, paths)
+        if (loads > self.UTILIZATION_THRESHOLD).all():
+            best = paths[int(loads.argmin())]
             self.logger.info("[PATH] Adaptive ECMP path: %s", best)
             return best
         else:
-            chosen = random.choice(paths)
+            # Every packet comes through here, so a random pick would reorder flows
+            chosen = self.path_selector.select(paths, flow, src) if flow else paths[0]
             self.logger.info("[PATH] Traditional ECMP path: %s", chosen)
             return chosen
         
+    def _handle_arp(self, msg, in_port, eth, arp_pkt):
+        datapath = msg.datapath
+        parser = datapath.ofproto_parser
+        ofproto = datapath.ofproto
+        if self.topology.is_edge_port(datapath.id, in_port):
+            self.arp_proxy.learn(arp_pkt.src_ip, arp_pkt.src_mac)
+
+        if arp_pkt.opcode == arp.ARP_REQUEST:
+            reply = self.arp_proxy.reply_for(arp_pkt.src_mac, arp_pkt.src_ip, arp_pkt.dst_ip)
+            if reply is not None:
+                actions = [parser.OFPActionOutput(in_port)]
+                out = parser.OFPPacketOut(datapath=datapath,
+                                          buffer_id=ofproto.OFP_NO_BUFFER,
+                                          in_port=ofproto.OFPP_CONTROLLER,
+                                          actions=actions,
+                                          data=reply)
+                datapath.send_msg(out)
+                self.logger.info("[ARP] Answered who-has %s for %s", arp_pkt.dst_ip, arp_pkt.src_ip)
+                return
+
+        # Replies go straight to the requester; cache misses are flooded on
+        # host-facing ports only, so they never cross (or loop through) the spines
+        location = self.hosts.lookup(eth.dst)
+        if location is not None:
+            self._send_to_host(location, msg.data)
+        else:
+            self._flood_edge(datapath.id, in_port, msg.data)
+            self.logger.info("[ARP] Cache miss for %s, flooded to edge ports", arp_pkt.dst_ip)
+
+    def _send_to_host(self, location, data):
+        dpid, port = location
+        dp = self.datapaths.get(dpid)
+        if dp is None:
+            return
+        out = dp.ofproto_parser.OFPPacketOut(datapath=dp,
+                                             buffer_id=dp.ofproto.OFP_NO_BUFFER,
+                                             in_port=dp.ofproto.OFPP_CONTROLLER,
+                                             actions=[dp.ofproto_parser.OFPActionOutput(port)],
+                                             data=data)
+        dp.send_msg(out)
+
+    def _flood_edge(self, ingress_dpid, in_port, data):
+        for dpid, dp in self.datapaths.items():
+            ports = [port for port in self.topology.edge_ports(dpid)
+                     if not (dpid == ingress_dpid and port == in_port)]
+            if not ports:
+                continue
+            actions = [dp.ofproto_parser.OFPActionOutput(port) for port in ports]
+            out = dp.ofproto_parser.OFPPacketOut(datapath=dp,
+                                                 buffer_id=dp.ofproto.OFP_NO_BUFFER,
+                                                 in_port=dp.ofproto.OFPP_CONTROLLER,
+                                                 actions=actions,
+                                                 data=data)
+            dp.send_msg(out)
+
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
+        # LLDP, ARP and first packets of a flow are served before repeats;
+        # past the budget the lowest class is shed
+        self.packet_in_dispatcher.submit(ev)
+
+    def _handle_packet_in(self, ev):
         msg = ev.msg
         dp = msg.datapath
         dpid = dp.id
@@ -99,38 +235,27 @@ class ControllerInLoopECMP(app_manager.RyuApp):
         parser = dp.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        ip = pkt.get_protocol(ipv4.ipv4)
-        arp_pkt = pkt.get_protocol(arp.arp)
+        eth, arp_pkt, ip = parse_headers(msg.data, fast=self.FAST_PARSER)
 
         src_mac = eth.src
         dst_mac = eth.dst
-        self.mac_to_port.setdefault(dpid, {})[src_mac] = in_port
+        if self.topology.is_edge_port(dpid, in_port):
+            src_ip = arp_pkt.src_ip if arp_pkt else (ip.src if ip else None)
+            moved_from = self.hosts.learn(src_mac, dpid, in_port, ip=src_ip)
+            if src_ip:
+                self.arp_proxy.learn(src_ip, src_mac)
+            if moved_from is not None:
+                self.logger.info("[HOST] %s moved from %s to %s", src_mac, moved_from, (dpid, in_port))
 
         # Handle ARP separately
         if arp_pkt:
-            actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
-            out = parser.OFPPacketOut(datapath=dp,
-                                    buffer_id=msg.buffer_id,
-                                    in_port=in_port,
-                                    actions=actions,
-                                    data=msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None)
-            dp.send_msg(out)
-            self.logger.info("[ARP] Flooded ARP from %s to %s", src_mac, dst_mac)
+            self._handle_arp(msg, in_port, eth, arp_pkt)
             return
 
         # Handle IPv4 forwarding
-        # Try to find the destination switch based on learned MAC table
-        dst_dpid = None
-        dst_port = None
-        for sw_id, mac_table in self.mac_to_port.items():
-            if dst_mac in mac_table:
-                dst_dpid = sw_id
-                dst_port = mac_table[dst_mac]
-                break
-
-        if dst_dpid is None:
+        # Find the destination's edge switch from the host location table
+        location = self.hosts.lookup(dst_mac)
+        if location is None:
             # Destination unknown, flood
             actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
             out = parser.OFPPacketOut(datapath=dp,
@@ -143,7 +268,8 @@ class ControllerInLoopECMP(app_manager.RyuApp):
             return
 
         # Get best path from current switch to destination switch
-        path = self._get_best_path(dpid, dst_dpid)
+        dst_dpid = location[0]
+        path = self._get_best_path(dpid, dst_dpid, five_tuple(ip))
         if not path or len(path) < 2:
             self.logger.warning("[DROP] No valid path from switch %s to %s", dpid, dst_dpid)
             return
@@ -500,107 +500,471 @@
 
 
 
+import time
+
+import networkx as nx
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 from ryu.topology import event
-from ryu.topology.api import get_switch, get_link
-from ryu.lib.packet import packet, ethernet, ipv4, arp
+from ryu.lib.packet import ether_types, arp
 from ryu.lib import hub
-import networkx as nx
-import random
+
+from ecmp.arp_proxy import ArpProxy
+from ecmp.broadcast_tree import BroadcastTree
+from ecmp.compute_pool import ComputePool, HandlerMetrics, timed
+from ecmp.dst_forwarding import DestinationForwarding
+from ecmp.event_log import EventLog
+from ecmp.fast_parse import parse_headers
+from ecmp.flow_hash import FlowHasher, HostPair
+from ecmp.flow_programmer import FlowProgrammer
+from ecmp.flow_registry import FlowRegistry
+from ecmp.host_table import HostTable
+from ecmp.k_paths import KPathCache, unequal_cost_paths
+from ecmp.link_load import LinkLoad
+from ecmp.path_cache import PathCache, path_table, shortest_paths
+from ecmp.path_scoring import PathScorer
+from ecmp.pending_flows import PendingFlows
+from ecmp.resilient_hash import PathSelector
+from ecmp.stats_poller import StatsPoller, stats_request
+from ecmp.te_optimizer import TrafficMatrix, bucket_weights, optimize
+from ecmp.topology import Topology
 
 
 class DynamicECMP(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
     STATS_INTERVAL = 2  # seconds
-    UTILIZATION_THRESHOLD = 50  # bytes
+    STATS_HOT_INTERVAL = 0.5  # seconds between polls of an inter-switch port above STATS_HOT_THRESHOLD; 0 disables
+    STATS_HOT_THRESHOLD = 0.5  # fraction of link capacity
+    STATS_SLOW_REPLY = 0.5  # seconds; slower stats replies back off polling of that switch
+    UTILIZATION_THRESHOLD = 0.5  # fraction of link capacity
+    LINK_CAPACITY_BPS = 3e6  # bw=3 TCLinks in simple_topo
+    PATH_SCORE = 'max'  # 'sum', 'max' or 'bottleneck'
+    UCMP_EXTRA_PATHS = 4  # longer paths tried once every equal-cost path is congested; 0 disables
+    UCMP_MAX_STRETCH = 2.0  # longest such path, in multiples of the shortest hop count
+    HASH_FUNCTION = 'crc32'  # 'crc32', 'fnv1a' or 'murmur' over the host pair
+    HASH_SEED = 0
+    HASH_PER_SWITCH = True  # seed each switch differently to avoid hash polarization
+    HASH_MODE = 'rendezvous'  # 'modulo', 'rendezvous' or 'buckets' (resilient table)
+    FLOW_INSTALL_MODE = 'barrier'  # 'plain', 'barrier' or 'bundle'
+    # 'pair' (eth_src, eth_dst) or 'destination'. Pair rules carry every flow
+    # between two hosts, so pair mode hashes the host pair, not the 5-tuple
+    FORWARDING_MODE = 'pair'
+    PROACTIVE = False  # push destination rules as soon as a host is located
+    FAST_PARSER = True  # read headers in place; False decodes every packet with Ryu
+    BROADCAST_MATCH = ('01:00:00:00:00:00', '01:00:00:00:00:00')  # group bit of eth_dst
+    FLOOD_SETTLE = 5.0  # seconds a port must go without a discovered link before it is flooded as a host port
+    FLOW_PRIORITY = 10
+    FLOW_IDLE_TIMEOUT = 10
+    FLOW_HARD_TIMEOUT = 30
+    REROUTE_THRESHOLD = 0.8  # link utilization above which installed flows are moved off it
+    REROUTE_BUDGET = 16  # flows moved per congested port stats reply
+    REROUTE_HOLD_DOWN = 10  # seconds before a flow moved for congestion may move again
+    COMPUTE_WORKERS = 2  # native threads computing paths off the hub; 0 computes inline
+    COMPUTE_MAX_PENDING = 256  # jobs queued or running before path computation falls back inline
+    METRICS_INTERVAL = 30  # seconds between [METRICS] log lines
+    EVENT_LOG = None  # opt-in JSONL file for per-packet events, e.g. 'dynamic_ecmp_events.jsonl'
+    EVENT_LOG_MAX_BYTES = 64 << 20  # the file is rotated at this size
+    EVENT_LOG_BACKUPS = 3  # rotated files kept
+    EVENT_FIELDS = {  # names of the values each event type is emitted with
+        'pktin': ('sw', 'in_port', 'src', 'dst'),
+        'flood': ('sw', 'dst'),
+        'path': ('mode', 'path'),
+        'flow': ('path', 'src', 'dst', 'ports'),
+        'forward': ('sw', 'src', 'dst', 'port'),
+        'released': ('packets',),
+        'arp_reply': ('sw', 'who_has', 'to'),
+        'arp_flood': ('sw', 'who_has'),
+    }
+    EVENT_SAMPLE = {'pktin': 10, 'forward': 10}  # only every Nth event of these types is logged
+    EVENT_RATE = 200  # events/s logged per type at most
+    TE_INTERVAL = 10  # seconds between traffic engineering rounds (destination groups); 0 disables
+    TE_ITERATIONS = 100  # optimizer iterations per round
+    TE_MIN_GAIN = 0.05  # relative drop in max utilization below which groups keep equal weights
 
     def __init__(self, *args, **kwargs):
         super(DynamicECMP, self).__init__(*args, **kwargs)
-        self.graph = nx.DiGraph()
+        self.topology = Topology()
+        self.graph = self.topology.graph
         self.datapaths = {}
-        self.mac_to_port = {}
-        self.port_stats = {}
+        self.hosts = HostTable()
+        self.arp_proxy = ArpProxy()
+        self.link_load = LinkLoad(default_capacity_bps=self.LINK_CAPACITY_BPS)
+        self.stats_poller = StatsPoller(self.STATS_INTERVAL, self.STATS_HOT_INTERVAL, self.STATS_HOT_THRESHOLD,
+                                        slow_reply=self.STATS_SLOW_REPLY)
+        self.path_cache = PathCache(self.graph)
+        self.topology.subscribe(self.path_cache)
+        self.broadcast_tree = BroadcastTree(self.topology, settle=self.FLOOD_SETTLE)
+        self.topology.subscribe(self.broadcast_tree)
+        self.path_scorer = PathScorer(self.graph, self.link_load, score=self.PATH_SCORE)
+        self.k_paths = KPathCache(self.topology, self.UCMP_EXTRA_PATHS, self.UCMP_MAX_STRETCH)
+        self.ucmp_scorer = PathScorer(self.graph, self.link_load, score=self.PATH_SCORE)
+        self.flow_hasher = FlowHasher(self.HASH_FUNCTION, self.HASH_SEED, self.HASH_PER_SWITCH)
+        self.path_selector = PathSelector(self.flow_hasher, self.HASH_MODE)
+        self.flow_programmer = FlowProgrammer(mode=self.FLOW_INSTALL_MODE)
+        self.pending_flows = PendingFlows(timeout=self.flow_programmer.timeout)
+        self.flow_registry = FlowRegistry()
+        self.handler_metrics = HandlerMetrics()
+        self.events = EventLog(self.EVENT_LOG, self.EVENT_FIELDS, self.EVENT_SAMPLE, default_rate=self.EVENT_RATE,
+                               max_bytes=self.EVENT_LOG_MAX_BYTES, backups=self.EVENT_LOG_BACKUPS)
+        if not self.events.enabled:
+            self.logger.info("[LOG] Per-packet events are off; set EVENT_LOG to a file name to record them")
+        self.compute_pool = None
+        if self.COMPUTE_WORKERS:
+            self.compute_pool = ComputePool(self.COMPUTE_WORKERS, self.COMPUTE_MAX_PENDING,
+                                            metrics=self.handler_metrics)
+            self.compute_thread = hub.spawn(self.compute_pool.run, hub.sleep)
+        self._snapshot = (None, None)  # (topology version, frozen copy of the graph)
+        self._warming = None  # topology version whose paths are being computed off the hub
+        self._k_paths_pending = set()  # (src, dst) pairs whose UCMP paths are being computed
+        self._metrics_logged = time.monotonic()
+        self.dst_forwarding = DestinationForwarding(self.topology)
+        self.traffic_matrix = TrafficMatrix()
+        self._te_round = time.monotonic()
+        self._te_running = False
         self.monitor_thread = hub.spawn(self._monitor)
 
+    def close(self):
+        self.events.close()
+        super(DynamicECMP, self).close()
+
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
         self.datapaths[datapath.id] = datapath
+        self.stats_poller.forget_switch(datapath.id)
+        self.stats_poller.watch(datapath.id, 'port')
         parser = datapath.ofproto_parser
         ofproto = datapath.ofproto
 
-        # Default flow: flood unknown traffic
+        # Table miss: unknown unicast goes to the controller. Flooding it with
+        # OFPP_FLOOD looped broadcasts around every leaf-spine-leaf cycle.
         match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
         inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
         mod = parser.OFPFlowMod(datapath=datapath, priority=0,
                                 match=match, instructions=inst)
         datapath.send_msg(mod)
-        self.logger.info("[BOOT] Flood rule installed on switch %s", datapath.id)
 
-    @set_ev_cls(event.EventSwitchEnter)
-    def get_topology(self, ev):
-        switch_list = get_switch(self, None)
-        switches = [sw.dp.id for sw in switch_list]
-        self.graph.add_nodes_from(switches)
-
-        link_list = get_link(self, None)
-        for link in link_list:
-            src = link.src.dpid
-            dst = link.dst.dpid
-            port = link.src.port_no
-            self.graph.add_edge(src, dst, port=port, weight=1)
+        # ARP goes to the controller so the proxy can answer it
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP)
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        mod = parser.OFPFlowMod(datapath=datapath, priority=2,
+                                match=match, instructions=inst)
+        datapath.send_msg(mod)
+        self.logger.info("[BOOT] Table-miss and ARP rules installed on switch %s", datapath.id)
+        self._update_flood_rules()
 
-        self.logger.info("[TOPO] Switches: %s", switches)
+    @set_ev_cls(event.EventSwitchEnter)
+    @timed('topology')
+    def on_switch_enter(self, ev):
+        dpid = ev.switch.dp.id
+        if self.topology.add_switch(dpid, [p.port_no for p in ev.switch.ports]):
+            self.logger.info("[TOPO] Switch joined: %s (version %s)", dpid, self.topology.version)
+            self._update_flood_rules()
+            if self.PROACTIVE:
+                self._repair_forwarding()
+
+    @set_ev_cls(event.EventSwitchLeave)
+    @timed('topology')
+    def on_switch_leave(self, ev):
+        dpid = ev.switch.dp.id
+        self.hosts.forget_switch(dpid)
+        self.link_load.forget_switch(dpid)
+        self.stats_poller.forget_switch(dpid)
+        self.dst_forwarding.forget_switch(dpid)
+        self.flow_registry.forget_switch(dpid)
+        transit = self.flow_registry.links_at(dpid)
+        if self.topology.remove_switch(dpid):
+            self.logger.info("[TOPO] Switch left: %s (version %s)", dpid, self.topology.version)
+            self._update_flood_rules()
+            self._reroute(transit, "failure")
+            if self.PROACTIVE:
+                self._repair_forwarding()
+
+    @set_ev_cls(event.EventLinkAdd)
+    @timed('topology')
+    def on_link_add(self, ev):
+        src = ev.link.src.dpid
+        dst = ev.link.dst.dpid
+        port = ev.link.src.port_no
+        self.hosts.forget_port(src, port)
+        self.hosts.forget_port(dst, ev.link.dst.port_no)
+        if self.topology.add_link(src, dst, port, dst_port=ev.link.dst.port_no):
+            self.logger.info("[TOPO] Link added: %s -> %s via port %s", src, dst, port)
+            self._update_flood_rules()
+            if self.PROACTIVE:
+                self._repair_forwarding()
+
+    @set_ev_cls(event.EventLinkDelete)
+    @timed('topology')
+    def on_link_delete(self, ev):
+        src = ev.link.src.dpid
+        dst = ev.link.dst.dpid
+        if self.topology.remove_link(src, dst):
+            self.logger.info("[TOPO] Link removed: %s -> %s", src, dst)
+            self._update_flood_rules()
+            self._reroute([(src, dst)], "failure")
+            if self.PROACTIVE:
+                self._repair_forwarding()
+
+    def _update_flood_rules(self):
+        # Broadcast and multicast frames are copied to spanning-tree and settled
+        # host ports only; re-sent just for the switches whose flood ports changed
+        for dpid in sorted(self.broadcast_tree.take_changed(ready=self.datapaths)):
+            dp = self.datapaths[dpid]
+            parser = dp.ofproto_parser
+            ports = self.broadcast_tree.flood_ports(dpid)
+            actions = [parser.OFPActionOutput(port) for port in ports]
+            inst = [parser.OFPInstructionActions(dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
+            mod = parser.OFPFlowMod(datapath=dp, priority=1,
+                                    match=parser.OFPMatch(eth_dst=self.BROADCAST_MATCH),
+                                    instructions=inst)
+            dp.send_msg(mod)
+            self.logger.info("[TREE] Flood ports on switch %s: %s", dpid, list(ports))
 
     def _monitor(self):
+        housekeeping = 0.0
         while True:
-            for dp in self.datapaths.values():
-                self._request_stats(dp)
-            hub.sleep(self.STATS_INTERVAL)
+            if time.monotonic() - housekeeping >= self.STATS_INTERVAL:
+                housekeeping = time.monotonic()
+                self._housekeeping()
+            self._poll_stats()
+            hub.sleep(self.stats_poller.sleep_for())
+
+    def _housekeeping(self):
+        self._warm_paths()
+        if self.broadcast_tree.settling():
+            self._update_flood_rules()
+        self.hosts.expire()
+        self.arp_proxy.expire()
+        self.flow_programmer.expire()
+        self.pending_flows.expire()
+        self.flow_registry.expire(self.FLOW_HARD_TIMEOUT + self.STATS_INTERVAL)
+        # Ingress rule counters on edge switches feed the traffic matrix
+        edge = {dpid for _, (dpid, _) in self.hosts.items()} if self._te_enabled() else ()
+        for dpid in self.datapaths:
+            if dpid in edge:
+                self.stats_poller.watch(dpid, 'flow')
+            else:
+                self.stats_poller.unwatch(dpid, 'flow')
+        if self._te_enabled() and time.monotonic() - self._te_round >= self.TE_INTERVAL:
+            self._te_round = time.monotonic()
+            self._optimize_te()
+        if time.monotonic() - self._metrics_logged >= self.METRICS_INTERVAL:
+            self._metrics_logged = time.monotonic()
+            self.logger.info("[METRICS] %s", self.handler_metrics.summary())
+            self.logger.info("[METRICS] stats polling %s", self.stats_poller.stats())
+            self.logger.info("[METRICS] event log %s", self.events.stats())
+            if self.compute_pool is not None:
+                self.logger.info("[METRICS] compute pool %s pending, %s",
+                                 self.compute_pool.pending, self.compute_pool.counters)
+
+    def _graph_snapshot(self):
+        # Read-only copy for worker threads, taken once per topology version
+        version, graph = self._snapshot
+        if version != self.topology.version:
+            graph = nx.freeze(self.graph.copy())
+            self._snapshot = (self.topology.version, graph)
+        return graph
+
+    def _warm_paths(self):
+        version = self.topology.version
+        if self.compute_pool is None:
+            self.path_cache.sync(version)
+            return
+        if version in (self.path_cache.warmed_version, self._warming):
+            return
 
-    def _request_stats(self, datapath):
-        parser = datapath.ofproto_parser
-        req = parser.OFPPortStatsRequest(datapath, 0, datapath.ofproto.OFPP_ANY)
-        datapath.send_msg(req)
+        def done(table):
+            self._warming = None
+            # A newer topology gets its own job on the next monitor round
+            if self.topology.version == version:
+                self.path_cache.adopt(table, version)
+
+        def failed(exc):
+            self._warming = None
+            self.logger.warning("[PATH] Computing paths for version %s failed: %r", version, exc)
+
+        if self.compute_pool.submit(path_table, (self._graph_snapshot(),),
+                                    on_done=done, on_error=failed, kind="warm"):
+            self._warming = version
+
+    def _poll_stats(self):
+        # Requests are spread over the interval instead of sent in one burst;
+        # hot links are polled more often and slow switches less
+        for job in self.stats_poller.due():
+            dp = self.datapaths.get(job.dpid)
+            if dp is None:
+                continue
+            req = stats_request(dp, job)
+            dp.set_xid(req)
+            self.stats_poller.sent(job, req.xid)
+            dp.send_msg(req)
+
+    def _stats_replied(self, msg):
+        more = bool(msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+        self.stats_poller.replied(msg.datapath.id, msg.xid, more)
 
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    @timed('port_stats')
     def _port_stats_reply_handler(self, ev):
+        self._stats_replied(ev.msg)
         dpid = ev.msg.datapath.id
-        self.port_stats[dpid] = {stat.port_no: stat.tx_bytes for stat in ev.msg.body}
-
-    def _get_best_path(self, src, dst):
-        try:
-            paths = list(nx.all_shortest_paths(self.graph, src, dst))
-        except nx.NetworkXNoPath:
-            return []
-
+        self.link_load.update(dpid, ev.msg.body)
+        self.path_scorer.refresh(dpid)
+        self.ucmp_scorer.refresh(dpid)
+
+        hot = []
+        for nbr, attrs in self.graph.adj.get(dpid, {}).items():
+            utilization = self.link_load.utilization(dpid, attrs['port'])
+            self.stats_poller.port_load(dpid, attrs['port'], utilization)
+            if utilization > self.REROUTE_THRESHOLD:
+                hot.append((dpid, nbr))
+        if hot:
+            self._reroute(hot, "congestion", budget=self.REROUTE_BUDGET)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    @timed('flow_stats')
+    def _flow_stats_reply_handler(self, ev):
+        # Destination rules on an edge switch only carry traffic entering the
+        # fabric there, so each one is a (this switch, destination leaf) demand
+        self._stats_replied(ev.msg)
+        dpid = ev.msg.datapath.id
+        ofproto = ev.msg.datapath.ofproto
+        for stat in ev.msg.body:
+            if stat.priority != self.dst_forwarding.priority:
+                continue
+            dst = None
+            for inst in stat.instructions:
+                for action in getattr(inst, 'actions', ()):
+                    if action.type == ofproto.OFPAT_GROUP:
+                        dst = self.dst_forwarding.destination_of(action.group_id)
+            if dst is None or dst == dpid:
+                continue
+            self.traffic_matrix.observe(dpid, dst, (dpid, tuple(stat.match.items())), stat.byte_count,
+                                        stat.duration_sec + stat.duration_nsec * 1e-9)
+
+    def _te_enabled(self):
+        return bool(self.TE_INTERVAL) and (self.FORWARDING_MODE == 'destination' or self.PROACTIVE)
+
+    def _optimize_te(self):
+        # Split of every demand over its equal-cost paths minimizing the
+        # maximum link utilization, applied as select group bucket weights
+        demands = self.traffic_matrix.demands()
+        if not demands or self._te_running:
+            return
+        version = self.topology.version
+        paths = {pair: self.path_cache.get(*pair) for pair in demands}
+        capacity, port = {}, {}
+        for src, dst, attrs in self.graph.edges(data=True):
+            port[(src, dst)] = attrs['port']
+            capacity[(src, dst)] = self.link_load.capacity(src, attrs['port'])
+        args = (demands, paths, capacity, port, self.TE_ITERATIONS)
+
+        def done(result):
+            self._te_running = False
+            # Next hops may have changed since the snapshot; wait for the next round
+            if self.topology.version == version:
+                self._apply_te(*result)
+
+        def failed(exc):
+            self._te_running = False
+            self.logger.warning("[TE] Optimization for version %s failed: %r", version, exc)
+
+        if self.compute_pool is None:
+            done(optimize(*args))
+        elif self.compute_pool.submit(optimize, args, on_done=done, on_error=failed, kind="te"):
+            self._te_running = True
+
+    def _apply_te(self, solution, shares):
+        # Integer bucket weights cost a little precision, so a near-equal
+        # optimum is better served by equal weights
+        equal = solution.equal_split_utilization
+        weighted = equal > 0 and solution.max_utilization <= (1.0 - self.TE_MIN_GAIN) * equal
+        per_switch = {}
+        for (sw, dst), split in shares.items():
+            ports = self.dst_forwarding.group_ports(sw, dst)
+            if len(ports) < 2 or sw not in self.datapaths:
+                continue
+            weights = bucket_weights(split, ports) if weighted else (1,) * len(ports)
+            entry = self.dst_forwarding.set_weights(sw, dst, weights)
+            if entry is not None:
+                per_switch.setdefault(sw, []).append(entry)
+        self.flow_programmer.push([(self.datapaths[sw], self.dst_forwarding.build(self.datapaths[sw], entries))
+                                   for sw, entries in per_switch.items()])
+        self.logger.info("[TE] Max utilization %.2f (equal split %.2f) after %s iterations; "
+                         "%s groups re-weighted on %s switches", solution.max_utilization,
+                         solution.equal_split_utilization, solution.iterations,
+                         sum(len(entries) for entries in per_switch.values()), len(per_switch))
+
+    def _get_best_path(self, src, dst, flow=None):
+        paths = self.path_cache.get(src, dst)
         if not paths:
             return []
 
-        path_loads = []
-        for path in paths:
-            total_load = sum(self.port_stats.get(path[i], {}).get(
-                self.graph[path[i]][path[i + 1]]['port'], 0)
-                for i in range(len(path) - 1))
-            path_loads.append((total_load, path))
-
-        if all(load > self.UTILIZATION_THRESHOLD for load, _ in path_loads):
-            selected_path = min(path_loads, key=lambda x: x[0])[1]
-            self.logger.info("[PATH] Adaptive ECMP selected: %s", selected_path)
-            print("[ECMP_MODE] Using Adaptive ECMP")
+        loads = self.path_scorer.scores(src, dst, paths)
+        if (loads > self.UTILIZATION_THRESHOLD).all():
+            selected_path = paths[int(loads.argmin())]
+            spill = self._spill_path(src, dst, float(loads.min()))
+            if spill is not None:
+                selected_path = spill[0]
+                self.events.emit('path', 'ucmp', selected_path)
+            else:
+                self.events.emit('path', 'adaptive', selected_path)
         else:
-            selected_path = random.choice(paths)
-            self.logger.info("[PATH] Traditional ECMP selected: %s", selected_path)
-            print("[ECMP_MODE] Using Traditional ECMP")
+            selected_path = self.path_selector.select(paths, flow, src) if flow else paths[0]
+            self.events.emit('path', 'traditional', selected_path)
 
         return selected_path
 
+    def _spill_path(self, src, dst, best_load, avoid=frozenset()):
+        # A longer path within the stretch bound, only if it beats best_load
+        # (the least loaded equal-cost path); None otherwise
+        if not self.UCMP_EXTRA_PATHS:
+            return None
+        if self.compute_pool is None:
+            paths = self.k_paths.get(src, dst)
+        elif self.k_paths.cached(src, dst):
+            paths = self.k_paths.get(src, dst)
+        else:
+            # Yen runs on a snapshot off the hub; until it is back the flow
+            # keeps its equal-cost choice
+            self._compute_k_paths(src, dst)
+            return None
+        if not paths or len(paths[-1]) == len(paths[0]):
+            return None
+        loads = self.ucmp_scorer.scores(src, dst, paths)
+        usable = [i for i, path in enumerate(paths) if not avoid.intersection(zip(path, path[1:]))]
+        if not usable:
+            return None
+        best = min(usable, key=lambda i: loads[i])
+        if len(paths[best]) == len(paths[0]) or loads[best] >= best_load:
+            return None
+        return paths[best], float(loads[best])
+
+    def _compute_k_paths(self, src, dst):
+        if (src, dst) in self._k_paths_pending:
+            return
+        version = self.topology.version
+
+        def done(paths):
+            self._k_paths_pending.discard((src, dst))
+            self.k_paths.put(src, dst, paths, version)
+
+        def failed(exc):
+            self._k_paths_pending.discard((src, dst))
+            self.logger.warning("[UCMP] Computing paths %s -> %s failed: %r", src, dst, exc)
+
+        args = (self._graph_snapshot(), src, dst, self.k_paths.extra, self.k_paths.max_stretch)
+        if self.compute_pool.submit(unequal_cost_paths, args, on_done=done, on_error=failed, kind="ucmp"):
+            self._k_paths_pending.add((src, dst))
+
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @timed('packet_in')
     def packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
@@ -609,85 +973,341 @@ class DynamicECMP(app_manager.RyuApp):
         dpid = datapath.id
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        arp_pkt = pkt.get_protocol(arp.arp)
-        ip_pkt = pkt.get_protocol(ipv4.ipv4)
+        eth, arp_pkt, ip_pkt = parse_headers(msg.data, fast=self.FAST_PARSER)
 
         dst_mac = eth.dst
         src_mac = eth.src
 
-        self.mac_to_port.setdefault(dpid, {})
-        self.mac_to_port[dpid][src_mac] = in_port
+        if self.topology.is_edge_port(dpid, in_port):
+            src_ip = arp_pkt.src_ip if arp_pkt else (ip_pkt.src if ip_pkt else None)
+            known = self.hosts.lookup(src_mac)
+            moved_from = self.hosts.learn(src_mac, dpid, in_port, ip=src_ip)
+            if src_ip:
+                self.arp_proxy.learn(src_ip, src_mac)
+            if moved_from is not None:
+                self.logger.info("[HOST] %s moved from %s to %s", src_mac, moved_from, (dpid, in_port))
+            if self.PROACTIVE and (known is None or moved_from is not None):
+                self._provision_host(src_mac, src_ip, dpid, in_port)
 
-        self.logger.info("[PKTIN] sw=%s in_port=%s src=%s dst=%s", dpid, in_port, src_mac, dst_mac)
+        self.events.emit('pktin', dpid, in_port, src_mac, dst_mac)
 
         # Handle ARP packets
         if arp_pkt:
-            self.logger.info("[ARP] Handling ARP packet %s -> %s", arp_pkt.src_ip, arp_pkt.dst_ip)
-            actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
-            out = parser.OFPPacketOut(datapath=datapath,
-                                      buffer_id=ofproto.OFP_NO_BUFFER,
-                                      in_port=in_port,
-                                      actions=actions,
-                                      data=msg.data)
-            datapath.send_msg(out)
+            self._handle_arp(msg, in_port, eth, arp_pkt)
             return
 
         if not ip_pkt:
             return  # Ignore non-IP packets (e.g., LLDP)
 
         # Find destination switch
-        dst_dpid = None
-        for sw_id, mac_table in self.mac_to_port.items():
-            if dst_mac in mac_table:
-                dst_dpid = sw_id
-                break
+        location = self.hosts.lookup(dst_mac)
+        if location is None:
+            self._flood_edge(dpid, in_port, msg.data)
+            self.events.emit('flood', dpid, dst_mac)
+            return
+
+        if self.FORWARDING_MODE == 'destination' or self.PROACTIVE:
+            self._forward_by_destination(msg, in_port, dst_mac, ip_pkt.dst, location)
+            return
+
+        # Later packets of a flow that is still being installed only wait for it
+        key = (('eth_src', src_mac), ('eth_dst', dst_mac))
+        if not self.pending_flows.begin(key, (datapath, in_port, msg.buffer_id, msg.data)):
+            self.logger.debug("[FLOW] %s -> %s already being installed, packet queued", src_mac, dst_mac)
+            return
+
+        dst_dpid = location[0]
+        resume = (msg, in_port, key, src_mac, dst_mac, location, HostPair(src_mac, dst_mac))
+        if dst_dpid == dpid or self.compute_pool is None or self.path_cache.cached(dpid, dst_dpid):
+            self._program_flow(*resume)
+            return
+
+        # Path cache miss: compute the equal-cost set off the hub and finish
+        # the install when it comes back. A full pool means computing inline.
+        version = self.topology.version
+
+        def paths_ready(paths):
+            if self.topology.version == version:
+                self.path_cache.put(dpid, dst_dpid, paths)
+            self._program_flow(*resume)
+
+        def failed(exc):
+            self.logger.warning("[PATH] Path computation %s -> %s failed: %r", dpid, dst_dpid, exc)
+            self.pending_flows.discard(key)
 
-        if dst_dpid is None:
-            actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
+        if not self.compute_pool.submit(shortest_paths, (self._graph_snapshot(), dpid, dst_dpid),
+                                        on_done=paths_ready, on_error=failed, kind="path"):
+            self._program_flow(*resume)
+
+    @timed('program_flow')
+    def _program_flow(self, msg, in_port, key, src_mac, dst_mac, location, flow_key):
+        datapath = msg.datapath
+        parser = datapath.ofproto_parser
+        ofproto = datapath.ofproto
+        dpid = datapath.id
+        dst_dpid, dst_port = location
+        if dpid not in self.datapaths:
+            self.pending_flows.discard(key)
+            return
+        if dst_dpid == dpid:
+            path = [dpid]
+        else:
+            path = self._get_best_path(dpid, dst_dpid, flow_key)
+            if not path or len(path) < 2 or any(sw not in self.datapaths for sw in path):
+                self.logger.warning("[PATH] Invalid path from %s to %s", dpid, dst_dpid)
+                self.pending_flows.discard(key)
+                return
+
+        flow = self.flow_registry.add(src_mac, dst_mac, path, self.FLOW_PRIORITY)
+        hops, out_ports = self._path_rules(path, src_mac, dst_mac, dst_port, flow.cookie)
+
+        # Forward the current packet along the first hop once the path is committed
+        def release():
+            self._release_queued(self.pending_flows.release(key)[1:])
+            actions = [parser.OFPActionOutput(out_ports[0])]
             out = parser.OFPPacketOut(datapath=datapath,
                                       buffer_id=msg.buffer_id,
                                       in_port=in_port,
                                       actions=actions,
                                       data=msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None)
             datapath.send_msg(out)
-            self.logger.info("[FLOOD] Unknown dst MAC, flooding")
-            return
-
-        path = self._get_best_path(dpid, dst_dpid)
-        if not path or len(path) < 2:
-            self.logger.warning("[PATH] Invalid path from %s to %s", dpid, dst_dpid)
-            return
-
-        # Install flow on each switch in path
-        for i in range(len(path) - 1):
-            curr_sw = path[i]
-            next_sw = path[i + 1]
-            out_port = self.graph[curr_sw][next_sw]['port']
+            self.events.emit('forward', dpid, src_mac, dst_mac, out_ports[0])
+
+        self.pending_flows.set_cost(key, len(hops))
+        self.flow_programmer.install_path(hops, release)
+        self.events.emit('flow', path, src_mac, dst_mac, out_ports)
+
+    def _path_rules(self, path, src_mac, dst_mac, dst_port, cookie):
+        # One rule per switch on the path, ending at the host's edge port. The
+        # cookie ties every rule (and its OFPFlowRemoved) to the registry entry.
+        hops = []
+        out_ports = []
+        for i, curr_sw in enumerate(path):
+            if i + 1 < len(path):
+                out_port = self.graph[curr_sw][path[i + 1]]['port']
+            else:
+                out_port = dst_port
             dp = self.datapaths[curr_sw]
             match = dp.ofproto_parser.OFPMatch(eth_src=src_mac, eth_dst=dst_mac)
             actions = [dp.ofproto_parser.OFPActionOutput(out_port)]
             inst = [dp.ofproto_parser.OFPInstructionActions(dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
             mod = dp.ofproto_parser.OFPFlowMod(
                 datapath=dp,
-                priority=10,
+                cookie=cookie,
+                priority=self.FLOW_PRIORITY,
                 match=match,
                 instructions=inst,
-                idle_timeout=10,
-                hard_timeout=30
+                idle_timeout=self.FLOW_IDLE_TIMEOUT,
+                hard_timeout=self.FLOW_HARD_TIMEOUT,
+                flags=dp.ofproto.OFPFF_SEND_FLOW_REM
+            )
+            hops.append((dp, mod))
+            out_ports.append(out_port)
+        return hops, out_ports
+
+    def _reroute(self, links, reason, budget=None):
+        # Only the flows installed across the failed or congested links are
+        # re-planned, highest priority first; everything else stays put.
+        moved = 0
+        hold_down = self.REROUTE_HOLD_DOWN if reason == "congestion" else 0
+        for flow in self.flow_registry.affected(links, hold_down=hold_down):
+            if budget is not None and moved >= budget:
+                break
+            if self._reroute_flow(flow, set(links), reason):
+                moved += 1
+        if moved:
+            self.logger.info("[FLOW] Rerouted %s flows off %s (%s), %s",
+                             moved, list(links), reason, self.flow_registry.counters)
+
+    def _reroute_flow(self, flow, avoid, reason):
+        ingress, src_mac, dst_mac = flow.ingress, flow.src, flow.dst
+        location = self.hosts.lookup(dst_mac)
+        if location is None or ingress not in self.datapaths:
+            return False
+        dst_dpid, dst_port = location
+        paths = self.path_cache.get(ingress, dst_dpid)
+        candidates = [i for i, path in enumerate(paths) if not avoid.intersection(zip(path, path[1:]))]
+        path, load = None, float("inf")
+        if candidates:
+            loads = self.path_scorer.scores(ingress, dst_dpid, paths)
+            best = min(candidates, key=lambda i: loads[i])
+            path, load = paths[best], float(loads[best])
+        if load > self.UTILIZATION_THRESHOLD:
+            # Every usable equal-cost path is congested (or none is left)
+            spill = self._spill_path(ingress, dst_dpid, load, avoid)
+            if spill is not None:
+                path, load = spill
+        if path is None or path == flow.path or (reason == "congestion" and load > self.REROUTE_THRESHOLD):
+            return False
+        if any(dpid not in self.datapaths for dpid in path):
+            return False
+
+        hops, _ = self._path_rules(path, src_mac, dst_mac, dst_port, flow.cookie)
+        self.flow_programmer.push(hops[::-1])
+        for dpid in self.flow_registry.reroute(flow.cookie, path):
+            dp = self.datapaths.get(dpid)
+            if dp is None:
+                continue
+            mod = dp.ofproto_parser.OFPFlowMod(
+                datapath=dp,
+                cookie=flow.cookie,
+                cookie_mask=0xFFFFFFFFFFFFFFFF,
+                command=dp.ofproto.OFPFC_DELETE_STRICT,
+                priority=self.FLOW_PRIORITY,
+                out_port=dp.ofproto.OFPP_ANY,
+                out_group=dp.ofproto.OFPG_ANY,
+                match=dp.ofproto_parser.OFPMatch(eth_src=src_mac, eth_dst=dst_mac)
             )
             dp.send_msg(mod)
-            self.logger.info("[FLOW] Installed on sw=%s: %s → %s via port %s",
-                             curr_sw, src_mac, dst_mac, out_port)
-
-        # Forward the current packet along the first hop
-        out_port = self.graph[dpid][path[1]]['port']
-        actions = [parser.OFPActionOutput(out_port)]
-        out = parser.OFPPacketOut(datapath=datapath,
-                                  buffer_id=msg.buffer_id,
-                                  in_port=in_port,
-                                  actions=actions,
-                                  data=msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None)
-        datapath.send_msg(out)
-        self.logger.info("[FORWARD] Packet forwarded from %s to %s via port %s", src_mac, dst_mac, out_port)
+        self.logger.info("[PATH] %s -> %s moved to %s (%s)", src_mac, dst_mac, list(path), reason)
+        return True
+
+    def _handle_arp(self, msg, in_port, eth, arp_pkt):
+        datapath = msg.datapath
+        parser = datapath.ofproto_parser
+        ofproto = datapath.ofproto
+        if self.topology.is_edge_port(datapath.id, in_port):
+            self.arp_proxy.learn(arp_pkt.src_ip, arp_pkt.src_mac)
+
+        if arp_pkt.opcode == arp.ARP_REQUEST:
+            reply = self.arp_proxy.reply_for(arp_pkt.src_mac, arp_pkt.src_ip, arp_pkt.dst_ip)
+            if reply is not None:
+                actions = [parser.OFPActionOutput(in_port)]
+                out = parser.OFPPacketOut(datapath=datapath,
+                                          buffer_id=ofproto.OFP_NO_BUFFER,
+                                          in_port=ofproto.OFPP_CONTROLLER,
+                                          actions=actions,
+                                          data=reply)
+                datapath.send_msg(out)
+                self.events.emit('arp_reply', datapath.id, arp_pkt.dst_ip, arp_pkt.src_ip)
+                return
+
+        # Replies go straight to the requester; cache misses are flooded on
+        # host-facing ports only, so they never cross (or loop through) the spines
+        location = self.hosts.lookup(eth.dst)
+        if location is not None:
+            self._send_to_host(location, msg.data)
+        else:
+            self._flood_edge(datapath.id, in_port, msg.data)
+            self.events.emit('arp_flood', datapath.id, arp_pkt.dst_ip)
+
+    def _send_to_host(self, location, data):
+        dpid, port = location
+        dp = self.datapaths.get(dpid)
+        if dp is None:
+            return
+        out = dp.ofproto_parser.OFPPacketOut(datapath=dp,
+                                             buffer_id=dp.ofproto.OFP_NO_BUFFER,
+                                             in_port=dp.ofproto.OFPP_CONTROLLER,
+                                             actions=[dp.ofproto_parser.OFPActionOutput(port)],
+                                             data=data)
+        dp.send_msg(out)
+
+    def _flood_edge(self, ingress_dpid, in_port, data):
+        for dpid, dp in self.datapaths.items():
+            ports = [port for port in self.broadcast_tree.host_ports(dpid)
+                     if not (dpid == ingress_dpid and port == in_port)]
+            if not ports:
+                continue
+            actions = [dp.ofproto_parser.OFPActionOutput(port) for port in ports]
+            out = dp.ofproto_parser.OFPPacketOut(datapath=dp,
+                                                 buffer_id=dp.ofproto.OFP_NO_BUFFER,
+                                                 in_port=dp.ofproto.OFPP_CONTROLLER,
+                                                 actions=actions,
+                                                 data=data)
+            dp.send_msg(out)
+
+    def _forward_by_destination(self, msg, in_port, dst_mac, dst_ip, location):
+        datapath = msg.datapath
+        parser = datapath.ofproto_parser
+        ofproto = datapath.ofproto
+        dpid = datapath.id
+        dst_dpid, dst_port = location
+
+        key = self.dst_forwarding.host_match(dst_mac, dst_ip)
+        if not self.pending_flows.begin(key, (datapath, in_port, msg.buffer_id, msg.data)):
+            self.logger.debug("[FLOW] Rules for %s already being installed, packet queued", dst_mac)
+            return
+
+        per_switch, distance = self.dst_forwarding.plan(
+            dst_mac, dst_ip, dst_dpid, dst_port, force=(dpid,), switches=self.datapaths)
+        if dpid not in distance:
+            self.logger.warning("[PATH] No route from %s to %s", dpid, dst_dpid)
+            self.pending_flows.discard(key)
+            return
+
+        # Ingress first, then the rest farthest-first so they are sent egress-first
+        hops = [(datapath, self.dst_forwarding.build(datapath, per_switch.pop(dpid, [])))]
+        for sw in sorted(per_switch, key=distance.get, reverse=True):
+            dp = self.datapaths[sw]
+            hops.append((dp, self.dst_forwarding.build(dp, per_switch[sw])))
+
+        group_id, out_port = self.dst_forwarding.first_hop(dpid, dst_dpid, dst_port)
+
+        def release():
+            self._release_queued(self.pending_flows.release(key)[1:])
+            if group_id is not None:
+                actions = [parser.OFPActionGroup(group_id)]
+            else:
+                actions = [parser.OFPActionOutput(out_port)]
+            out = parser.OFPPacketOut(datapath=datapath,
+                                      buffer_id=msg.buffer_id,
+                                      in_port=in_port,
+                                      actions=actions,
+                                      data=msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None)
+            datapath.send_msg(out)
+
+        self.pending_flows.set_cost(key, sum(len(mods) for _, mods in hops))
+        self.flow_programmer.install_path(hops, release)
+        self.logger.info("[FLOW] Destination rules for %s behind sw=%s pushed to %s switches",
+                         dst_mac, dst_dpid, len(hops))
+
+    def _release_queued(self, packets):
+        # Packets coalesced into an install go back through the flow table,
+        # which now holds their rule
+        for dp, in_port, buffer_id, data in packets:
+            ofproto = dp.ofproto
+            out = dp.ofproto_parser.OFPPacketOut(datapath=dp,
+                                                 buffer_id=buffer_id,
+                                                 in_port=in_port,
+                                                 actions=[dp.ofproto_parser.OFPActionOutput(ofproto.OFPP_TABLE)],
+                                                 data=data if buffer_id == ofproto.OFP_NO_BUFFER else None)
+            dp.send_msg(out)
+        if packets:
+            self.events.emit('released', len(packets))
+
+    def _provision_host(self, mac, ip, dpid, port):
+        per_switch, distance = self.dst_forwarding.plan(mac, ip, dpid, port, switches=self.datapaths)
+        hops = [(self.datapaths[sw], self.dst_forwarding.build(self.datapaths[sw], per_switch[sw]))
+                for sw in sorted(per_switch, key=distance.get)]
+        self.flow_programmer.push(hops)
+        if hops:
+            self.logger.info("[PROACTIVE] Rules for %s behind sw=%s pushed to %s switches",
+                             mac, dpid, len(hops))
+
+    def _repair_forwarding(self):
+        # Re-plan every known destination; only groups and rules whose next
+        # hops changed are re-sent.
+        for mac, (dpid, port) in list(self.hosts.items()):
+            self._provision_host(mac, self.hosts.ip_of(mac), dpid, port)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    @timed('barrier')
+    def _barrier_reply_handler(self, ev):
+        self.flow_programmer.barrier_reply(ev.msg.datapath.id, ev.msg.xid)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    @timed('flow_removed')
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        if msg.priority == self.dst_forwarding.priority:
+            # The next plan for this destination re-sends it, on every switch
+            # where it idled out, instead of one packet-in per hop
+            if self.dst_forwarding.removed(msg.datapath.id, msg.match.items()):
+                self.logger.debug("[FLOW] Destination rule %s on %s removed (reason %s)",
+                                  dict(msg.match.items()), msg.datapath.id, msg.reason)
+            return
+        flow = self.flow_registry.removed(msg.datapath.id, msg.cookie)
+        if flow is not None:
+            self.logger.debug("[FLOW] %s -> %s on %s removed (reason %s)",
+                              flow.src, flow.dst, list(flow.path), msg.reason)
@@ -0,0 +1,102 @@
+"""
+Controller-side ARP responder backed by an IP -> MAC cache learned from packet-ins.
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+ETH_TYPE_ARP = 0x0806
+ARP_REQUEST = 1
+ARP_REPLY = 2
+UNSPECIFIED_IP = "0.0.0.0"
+
+_ARP_HEADER = struct.Struct("!HHBBH6s4s6s4s")
+
+
+def _mac_bytes(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(":", ""))
+
+
+def build_arp_reply(target_mac: str, target_ip: str, requester_mac: str, requester_ip: str) -> bytes:
+    """Ethernet + ARP reply telling ``requester`` that ``target_ip`` is at ``target_mac``."""
+    eth = _mac_bytes(requester_mac) + _mac_bytes(target_mac) + struct.pack("!H", ETH_TYPE_ARP)
+    arp = _ARP_HEADER.pack(1, 0x0800, 6, 4, ARP_REPLY,
+                           _mac_bytes(target_mac), socket.inet_aton(target_ip),
+                           _mac_bytes(requester_mac), socket.inet_aton(requester_ip))
+    return eth + arp
+
+
+@dataclass
+class Binding:
+    mac: str
+    last_seen: float
+
+
+class ArpProxy:
+    """Answers ARP requests for known hosts so they never need to be flooded.
+
+    Bindings are learned from ARP sender fields and from IPv4 packet-ins
+    received on edge ports. Requests for unknown targets, probes
+    (sender IP 0.0.0.0) and gratuitous ARPs are left to the caller to flood.
+    """
+
+    def __init__(self, max_age: float = 300.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_age = max_age
+        self.clock = clock
+        self._bindings: Dict[str, Binding] = {}
+        self.counters = {"requests": 0, "answered": 0, "missed": 0, "learned": 0, "rebound": 0}
+
+    def __len__(self) -> int:
+        return len(self._bindings)
+
+    def learn(self, ip: str, mac: str, now: Optional[float] = None) -> bool:
+        """Record ``ip`` -> ``mac``; returns True if the binding is new or changed."""
+        if not ip or ip == UNSPECIFIED_IP:
+            return False
+        now = self.clock() if now is None else now
+        binding = self._bindings.get(ip)
+        if binding is None:
+            self._bindings[ip] = Binding(mac, now)
+            self.counters["learned"] += 1
+            return True
+        binding.last_seen = now
+        if binding.mac != mac:
+            binding.mac = mac
+            self.counters["rebound"] += 1
+            return True
+        return False
+
+    def resolve(self, ip: str, now: Optional[float] = None) -> Optional[str]:
+        binding = self._bindings.get(ip)
+        if binding is None:
+            return None
+        now = self.clock() if now is None else now
+        if now - binding.last_seen > self.max_age:
+            del self._bindings[ip]
+            return None
+        return binding.mac
+
+    def reply_for(self, requester_mac: str, requester_ip: str, target_ip: str) -> Optional[bytes]:
+        """The reply frame for a request, or None if it has to be flooded."""
+        self.counters["requests"] += 1
+        if requester_ip in (UNSPECIFIED_IP, target_ip):
+            self.counters["missed"] += 1
+            return None
+        target_mac = self.resolve(target_ip)
+        if target_mac is None:
+            self.counters["missed"] += 1
+            return None
+        self.counters["answered"] += 1
+        return build_arp_reply(target_mac, target_ip, requester_mac, requester_ip)
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        now = self.clock() if now is None else now
+        stale = [ip for ip, b in self._bindings.items() if now - b.last_seen > self.max_age]
+        for ip in stale:
+            del self._bindings[ip]
+        return stale
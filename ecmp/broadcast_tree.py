@@ -0,0 +1,214 @@
+"""
+Loop-free flooding: a spanning tree over the switch graph, repaired one link event at a time.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Callable, Container, Dict, Iterable, Optional, Set, Tuple
+
+import networkx as nx
+
+
+class BroadcastTree:
+    """Spanning forest of the bidirectional inter-switch links.
+
+    A switch floods on its tree ports and its edge (host-facing) ports only,
+    so every broadcast reaches each switch exactly once. Subscribed to a
+    :class:`~ecmp.topology.Topology`, the tree is patched locally: a new link
+    joins two trees if it connects them, a removed tree link is replaced by
+    any other link reconnecting the two halves, and only the switches whose
+    flood ports changed are reported by :meth:`take_changed`.
+
+    A port without a discovered link is only flooded as a host port once it
+    has been without one for ``settle`` seconds: the ports of a switch that
+    just joined, and both ends of a link that just went away, may still be
+    wired to other switches that LLDP has not (re)discovered yet, and
+    flooding on them would loop broadcasts through the spines. A joining
+    switch is held until ``settle`` seconds pass without a new link on it.
+    """
+
+    def __init__(self, topology, settle: float = 0.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.topology = topology
+        self.graph: nx.DiGraph = topology.graph
+        self.settle = settle
+        self.clock = clock
+        self._adj: Dict[int, Set[int]] = {node: set() for node in self.graph}
+        self._changed: Set[int] = set(self.graph)
+        # Held back from flooding until the given clock time: whole switches
+        # (no port known to be host-facing yet) and single ports
+        self._held_switches: Dict[int, float] = {}
+        self._held_ports: Dict[Tuple[int, int], float] = {}
+        self.counters = {"joins": 0, "replacements": 0, "splits": 0, "rebuilds": 0}
+        self._rebuild(list(self.graph))
+
+    def __contains__(self, edge: Tuple[int, int]) -> bool:
+        src, dst = edge
+        return dst in self._adj.get(src, ())
+
+    def edges(self) -> Set[Tuple[int, int]]:
+        return {(a, b) for a, nbrs in self._adj.items() for b in nbrs if a < b}
+
+    def tree_ports(self, dpid: int) -> Tuple[int, ...]:
+        return tuple(sorted(self.graph[dpid][nbr]["port"] for nbr in self._adj.get(dpid, ())))
+
+    def host_ports(self, dpid: int) -> Tuple[int, ...]:
+        """Edge ports of ``dpid`` that have gone ``settle`` seconds without a discovered link."""
+        if dpid in self._held_switches:
+            return ()
+        return tuple(port for port in self.topology.edge_ports(dpid) if (dpid, port) not in self._held_ports)
+
+    def flood_ports(self, dpid: int) -> Tuple[int, ...]:
+        """Ports a broadcast entering ``dpid`` is copied to (the ingress port is skipped by the switch)."""
+        return tuple(sorted(set(self.tree_ports(dpid)) | set(self.host_ports(dpid))))
+
+    def settling(self) -> bool:
+        """True while some ports are still held back from flooding."""
+        return bool(self._held_switches or self._held_ports)
+
+    def take_changed(self, ready: Optional[Container[int]] = None) -> Set[int]:
+        """Switches whose flood ports changed since the last call, including
+        those whose held ports have settled by now.
+
+        Switches not in ``ready`` (e.g. not connected yet) stay pending.
+        """
+        self._release_settled()
+        changed = {dpid for dpid in self._changed if dpid in self.graph}
+        if ready is not None:
+            changed = {dpid for dpid in changed if dpid in ready}
+        self._changed -= changed
+        self._changed &= set(self.graph)
+        return changed
+
+    # Topology listener callbacks
+
+    def switch_added(self, dpid: int) -> None:
+        self._adj.setdefault(dpid, set())
+        self._changed.add(dpid)
+        if self.settle > 0:
+            self._held_switches[dpid] = self.clock() + self.settle
+
+    def switch_removed(self, dpid: int) -> None:
+        self._held_switches.pop(dpid, None)
+        for key in [key for key in self._held_ports if key[0] == dpid]:
+            del self._held_ports[key]
+        nbrs = self._adj.pop(dpid, set())
+        for nbr in nbrs:
+            self._adj[nbr].discard(dpid)
+        self._changed.update(nbrs)
+        if len(nbrs) > 1:
+            # The switch was an inner node; its neighbours' subtrees are now
+            # disconnected and are reattached without it.
+            self._rebuild(self._component_of(nbrs, exclude=dpid), exclude=dpid)
+
+    def link_added(self, src: int, dst: int) -> None:
+        # Edge ports may have turned into link ports even if the tree stays
+        self._changed.update((src, dst))
+        # Discovery of a joining switch is still going on
+        for dpid in (src, dst):
+            if dpid in self._held_switches:
+                self._held_switches[dpid] = self.clock() + self.settle
+        if self._bidirectional(src, dst) and dst not in self._reachable(src):
+            self._join(src, dst)
+            self.counters["joins"] += 1
+
+    def link_removed(self, src: int, dst: int) -> None:
+        self._changed.update((src, dst))
+        if self.settle > 0:
+            # The cable may just be re-plugged: its ends are not host ports yet
+            until = self.clock() + self.settle
+            attrs = self.graph[src][dst]
+            for key in ((src, attrs.get("port")), (dst, attrs.get("dst_port"))):
+                if key[1] is not None:
+                    self._held_ports[key] = until
+        if dst not in self._adj.get(src, ()):
+            return
+        self._adj[src].discard(dst)
+        self._adj[dst].discard(src)
+        self.counters["splits"] += 1
+        # The graph still holds (src, dst) and possibly (dst, src) during this
+        # callback, so that pair is excluded from the search.
+        side = self._reachable(src)
+        replacement = self._crossing_link(side, skip=(src, dst))
+        if replacement is not None:
+            self._join(*replacement)
+            self._changed.update(replacement)
+            self.counters["replacements"] += 1
+
+    # Internals
+
+    def _release_settled(self) -> None:
+        if not self.settling():
+            return
+        now = self.clock()
+        for dpid in [dpid for dpid, until in self._held_switches.items() if until <= now]:
+            del self._held_switches[dpid]
+            self._changed.add(dpid)
+        for key in [key for key, until in self._held_ports.items() if until <= now]:
+            del self._held_ports[key]
+            self._changed.add(key[0])
+
+    def _bidirectional(self, a: int, b: int) -> bool:
+        return self.graph.has_edge(a, b) and self.graph.has_edge(b, a)
+
+    def _join(self, a: int, b: int) -> None:
+        self._adj.setdefault(a, set()).add(b)
+        self._adj.setdefault(b, set()).add(a)
+
+    def _reachable(self, root: int) -> Set[int]:
+        seen = {root}
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for nbr in self._adj.get(node, ()):
+                if nbr not in seen:
+                    seen.add(nbr)
+                    queue.append(nbr)
+        return seen
+
+    def _crossing_link(self, side: Set[int], skip: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        for node in sorted(side):
+            for nbr in sorted(self.graph.successors(node)):
+                if nbr in side or {node, nbr} == set(skip):
+                    continue
+                if self._bidirectional(node, nbr):
+                    return node, nbr
+        return None
+
+    def _component_of(self, roots: Iterable[int], exclude: int) -> Set[int]:
+        seen: Set[int] = set()
+        queue = deque(root for root in roots if root != exclude)
+        seen.update(queue)
+        while queue:
+            node = queue.popleft()
+            for nbr in self.graph.successors(node):
+                if nbr != exclude and nbr not in seen:
+                    seen.add(nbr)
+                    queue.append(nbr)
+        return seen
+
+    def _rebuild(self, nodes: Iterable[int], exclude: Optional[int] = None) -> None:
+        """BFS spanning forest over ``nodes``, replacing their current tree edges."""
+        nodes = set(nodes)
+        for node in nodes:
+            for nbr in self._adj.get(node, set()) - nodes:
+                self._adj[nbr].discard(node)
+            self._adj[node] = set()
+        self._changed.update(nodes)
+        seen: Set[int] = set()
+        for root in sorted(nodes):
+            if root in seen:
+                continue
+            seen.add(root)
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for nbr in sorted(self.graph.successors(node)):
+                    if nbr in seen or nbr == exclude or nbr not in nodes:
+                        continue
+                    if self._bidirectional(node, nbr):
+                        seen.add(nbr)
+                        self._join(node, nbr)
+                        queue.append(nbr)
+        self.counters["rebuilds"] += 1
@@ -0,0 +1,203 @@
+"""
+Worker threads for path computation and optimization jobs, with results applied on the hub.
+"""
+
+from __future__ import annotations
+
+import functools
+import itertools
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Sequence
+
+import numpy as np
+
+
+def _native(module: str):
+    """``threading``/``queue`` as the OS provides them, even under eventlet's monkey patching.
+
+    ryu-manager patches both, which turns threads into green threads that
+    run on (and block) the hub.
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return __import__(module)
+    return patcher.original(module)
+
+
+class LatencyStats:
+    """Count, mean and tail percentiles over the last ``window`` samples (seconds)."""
+
+    def __init__(self, window: int = 1024) -> None:
+        self._samples = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self._samples[self.count % len(self._samples)] = seconds
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self) -> Dict[str, float]:
+        """Milliseconds; percentiles cover the retained window only."""
+        if not self.count:
+            return {"count": 0}
+        recent = self._samples[:min(self.count, len(self._samples))]
+        p50, p99 = np.percentile(recent, (50, 99))
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3),
+            "p50_ms": round(float(p50) * 1e3, 3),
+            "p99_ms": round(float(p99) * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+        }
+
+
+class HandlerMetrics:
+    """Named :class:`LatencyStats`, e.g. per event handler and per job queue stage."""
+
+    def __init__(self, window: int = 1024, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.window = window
+        self.clock = clock
+        self._stats: Dict[str, LatencyStats] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = LatencyStats(self.window)
+        stats.add(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.summary() for name, stats in sorted(self._stats.items())}
+
+
+def timed(name: str, metrics: str = "handler_metrics"):
+    """Record a method's wall time in ``self.<metrics>`` under ``name``.
+
+    Goes below ``@set_ev_cls`` so Ryu registers the timed wrapper.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            registry = getattr(self, metrics)
+            start = registry.clock()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                registry.record(name, registry.clock() - start)
+        return wrapper
+    return decorate
+
+
+class ComputePool:
+    """Runs jobs on native worker threads and applies their results on the caller's thread.
+
+    :meth:`submit` only enqueues; it returns False instead of blocking once
+    ``max_pending`` jobs are queued or running, so the hub can fall back
+    (e.g. compute inline) or shed the work. Workers push finished jobs onto
+    a result queue that :meth:`drain` empties on the hub, where ``on_done``
+    or ``on_error`` run and counters and metrics are updated, so nothing
+    but the two queues is shared with the workers. Jobs must only read what
+    they are given: pass snapshots (a frozen graph copy, arrays), not live
+    objects.
+
+    NumPy and other C code release the GIL, so such jobs run truly in
+    parallel; pure-Python jobs still share the GIL, but the hub gets a turn
+    every switch interval instead of waiting for the whole job.
+
+    Per ``kind`` the metrics record ``<kind>.queue_wait`` (submit to start),
+    ``<kind>.compute`` and ``<kind>.apply_wait`` (finish to applied on the hub).
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 256,
+                 metrics: Optional[HandlerMetrics] = None,
+                 clock: Callable[[], float] = time.perf_counter) -> None:
+        if workers < 1:
+            raise ValueError("workers must be positive")
+        self.max_pending = max_pending
+        self.clock = clock
+        self.metrics = metrics if metrics is not None else HandlerMetrics(clock=clock)
+        threading = _native("threading")
+        queue = _native("queue")
+        self._jobs = queue.Queue()
+        # deque.append/popleft are atomic, so workers and the hub share it without a lock
+        self._results: Deque[tuple] = deque()
+        self._ids = itertools.count(1)
+        self._pending = 0
+        self._closed = False
+        self.counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "applied": 0,
+        }
+        self._threads = [threading.Thread(target=self._work, name=f"compute-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Jobs submitted whose result has not been applied yet."""
+        return self._pending
+
+    def submit(self, function: Callable, args: Sequence = (), on_done: Optional[Callable] = None,
+               on_error: Optional[Callable] = None, kind: str = "job") -> bool:
+        """Queue ``function(*args)``; ``on_done(result)`` runs in a later :meth:`drain`."""
+        if self._closed or self._pending >= self.max_pending:
+            self.counters["rejected"] += 1
+            return False
+        self._pending += 1
+        self.counters["submitted"] += 1
+        self._jobs.put((next(self._ids), kind, function, args, on_done, on_error, self.clock()))
+        return True
+
+    def drain(self, limit: Optional[int] = None) -> int:
+        """Apply finished jobs on the calling thread; returns how many were applied."""
+        applied = 0
+        while self._results and (limit is None or applied < limit):
+            kind, ok, value, callback, submitted, started, finished = self._results.popleft()
+            self._pending -= 1
+            self.counters["completed" if ok else "failed"] += 1
+            self.metrics.record(f"{kind}.queue_wait", started - submitted)
+            self.metrics.record(f"{kind}.compute", finished - started)
+            self.metrics.record(f"{kind}.apply_wait", self.clock() - finished)
+            if callback is not None:
+                callback(value)
+            self.counters["applied"] += 1
+            applied += 1
+        return applied
+
+    def run(self, sleep: Callable[[float], None], interval: float = 0.005) -> None:
+        """Apply loop for a ``hub.spawn``-ed thread."""
+        while not self._closed:
+            self.drain()
+            sleep(interval)
+
+    def shutdown(self) -> None:
+        self._closed = True
+        for _ in self._threads:
+            self._jobs.put(None)
+
+    def stats(self) -> Dict[str, object]:
+        return {"pending": self._pending, **self.counters, "latency": self.metrics.summary()}
+
+    def _work(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            _, kind, function, args, on_done, on_error, submitted = job
+            started = self.clock()
+            try:
+                value, ok = function(*args), True
+            except Exception as exc:  # handed to on_error on the hub
+                value, ok = exc, False
+            # Counters and metrics are only touched by drain(), on the hub
+            self._results.append((kind, ok, value, on_done if ok else on_error,
+                                  submitted, started, self.clock()))
@@ -0,0 +1,230 @@
+"""
+Destination-based forwarding: per-destination rules pointing at per-destination-leaf select groups.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+import networkx as nx
+
+MatchKey = Tuple[Tuple[str, object], ...]  # (field, value) pairs sorted by field name
+ETH_TYPE_IP = 0x0800
+
+
+@dataclass(frozen=True)
+class GroupEntry:
+    group_id: int
+    ports: Tuple[int, ...]
+    modify: bool = False
+    weights: Tuple[int, ...] = ()  # per port; empty means equal weights
+
+
+@dataclass(frozen=True)
+class FlowEntry:
+    match: MatchKey
+    group_id: Optional[int] = None
+    port: Optional[int] = None
+
+
+class DestinationForwarding:
+    """Plans forwarding state keyed on the destination only.
+
+    Every switch that can reach a destination leaf gets one select group for
+    that leaf, with a bucket per equal-cost next hop. Hosts behind the leaf
+    are then one rule each (``eth_dst`` or IPv4 /32) pointing at the group, or
+    a single rule per leaf when the leaf's IPv4 prefix is known. The
+    destination leaf itself forwards to the host port. Table occupancy grows
+    with the number of hosts instead of the number of host pairs.
+
+    Installed state is tracked so that re-planning only emits what changed.
+    Rules ask for ``OFPFF_SEND_FLOW_REM``; pass each removal to
+    :meth:`removed` so that a rule that idled out is planned again in full,
+    instead of each of its switches sending a packet-in on its own.
+    Bucket weights start out equal; :meth:`set_weights` re-weights an
+    installed group (e.g. from the traffic engineering optimizer) until its
+    next hops change.
+    """
+
+    def __init__(self, topology, match_on: str = "eth_dst",
+                 leaf_prefixes: Optional[Dict[int, Tuple[str, str]]] = None,
+                 priority: int = 20, idle_timeout: int = 300, group_base: int = 0x1000) -> None:
+        if match_on not in ("eth_dst", "ipv4_dst"):
+            raise ValueError(f"match_on must be 'eth_dst' or 'ipv4_dst', got {match_on!r}")
+        self.topology = topology
+        self.match_on = match_on
+        self.leaf_prefixes = leaf_prefixes or {}
+        self.priority = priority
+        self.idle_timeout = idle_timeout
+        self.group_base = group_base
+        self._group_ids: Dict[int, int] = {}
+        self._dags: Dict[int, Tuple[int, Dict[int, Tuple[int, ...]], Dict[int, int]]] = {}
+        self._groups: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        self._weights: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        self._flows: Dict[int, Dict[MatchKey, Tuple[Optional[int], Optional[int]]]] = {}
+
+    def group_id(self, dst_dpid: int) -> int:
+        group_id = self._group_ids.get(dst_dpid)
+        if group_id is None:
+            group_id = self.group_base + len(self._group_ids)
+            self._group_ids[dst_dpid] = group_id
+        return group_id
+
+    def destination_of(self, group_id: int) -> Optional[int]:
+        """Destination leaf whose traffic ``group_id`` spreads, if it is one of ours."""
+        for dst_dpid, gid in self._group_ids.items():
+            if gid == group_id:
+                return dst_dpid
+        return None
+
+    def next_hops(self, dst_dpid: int) -> Tuple[Dict[int, Tuple[int, ...]], Dict[int, int]]:
+        """Equal-cost egress ports towards ``dst_dpid`` for every switch, plus hop distances."""
+        cached = self._dags.get(dst_dpid)
+        if cached is not None and cached[0] == self.topology.version:
+            return cached[1], cached[2]
+
+        graph = self.topology.graph
+        if dst_dpid not in graph:
+            return {}, {}
+        distance = nx.single_source_shortest_path_length(graph.reverse(copy=False), dst_dpid)
+        hops = {}
+        for node, dist in distance.items():
+            if node == dst_dpid:
+                continue
+            hops[node] = tuple(sorted(attrs["port"] for nbr, attrs in graph[node].items()
+                                      if distance.get(nbr) == dist - 1))
+        self._dags[dst_dpid] = (self.topology.version, hops, distance)
+        return hops, distance
+
+    def host_match(self, dst_mac: str, dst_ip: Optional[str]) -> MatchKey:
+        if self.match_on == "ipv4_dst" and dst_ip:
+            return (("eth_type", ETH_TYPE_IP), ("ipv4_dst", dst_ip))
+        return (("eth_dst", dst_mac),)
+
+    def transit_match(self, dst_mac: str, dst_ip: Optional[str], dst_dpid: int) -> MatchKey:
+        """Match used on switches other than the destination leaf."""
+        prefix = self.leaf_prefixes.get(dst_dpid)
+        if prefix:
+            return (("eth_type", ETH_TYPE_IP), ("ipv4_dst", prefix))
+        return self.host_match(dst_mac, dst_ip)
+
+    def is_installed(self, dpid: int, match: MatchKey) -> bool:
+        return match in self._flows.get(dpid, ())
+
+    def removed(self, dpid: int, fields: Iterable[Tuple[str, object]]) -> bool:
+        """Forget a rule reported by ``OFPFlowRemoved`` (``fields`` as in ``msg.match.items()``).
+
+        False if it was not installed by this planner.
+        """
+        flows = self._flows.get(dpid)
+        return bool(flows) and flows.pop(tuple(sorted(fields)), None) is not None
+
+    def plan(self, dst_mac: str, dst_ip: Optional[str], dst_dpid: int, dst_port: int,
+             force: Container[int] = (), switches: Optional[Container[int]] = None
+             ) -> Tuple[Dict[int, List[object]], Dict[int, int]]:
+        """Entries each switch still needs for this destination, and hop distances.
+
+        Switches in ``force`` get their rule re-sent even if it is believed to
+        be installed (a packet-in from them proves otherwise). Only switches in
+        ``switches`` (default: all) are planned for.
+        """
+        hops, distance = self.next_hops(dst_dpid)
+        per_switch: Dict[int, List[object]] = {}
+        host_key = self.host_match(dst_mac, dst_ip)
+
+        if switches is None or dst_dpid in switches:
+            if self._set_flow(dst_dpid, host_key, None, dst_port) or dst_dpid in force:
+                per_switch[dst_dpid] = [FlowEntry(host_key, port=dst_port)]
+
+        group_id = self.group_id(dst_dpid)
+        key = self.transit_match(dst_mac, dst_ip, dst_dpid)
+        for sw, ports in hops.items():
+            if not ports or (switches is not None and sw not in switches):
+                continue
+            entries: List[object] = []
+            installed = self._groups.get((sw, group_id))
+            if installed != ports:
+                entries.append(GroupEntry(group_id, ports, modify=installed is not None))
+                self._groups[(sw, group_id)] = ports
+                self._weights.pop((sw, group_id), None)
+            if self._set_flow(sw, key, group_id, None) or sw in force:
+                entries.append(FlowEntry(key, group_id=group_id))
+            if entries:
+                per_switch[sw] = entries
+        return per_switch, distance
+
+    def first_hop(self, dpid: int, dst_dpid: int, dst_port: int) -> Tuple[Optional[int], Optional[int]]:
+        """(group_id, port) the ingress switch should send the triggering packet to."""
+        if dpid == dst_dpid:
+            return None, dst_port
+        return self.group_id(dst_dpid), None
+
+    def group_ports(self, dpid: int, dst_dpid: int) -> Tuple[int, ...]:
+        """Bucket ports of the installed group towards ``dst_dpid`` on ``dpid`` (empty if none)."""
+        group_id = self._group_ids.get(dst_dpid)
+        return self._groups.get((dpid, group_id), ()) if group_id is not None else ()
+
+    def set_weights(self, dpid: int, dst_dpid: int, weights: Tuple[int, ...]) -> Optional[GroupEntry]:
+        """Modify entry re-weighting an installed group, or None if it is unchanged or absent.
+
+        ``weights`` follow the order of :meth:`group_ports`.
+        """
+        key = (dpid, self._group_ids.get(dst_dpid))
+        ports = self._groups.get(key)
+        if ports is None or len(weights) != len(ports):
+            return None
+        current = self._weights.get(key) or (1,) * len(ports)
+        if tuple(weights) == current:
+            return None
+        self._weights[key] = tuple(weights)
+        return GroupEntry(key[1], ports, modify=True, weights=tuple(weights))
+
+    def forget_switch(self, dpid: int) -> None:
+        self._flows.pop(dpid, None)
+        for key in [key for key in self._groups if key[0] == dpid]:
+            del self._groups[key]
+            self._weights.pop(key, None)
+
+    def table_sizes(self) -> Dict[int, Tuple[int, int]]:
+        """Switch -> (flow entries, group entries) as installed by this planner."""
+        sizes: Dict[int, List[int]] = {}
+        for dpid, flows in self._flows.items():
+            sizes.setdefault(dpid, [0, 0])[0] = len(flows)
+        for dpid, _ in self._groups:
+            sizes.setdefault(dpid, [0, 0])[1] += 1
+        return {dpid: (flows, groups) for dpid, (flows, groups) in sizes.items()}
+
+    def build(self, datapath, entries: List[object]) -> list:
+        """OpenFlow 1.3 messages for planned entries, groups before the flows using them."""
+        parser = datapath.ofproto_parser
+        ofproto = datapath.ofproto
+        msgs = []
+        for entry in entries:
+            if isinstance(entry, GroupEntry):
+                weights = entry.weights or (1,) * len(entry.ports)
+                buckets = [parser.OFPBucket(weight=weight, watch_port=ofproto.OFPP_ANY,
+                                            watch_group=ofproto.OFPG_ANY,
+                                            actions=[parser.OFPActionOutput(port)])
+                           for port, weight in zip(entry.ports, weights)]
+                command = ofproto.OFPGC_MODIFY if entry.modify else ofproto.OFPGC_ADD
+                msgs.append(parser.OFPGroupMod(datapath, command, ofproto.OFPGT_SELECT,
+                                               entry.group_id, buckets))
+            else:
+                if entry.group_id is not None:
+                    actions = [parser.OFPActionGroup(entry.group_id)]
+                else:
+                    actions = [parser.OFPActionOutput(entry.port)]
+                inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+                msgs.append(parser.OFPFlowMod(datapath=datapath, priority=self.priority,
+                                              match=parser.OFPMatch(**dict(entry.match)),
+                                              instructions=inst, idle_timeout=self.idle_timeout,
+                                              flags=ofproto.OFPFF_SEND_FLOW_REM))
+        return msgs
+
+    def _set_flow(self, dpid: int, key: MatchKey, group_id: Optional[int], port: Optional[int]) -> bool:
+        flows = self._flows.setdefault(dpid, {})
+        if flows.get(key) == (group_id, port):
+            return False
+        flows[key] = (group_id, port)
+        return True
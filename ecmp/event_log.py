@@ -0,0 +1,211 @@
+"""
+Structured per-event logging off the hub: sampled, rate-limited JSONL records written by a background thread.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Mapping, Optional, Sequence, TextIO, Union
+
+from ecmp.compute_pool import _native
+
+
+class _EventState:
+    __slots__ = ("every", "countdown", "limited_rate", "spacing", "tolerance", "tat", "seen", "queued",
+                 "limited", "limited_total", "dropped")
+
+    def __init__(self, every: int, rate: Optional[float], burst: Optional[float], now: float) -> None:
+        self.every = every
+        self.countdown = every
+        # Rate limit as a generic cell rate algorithm: records are spaced
+        # 1/rate apart and may run up to burst - 1 of them ahead of schedule
+        self.limited_rate = rate is not None
+        self.spacing = 1.0 / rate if rate else float("inf")
+        burst = burst if burst is not None else max(rate or 0.0, 1.0)
+        self.tolerance = (burst - 1.0) * self.spacing if rate else 0.0
+        self.tat = now  # theoretical arrival time of the next record
+        self.seen = 0
+        self.queued = 0
+        self.limited = 0  # rate-limited since the last record that went out
+        self.limited_total = 0
+        self.dropped = 0
+
+
+class EventLog:
+    """Hands event records to a native writer thread that appends them to a JSONL file.
+
+    :meth:`emit` is what the handlers call, with an event type and its
+    values in the order of ``fields[event]``; naming them once here instead
+    of per call keeps keyword-argument dicts off the hot path. It keeps only
+    every ``sample[event]``-th record of an event type (a sample or rate of
+    ``0`` turns the type off), passes at most ``rate[event]`` records per second of it
+    (``default_rate`` for types not listed; ``None`` is unlimited) and
+    appends the rest to a queue; formatting, serialization and file I/O
+    happen on the writer thread every ``flush_interval`` seconds. Once
+    ``max_pending`` records wait, new ones are dropped rather than growing
+    the queue.
+
+    Each line is one compact JSON object: ``t`` (clock time), ``ev`` (event
+    type) and the named values (a ``v`` list for types without field
+    names), plus ``n`` on sampled types (each record stands for ``n``
+    events) and ``limited`` when records of the type were rate-limited since
+    the previous one, so counts can be scaled back up. With ``sink=None``
+    every event is discarded right away.
+
+    A file named by ``sink`` is rotated once it reaches ``max_bytes``: it
+    becomes ``sink.1``, older files shift up to ``sink.<backups>`` and the
+    oldest is deleted (with ``backups=0`` the file is just truncated).
+    """
+
+    def __init__(self, sink: Union[str, TextIO, None], fields: Optional[Mapping[str, Sequence[str]]] = None,
+                 sample: Optional[Mapping[str, int]] = None, rate: Optional[Mapping[str, float]] = None,
+                 default_rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_pending: int = 65536, flush_interval: float = 0.2,
+                 max_bytes: Optional[int] = None, backups: int = 3,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.fields = {event: tuple(names) for event, names in (fields or {}).items()}
+        self.sample = dict(sample or {})
+        self.rate = dict(rate or {})
+        self.default_rate = default_rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.clock = clock
+        self._events: Dict[str, _EventState] = {}
+        # deque.append/popleft are atomic, so the hub and the writer share it without a lock
+        self._pending: Deque[tuple] = deque()
+        # Per-type counts live on the event state; these are the writer's
+        self.counters = {
+            "written": 0,
+            "write_errors": 0,
+            "rotations": 0,
+        }
+        self._owned = isinstance(sink, str)
+        self._path = sink if self._owned else None
+        self._file = open(sink, "a", encoding="utf-8") if self._owned else sink
+        self._thread = None
+        if self._file is not None:
+            threading = _native("threading")
+            self._wake = threading.Event()
+            self._closed = False
+            self._thread = threading.Thread(target=self._write_loop, name="event-log", daemon=True)
+            self._thread.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def emit(self, event: str, *values) -> bool:
+        """Queue one record; False if it was sampled out, rate-limited or dropped."""
+        if self._thread is None:
+            return False
+        state = self._events.get(event)
+        if state is None:
+            state = self._state(event)
+        state.seen += 1
+        if state.every != 1:
+            state.countdown -= 1
+            if state.countdown:
+                return False
+            state.countdown = state.every
+        now = self.clock()
+        if state.limited_rate:
+            tat = state.tat
+            if tat - now > state.tolerance:
+                state.limited += 1
+                state.limited_total += 1
+                return False
+            state.tat = (tat if tat > now else now) + state.spacing
+        if len(self._pending) >= self.max_pending:
+            state.dropped += 1
+            return False
+        self._pending.append((now, event, state.every, state.limited, values))
+        state.limited = 0
+        state.queued += 1
+        return True
+
+    def flush(self) -> None:
+        """Have the writer thread write what is queued now instead of at its next interval."""
+        if self._thread is not None:
+            self._wake.set()
+
+    def close(self) -> None:
+        """Write what is queued and stop the writer; later events are discarded."""
+        if self._thread is None:
+            return
+        thread, self._thread = self._thread, None
+        self._closed = True
+        self._wake.set()
+        thread.join()
+        if self._owned:
+            self._file.close()
+
+    def stats(self) -> Dict[str, object]:
+        events = {event: {"seen": state.seen, "queued": state.queued,
+                          "rate_limited": state.limited_total, "dropped": state.dropped}
+                  for event, state in sorted(self._events.items())}
+        return {"pending": len(self._pending), **self.counters,
+                "dropped": sum(state.dropped for state in self._events.values()), "events": events}
+
+    def _state(self, event: str) -> _EventState:
+        every = self.sample.get(event, 1)
+        rate = self.rate.get(event, self.default_rate)
+        if every < 1 or (rate is not None and rate <= 0):
+            every = -1  # the countdown never reaches zero again: the type is off
+        state = self._events[event] = _EventState(every, rate, self.burst, self.clock())
+        return state
+
+    def _write_loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            closed = self._closed
+            self._write_pending()
+            if closed:
+                return
+
+    def _write_pending(self) -> None:
+        lines = []
+        pending = self._pending
+        dumps = json.JSONEncoder(separators=(",", ":"), default=str).encode
+        while pending:
+            t, event, every, limited, values = pending.popleft()
+            record = {"t": round(t, 6), "ev": event}
+            if every > 1:
+                record["n"] = every
+            if limited:
+                record["limited"] = limited
+            names = self.fields.get(event)
+            if names is not None:
+                record.update(zip(names, values))
+            else:
+                record["v"] = values
+            lines.append(dumps(record))
+        if not lines:
+            return
+        try:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            if self._path is not None and self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except (OSError, ValueError):  # ValueError: the caller closed its stream
+            self.counters["write_errors"] += 1
+        else:
+            # Only the writer thread touches these counters
+            self.counters["written"] += len(lines)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                older = f"{self._path}.{index}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self._path}.{index + 1}")
+            os.replace(self._path, f"{self._path}.1")
+        self._file = open(self._path, "w", encoding="utf-8")
+        self.counters["rotations"] += 1
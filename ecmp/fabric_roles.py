@@ -0,0 +1,135 @@
+"""
+Leaf/spine roles, uplinks and host ports of a two-tier fabric, inferred from the discovered topology.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Container, Dict, List, Optional, Tuple
+
+LEAF = "leaf"
+SPINE = "spine"
+
+
+@dataclass(frozen=True)
+class UplinkGroup:
+    group_id: int
+    ports: Tuple[int, ...]
+    previous: Tuple[int, ...] = ()  # ports of the installed group; empty if it has to be added
+
+
+class FabricRoles:
+    """Classifies the switches of a :class:`~ecmp.topology.Topology` as leaves or spines.
+
+    A switch whose known ports all have an LLDP-discovered link is a spine.
+    Roles then spread over the links: the neighbours of a spine are leaves
+    and the neighbours of a leaf are spines, so a spine that lost a link (and
+    so has a port without one) is still recognised, and a switch only
+    connected to switches that have not joined yet has no role until they do.
+    A role once found sticks for as long as the switch stays connected.
+    A leaf's linked ports are its uplinks, the others its host ports.
+
+    Every leaf gets its own select group id, allocated from ``group_base``
+    the first time it is seen. :meth:`take_changed` hands out the leaves
+    whose uplink set differs from what was last programmed, like
+    ``BroadcastTree.take_changed`` does for flood ports.
+    """
+
+    def __init__(self, topology, group_base: int = 50) -> None:
+        self.topology = topology
+        self.group_base = group_base
+        self._version: Optional[int] = None
+        self._table: Dict[int, Tuple[str, Tuple[int, ...], Tuple[int, ...]]] = {}
+        self._known: Dict[int, str] = {}
+        self._group_ids: Dict[int, int] = {}
+        self._programmed: Dict[int, Tuple[int, ...]] = {}
+
+    def role(self, dpid: int) -> Optional[str]:
+        entry = self._entry(dpid)
+        return entry[0] if entry is not None else None
+
+    def is_leaf(self, dpid: int) -> bool:
+        return self.role(dpid) == LEAF
+
+    def leaves(self) -> List[int]:
+        self._refresh()
+        return sorted(dpid for dpid, entry in self._table.items() if entry[0] == LEAF)
+
+    def uplinks(self, dpid: int) -> Tuple[int, ...]:
+        """Ports of a leaf that lead to spines; empty for anything else."""
+        entry = self._entry(dpid)
+        return entry[1] if entry is not None else ()
+
+    def host_ports(self, dpid: int) -> Tuple[int, ...]:
+        """Ports of a leaf without a discovered link; empty for anything else."""
+        entry = self._entry(dpid)
+        return entry[2] if entry is not None else ()
+
+    def is_uplink(self, dpid: int, port: int) -> bool:
+        return port in self.uplinks(dpid)
+
+    def is_host_port(self, dpid: int, port: int) -> bool:
+        return port in self.host_ports(dpid)
+
+    def group_id(self, dpid: int) -> int:
+        group_id = self._group_ids.get(dpid)
+        if group_id is None:
+            group_id = self.group_base + len(self._group_ids)
+            self._group_ids[dpid] = group_id
+        return group_id
+
+    def take_changed(self, ready: Optional[Container[int]] = None) -> Dict[int, UplinkGroup]:
+        """Uplink groups of the leaves whose uplinks changed since they were last taken.
+
+        Leaves not in ``ready`` (e.g. not connected yet) stay pending. A leaf
+        that lost all its uplinks keeps its group as it is; the buckets of
+        dead uplinks are skipped by the switch itself.
+        """
+        changed = {}
+        for dpid in self.leaves():
+            if ready is not None and dpid not in ready:
+                continue
+            ports = self.uplinks(dpid)
+            previous = self._programmed.get(dpid, ())
+            if ports and ports != previous:
+                self._programmed[dpid] = ports
+                changed[dpid] = UplinkGroup(self.group_id(dpid), ports, previous)
+        return changed
+
+    def forget(self, dpid: int) -> None:
+        """The switch disconnected; its role is found again, and its group added afresh, once it is back."""
+        self._programmed.pop(dpid, None)
+        self._known.pop(dpid, None)
+
+    def _entry(self, dpid: int) -> Optional[Tuple[str, Tuple[int, ...], Tuple[int, ...]]]:
+        self._refresh()
+        return self._table.get(dpid)
+
+    def _refresh(self) -> None:
+        if self._version == self.topology.version:
+            return
+        self._version = self.topology.version
+        graph = self.topology.graph
+        roles = {dpid: self._known[dpid] for dpid in graph if dpid in self._known}
+        for dpid in graph:
+            if dpid not in roles and graph.out_degree(dpid) and not self.topology.edge_ports(dpid):
+                roles[dpid] = SPINE
+        frontier = list(roles)
+        while frontier:
+            reached = []
+            for dpid in frontier:
+                other = LEAF if roles[dpid] == SPINE else SPINE
+                for nbr in set(graph.successors(dpid)) | set(graph.predecessors(dpid)):
+                    if nbr not in roles:
+                        roles[nbr] = other
+                        reached.append(nbr)
+            frontier = reached
+        self._known.update(roles)
+
+        self._table.clear()
+        for dpid, role in roles.items():
+            if role == LEAF:
+                uplinks = tuple(sorted(port for _, _, port in graph.out_edges(dpid, data="port")))
+                self._table[dpid] = (LEAF, uplinks, tuple(self.topology.edge_ports(dpid)))
+            else:
+                self._table[dpid] = (SPINE, (), ())
@@ -0,0 +1,79 @@
+"""
+Leaf uplink groups that fail over in the data plane, without a controller round trip.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence
+
+MODES = ("none", "watch", "chained")
+FAILOVER_GROUP_BASE = 0x10000
+
+
+def failover_group_id(group_id: int, port: int) -> int:
+    """Id of the fast-failover group behind ``group_id``'s bucket for ``port``."""
+    return FAILOVER_GROUP_BASE + (group_id << 8) + port
+
+
+def uplink_group_mods(datapath, group_id: int, ports: Sequence[int],
+                      weights: Optional[Dict[int, int]] = None, mode: str = "chained",
+                      queue_id: Optional[int] = 0, add: bool = True,
+                      previous: Sequence[int] = ()) -> list:
+    """GroupMods for a select group spreading traffic over ``ports``.
+
+    ``none`` keeps the old buckets (``watch_port=OFPP_ANY``), so a dead
+    uplink keeps its share until the controller reprograms the group.
+    ``watch`` sets each bucket's watch port to its own uplink; the switch
+    stops hashing onto it as soon as the port goes down. ``chained`` points
+    each select bucket at an ``OFPGT_FF`` group whose first bucket is the
+    uplink and whose later buckets are the other uplinks in turn, so flows
+    of a dead uplink are moved onto the next live one while the weights of
+    the select group stay as they are.
+
+    With ``add`` the groups are created (fast-failover groups first, as the
+    select group refers to them); otherwise only the select group is
+    modified, e.g. to change weights. ``previous`` are the uplinks of the
+    installed select group when it is modified onto a different uplink set;
+    in ``chained`` mode the fast-failover groups are then added for new
+    uplinks, re-sent for kept ones (their backups change) and deleted for
+    dropped ones once the select group no longer refers to them.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    parser = datapath.ofproto_parser
+    ofproto = datapath.ofproto
+    weights = weights or {}
+    command = ofproto.OFPGC_ADD if add else ofproto.OFPGC_MODIFY
+    msgs: List[object] = []
+
+    def output(port: int) -> list:
+        actions = [parser.OFPActionSetQueue(queue_id)] if queue_id is not None else []
+        return actions + [parser.OFPActionOutput(port)]
+
+    if mode == "chained" and (add or previous):
+        for i, port in enumerate(ports):
+            backups = list(ports[i:]) + list(ports[:i])
+            buckets = [parser.OFPBucket(watch_port=backup, watch_group=ofproto.OFPG_ANY,
+                                        actions=output(backup))
+                       for backup in backups]
+            ff_command = ofproto.OFPGC_MODIFY if port in previous else ofproto.OFPGC_ADD
+            msgs.append(parser.OFPGroupMod(datapath, ff_command, ofproto.OFPGT_FF,
+                                           failover_group_id(group_id, port), buckets))
+
+    buckets = []
+    for port in ports:
+        if mode == "chained":
+            actions = [parser.OFPActionGroup(failover_group_id(group_id, port))]
+        else:
+            actions = output(port)
+        watch_port = port if mode == "watch" else ofproto.OFPP_ANY
+        buckets.append(parser.OFPBucket(weight=weights.get(port, 1), watch_port=watch_port,
+                                        watch_group=ofproto.OFPG_ANY, actions=actions))
+    msgs.append(parser.OFPGroupMod(datapath, command, ofproto.OFPGT_SELECT, group_id, buckets))
+
+    if mode == "chained":
+        for port in previous:
+            if port not in ports:
+                msgs.append(parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE, ofproto.OFPGT_FF,
+                                               failover_group_id(group_id, port), []))
+    return msgs
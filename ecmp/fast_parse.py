@@ -0,0 +1,163 @@
+"""
+Packet-in header parsing that reads only the fields the ECMP apps use, straight out of ``msg.data``.
+"""
+
+from __future__ import annotations
+
+import struct
+from typing import Optional, Tuple
+
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_VLAN = 0x8100
+ETH_TYPE_LLDP = 0x88CC
+
+_U16 = struct.Struct("!H")
+_ARP_FIXED = struct.Struct("!HHBBH")  # htype, ptype, hlen, plen, opcode
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+
+def _ip(view: memoryview, offset: int) -> str:
+    return "%d.%d.%d.%d" % (view[offset], view[offset + 1], view[offset + 2], view[offset + 3])
+
+
+class Ethernet:
+    """``ryu.lib.packet.ethernet`` look-alike; addresses are decoded on first access."""
+
+    __slots__ = ("_view", "ethertype", "vlan", "payload_offset")
+
+    def __init__(self, view: memoryview, ethertype: int, vlan: Optional[int], payload_offset: int) -> None:
+        self._view = view
+        self.ethertype = ethertype
+        self.vlan = vlan
+        self.payload_offset = payload_offset
+
+    @property
+    def dst(self) -> str:
+        return self._view[0:6].hex(":")
+
+    @property
+    def src(self) -> str:
+        return self._view[6:12].hex(":")
+
+
+class Arp:
+    """``ryu.lib.packet.arp`` look-alike for Ethernet/IPv4 ARP."""
+
+    __slots__ = ("_view", "_offset", "opcode")
+
+    def __init__(self, view: memoryview, offset: int, opcode: int) -> None:
+        self._view = view
+        self._offset = offset
+        self.opcode = opcode
+
+    @property
+    def src_mac(self) -> str:
+        return self._view[self._offset + 8:self._offset + 14].hex(":")
+
+    @property
+    def src_ip(self) -> str:
+        return _ip(self._view, self._offset + 14)
+
+    @property
+    def dst_mac(self) -> str:
+        return self._view[self._offset + 18:self._offset + 24].hex(":")
+
+    @property
+    def dst_ip(self) -> str:
+        return _ip(self._view, self._offset + 24)
+
+
+class IPv4:
+    """``ryu.lib.packet.ipv4`` look-alike plus the transport ports, if any."""
+
+    __slots__ = ("_view", "_offset", "proto", "header_length")
+
+    def __init__(self, view: memoryview, offset: int, proto: int, header_length: int) -> None:
+        self._view = view
+        self._offset = offset
+        self.proto = proto
+        self.header_length = header_length
+
+    @property
+    def src(self) -> str:
+        return _ip(self._view, self._offset + 12)
+
+    @property
+    def dst(self) -> str:
+        return _ip(self._view, self._offset + 16)
+
+    @property
+    def ports(self) -> Optional[Tuple[int, int]]:
+        """(src_port, dst_port) for unfragmented TCP/UDP, else None."""
+        if self.proto not in (IPPROTO_TCP, IPPROTO_UDP):
+            return None
+        flags_frag = _U16.unpack_from(self._view, self._offset + 6)[0]
+        if flags_frag & 0x1FFF:
+            return None
+        l4 = self._offset + self.header_length
+        if len(self._view) < l4 + 4:
+            return None
+        return _U16.unpack_from(self._view, l4)[0], _U16.unpack_from(self._view, l4 + 2)[0]
+
+
+Headers = Tuple[Optional[Ethernet], Optional[Arp], Optional[IPv4]]
+
+
+def parse_fast(data) -> Headers:
+    """(ethernet, arp, ipv4) read in place from ``data``; ``ethernet`` is None if the frame is malformed.
+
+    Nothing is copied up front: the returned objects keep a memoryview of
+    ``data`` and decode addresses only when they are read.
+    """
+    view = memoryview(data)
+    if len(view) < 14:
+        return None, None, None
+    offset = 12
+    ethertype = _U16.unpack_from(view, offset)[0]
+    vlan = None
+    if ethertype == ETH_TYPE_VLAN:
+        if len(view) < 18:
+            return None, None, None
+        vlan = _U16.unpack_from(view, 14)[0] & 0x0FFF
+        offset = 16
+        ethertype = _U16.unpack_from(view, offset)[0]
+    offset += 2
+    eth = Ethernet(view, ethertype, vlan, offset)
+
+    if ethertype == ETH_TYPE_ARP:
+        if len(view) < offset + 28:
+            return None, None, None
+        htype, ptype, hlen, plen, opcode = _ARP_FIXED.unpack_from(view, offset)
+        if (htype, ptype, hlen, plen) != (1, ETH_TYPE_IP, 6, 4):
+            return None, None, None
+        return eth, Arp(view, offset, opcode), None
+
+    if ethertype == ETH_TYPE_IP:
+        if len(view) < offset + 20:
+            return None, None, None
+        version_ihl = view[offset]
+        header_length = (version_ihl & 0x0F) * 4
+        if version_ihl >> 4 != 4 or header_length < 20 or len(view) < offset + header_length:
+            return None, None, None
+        return eth, None, IPv4(view, offset, view[offset + 9], header_length)
+
+    return eth, None, None
+
+
+def parse_ryu(data) -> Headers:
+    """The same triple decoded by Ryu's full packet library."""
+    from ryu.lib.packet import arp, ethernet, ipv4, packet
+
+    pkt = packet.Packet(data)
+    return pkt.get_protocol(ethernet.ethernet), pkt.get_protocol(arp.arp), pkt.get_protocol(ipv4.ipv4)
+
+
+def parse_headers(data, fast: bool = True) -> Headers:
+    """Fast path when ``fast`` is set, falling back to Ryu for frames it does not understand."""
+    if fast:
+        headers = parse_fast(data)
+        if headers[0] is not None:
+            return headers
+    return parse_ryu(data)
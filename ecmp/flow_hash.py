@@ -0,0 +1,200 @@
+"""
+Deterministic ECMP flow hashing over the IPv4 5-tuple, with per-switch seeds.
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+import zlib
+from typing import Dict, NamedTuple, Optional, Sequence, TypeVar, Union
+
+import numpy as np
+
+T = TypeVar("T")
+
+HASH_FUNCTIONS = ("crc32", "fnv1a", "murmur")
+KEY_BYTES = 13  # src ip, dst ip, proto, src port, dst port
+
+_KEY = struct.Struct("!4s4sBHH")
+_PAIR_KEY = struct.Struct("!6s6sx")  # padded to KEY_BYTES so every hash function takes it
+_MASK32 = 0xFFFFFFFF
+_FNV_OFFSET = 0x811C9DC5
+_FNV_PRIME = 0x01000193
+_GOLDEN = 0x9E3779B9
+_PORT_FIELDS = {6: ("tcp_src", "tcp_dst"), 17: ("udp_src", "udp_dst")}
+
+
+class FiveTuple(NamedTuple):
+    src_ip: str
+    dst_ip: str
+    proto: int = 0
+    src_port: int = 0
+    dst_port: int = 0
+
+    def pack(self) -> bytes:
+        return _KEY.pack(socket.inet_aton(self.src_ip), socket.inet_aton(self.dst_ip),
+                         self.proto, self.src_port, self.dst_port)
+
+    def match(self) -> Dict[str, object]:
+        """OpenFlow 1.3 match fields (``OFPMatch`` keywords) for exactly the
+        packets that hash like this one; ports only when they were read."""
+        fields: Dict[str, object] = {"eth_type": 0x0800, "ipv4_src": self.src_ip,
+                                     "ipv4_dst": self.dst_ip, "ip_proto": self.proto}
+        names = _PORT_FIELDS.get(self.proto)
+        if names and (self.src_port or self.dst_port):
+            fields[names[0]] = self.src_port
+            fields[names[1]] = self.dst_port
+        return fields
+
+
+class HostPair(NamedTuple):
+    """Hash key for rules that match a (source MAC, destination MAC) pair:
+    every flow between the two hosts takes the path chosen for the pair."""
+
+    src_mac: str
+    dst_mac: str
+
+    def pack(self) -> bytes:
+        return _PAIR_KEY.pack(bytes.fromhex(self.src_mac.replace(":", "")),
+                              bytes.fromhex(self.dst_mac.replace(":", "")))
+
+
+FlowKey = Union[FiveTuple, HostPair]
+
+
+def five_tuple(ip_pkt) -> Optional[FiveTuple]:
+    """5-tuple of a parsed IPv4 header (fast parser or Ryu); ports are 0 when unavailable."""
+    if ip_pkt is None:
+        return None
+    ports = getattr(ip_pkt, "ports", None) or (0, 0)
+    return FiveTuple(ip_pkt.src, ip_pkt.dst, ip_pkt.proto, ports[0], ports[1])
+
+
+def fmix32(h: int) -> int:
+    """MurmurHash3 32-bit finalizer."""
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & _MASK32
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & _MASK32
+    return h ^ (h >> 16)
+
+
+def _crc32(key: bytes, seed: int) -> int:
+    return zlib.crc32(key, seed)
+
+
+def _fnv1a(key: bytes, seed: int) -> int:
+    h = _FNV_OFFSET ^ seed
+    for byte in key:
+        h = ((h ^ byte) * _FNV_PRIME) & _MASK32
+    return h
+
+
+def _murmur(key: bytes, seed: int) -> int:
+    src, dst, proto, sport, dport = _KEY.unpack(key)
+    h = seed
+    for word in (int.from_bytes(src, "big"), int.from_bytes(dst, "big"), (proto << 16) | sport, dport):
+        h = (fmix32((h ^ word) & _MASK32) * 5 + 0xE6546B64) & _MASK32
+    return fmix32(h)
+
+
+_SCALAR = {"crc32": _crc32, "fnv1a": _fnv1a, "murmur": _murmur}
+
+
+class FlowHasher:
+    """Maps a flow to one of ``n`` equal-cost choices, the same one every time.
+
+    ``function`` is one of :data:`HASH_FUNCTIONS`. With ``per_switch`` each
+    switch hashes with its own seed derived from ``seed`` and its dpid, so
+    consecutive hashing stages (leaf, then spine) do not make correlated
+    choices (hash polarization).
+    """
+
+    def __init__(self, function: str = "crc32", seed: int = 0, per_switch: bool = True) -> None:
+        if function not in HASH_FUNCTIONS:
+            raise ValueError(f"function must be one of {HASH_FUNCTIONS}, got {function!r}")
+        self.function = function
+        self.seed = seed & _MASK32
+        self.per_switch = per_switch
+        self._hash = _SCALAR[function]
+
+    def seed_for(self, dpid: Optional[int]) -> int:
+        if not self.per_switch or dpid is None:
+            return self.seed
+        return fmix32((self.seed ^ (dpid * _GOLDEN)) & _MASK32)
+
+    def hash(self, key: FlowKey, dpid: Optional[int] = None) -> int:
+        return self._hash(key.pack(), self.seed_for(dpid))
+
+    def select(self, choices: Sequence[T], key: FlowKey, dpid: Optional[int] = None) -> T:
+        return choices[self.hash(key, dpid) % len(choices)]
+
+
+# Vectorized versions for simulating large flow mixes; they agree bit for bit
+# with the scalar functions above.
+
+def pack_keys(src_ip: np.ndarray, dst_ip: np.ndarray, proto: np.ndarray,
+              src_port: np.ndarray, dst_port: np.ndarray) -> np.ndarray:
+    """``(n, 13)`` uint8 array of packed keys from integer field arrays."""
+    keys = np.empty((len(src_ip), KEY_BYTES), dtype=np.uint8)
+    keys[:, 0:4] = np.asarray(src_ip, dtype=">u4").view(np.uint8).reshape(-1, 4)
+    keys[:, 4:8] = np.asarray(dst_ip, dtype=">u4").view(np.uint8).reshape(-1, 4)
+    keys[:, 8] = np.asarray(proto, dtype=np.uint8)
+    keys[:, 9:11] = np.asarray(src_port, dtype=">u2").view(np.uint8).reshape(-1, 2)
+    keys[:, 11:13] = np.asarray(dst_port, dtype=">u2").view(np.uint8).reshape(-1, 2)
+    return keys
+
+
+def _crc_table() -> np.ndarray:
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ np.uint32(0xEDB88320), table >> 1).astype(np.uint32)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def _fmix32_array(h: np.ndarray) -> np.ndarray:
+    h = h ^ (h >> np.uint32(16))
+    h = h * np.uint32(0x85EBCA6B)
+    h = h ^ (h >> np.uint32(13))
+    h = h * np.uint32(0xC2B2AE35)
+    return h ^ (h >> np.uint32(16))
+
+
+def hash_keys(keys: np.ndarray, function: str = "crc32", seed=0) -> np.ndarray:
+    """Hash every row of ``keys``; ``seed`` may be a scalar or one seed per row."""
+    seed = np.broadcast_to(np.asarray(seed, dtype=np.uint64) & _MASK32, (len(keys),)).astype(np.uint32)
+    with np.errstate(over="ignore"):
+        if function == "crc32":
+            crc = seed ^ np.uint32(_MASK32)
+            for column in keys.T:
+                crc = _CRC_TABLE[(crc ^ column) & 0xFF] ^ (crc >> np.uint32(8))
+            return crc ^ np.uint32(_MASK32)
+        if function == "fnv1a":
+            h = seed ^ np.uint32(_FNV_OFFSET)
+            for column in keys.T:
+                h = (h ^ column) * np.uint32(_FNV_PRIME)
+            return h
+        if function == "murmur":
+            be = keys.astype(np.uint32)
+            words = (
+                be[:, 0] << 24 | be[:, 1] << 16 | be[:, 2] << 8 | be[:, 3],
+                be[:, 4] << 24 | be[:, 5] << 16 | be[:, 6] << 8 | be[:, 7],
+                be[:, 8] << 16 | be[:, 9] << 8 | be[:, 10],
+                be[:, 11] << 8 | be[:, 12],
+            )
+            h = seed
+            for word in words:
+                h = _fmix32_array(h ^ word) * np.uint32(5) + np.uint32(0xE6546B64)
+            return _fmix32_array(h)
+    raise ValueError(f"function must be one of {HASH_FUNCTIONS}, got {function!r}")
+
+
+def seeds_for(dpids: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Vectorized :meth:`FlowHasher.seed_for` with ``per_switch`` set."""
+    with np.errstate(over="ignore"):
+        mixed = np.asarray(dpids, dtype=np.uint64) * np.uint64(_GOLDEN)
+        return _fmix32_array((mixed & np.uint64(_MASK32)).astype(np.uint32) ^ np.uint32(seed & _MASK32))
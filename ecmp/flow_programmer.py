@@ -0,0 +1,158 @@
+"""
+Egress-first, barrier-confirmed installation of multi-switch path rules.
+"""
+
+from __future__ import annotations
+
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+MODES = ("plain", "barrier", "bundle")
+
+# (datapath, message or list of messages) for one switch on the path, ordered
+# ingress -> egress. Lists are sent in order, e.g. a GroupMod before the
+# FlowMod that points at it.
+Hop = Tuple[object, object]
+
+
+@dataclass
+class _Install:
+    ingress: Hop
+    release: Callable[[], None]
+    downstream: int
+    created: float
+    waiting: Set[Tuple[int, int]] = field(default_factory=set)
+
+
+class FlowProgrammer:
+    """Programs a path so the packet that triggered it is released only after
+    every downstream switch has its rule.
+
+    Downstream hops are sent egress-first. In ``barrier`` mode each is
+    followed by an ``OFPBarrierRequest``; in ``bundle`` mode each is wrapped
+    in an atomic ONF bundle (the OpenFlow 1.3 bundle extension) that is then
+    fenced by a barrier. Once every barrier reply has arrived the ingress rule
+    is installed and ``release`` sends the buffered packet. ``plain`` mode
+    keeps the fire-and-forget behaviour, only in egress-first order.
+    """
+
+    def __init__(self, mode: str = "barrier", timeout: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        self.mode = mode
+        self.timeout = timeout
+        self.clock = clock
+        self._installs: Dict[int, _Install] = {}
+        self._by_barrier: Dict[Tuple[int, int], int] = {}
+        self._ids = itertools.count(1)
+        self._bundle_ids = itertools.count(1)
+        self.counters = {
+            "paths": 0,
+            "flow_mods": 0,
+            "barriers": 0,
+            "bundles": 0,
+            "released": 0,
+            "timeouts": 0,
+            "pushes": 0,
+            # Downstream hops whose rule was confirmed before the packet was
+            # released: an upper bound on the table misses avoided, not a
+            # count of packet-ins that would otherwise have happened
+            "downstream_hops_preinstalled": 0,
+        }
+
+    @property
+    def pending(self) -> int:
+        return len(self._installs)
+
+    def install_path(self, hops: Sequence[Hop], release: Callable[[], None]) -> None:
+        self.counters["paths"] += 1
+        ingress, downstream = hops[0], list(hops[1:])
+        if self.mode == "plain" or not downstream:
+            for datapath, mod in reversed(downstream):
+                self._send_flow_mod(datapath, mod)
+            self._finish(ingress, release, 0)
+            return
+
+        install_id = next(self._ids)
+        install = _Install(ingress, release, len(downstream), self.clock())
+        for datapath, mod in reversed(downstream):
+            if not (self.mode == "bundle" and self._send_bundle(datapath, mod)):
+                self._send_flow_mod(datapath, mod)
+            xid = self._send_barrier(datapath)
+            install.waiting.add((datapath.id, xid))
+            self._by_barrier[(datapath.id, xid)] = install_id
+        self._installs[install_id] = install
+
+    def push(self, hops: Sequence[Hop]) -> None:
+        """Send state that no packet is waiting on, in the order given (egress-first)."""
+        for datapath, mods in hops:
+            if not (self.mode == "bundle" and self._send_bundle(datapath, mods)):
+                self._send_flow_mod(datapath, mods)
+        self.counters["pushes"] += 1
+
+    def barrier_reply(self, dpid: int, xid: int) -> bool:
+        install_id = self._by_barrier.pop((dpid, xid), None)
+        if install_id is None:
+            return False
+        install = self._installs.get(install_id)
+        if install is None:
+            return False
+        install.waiting.discard((dpid, xid))
+        if not install.waiting:
+            del self._installs[install_id]
+            self._finish(install.ingress, install.release, install.downstream)
+        return True
+
+    def expire(self, now: Optional[float] = None) -> List[int]:
+        """Drop installs whose barriers never came back (e.g. a switch disconnected)."""
+        now = self.clock() if now is None else now
+        stale = [i for i, install in self._installs.items() if now - install.created > self.timeout]
+        for install_id in stale:
+            install = self._installs.pop(install_id)
+            for key in install.waiting:
+                self._by_barrier.pop(key, None)
+        self.counters["timeouts"] += len(stale)
+        return stale
+
+    def _finish(self, ingress: Hop, release: Callable[[], None], downstream: int) -> None:
+        datapath, mod = ingress
+        self._send_flow_mod(datapath, mod)
+        release()
+        self.counters["released"] += 1
+        self.counters["downstream_hops_preinstalled"] += downstream
+
+    def _send_flow_mod(self, datapath, mods) -> None:
+        for mod in mods if isinstance(mods, (list, tuple)) else (mods,):
+            datapath.send_msg(mod)
+            self.counters["flow_mods"] += 1
+
+    def _send_barrier(self, datapath) -> int:
+        req = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        datapath.set_xid(req)
+        datapath.send_msg(req)
+        self.counters["barriers"] += 1
+        return req.xid
+
+    def _send_bundle(self, datapath, mods) -> bool:
+        parser = datapath.ofproto_parser
+        ofproto = datapath.ofproto
+        if not hasattr(parser, "ONFBundleCtrlMsg"):
+            return False
+        bundle_id = next(self._bundle_ids) & 0xFFFFFFFF
+        flags = ofproto.ONF_BF_ATOMIC | ofproto.ONF_BF_ORDERED
+        datapath.send_msg(parser.ONFBundleCtrlMsg(
+            datapath, bundle_id, ofproto.ONF_BCT_OPEN_REQUEST, flags, []))
+        for mod in mods if isinstance(mods, (list, tuple)) else (mods,):
+            add = parser.ONFBundleAddMsg(datapath, bundle_id, flags, mod, [])
+            # The bundled message must carry the same xid as the add request.
+            datapath.set_xid(add)
+            mod.set_xid(add.xid)
+            datapath.send_msg(add)
+            self.counters["flow_mods"] += 1
+        datapath.send_msg(parser.ONFBundleCtrlMsg(
+            datapath, bundle_id, ofproto.ONF_BCT_COMMIT_REQUEST, flags, []))
+        self.counters["bundles"] += 1
+        return True
@@ -0,0 +1,369 @@
+"""
+Compact registry of installed path rules with a link -> flows reverse index.
+"""
+
+from __future__ import annotations
+
+import math
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Path = Tuple[int, ...]
+Link = Tuple[int, int]
+
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+_FREE = -1
+
+
+class InstalledFlow:
+    """Read-only view of one registry row, built on demand."""
+
+    __slots__ = ("cookie", "src", "dst", "path", "priority", "installed", "rerouted")
+
+    def __init__(self, cookie: int, src: str, dst: str, path: Path, priority: int,
+                 installed: float, rerouted: Optional[float]) -> None:
+        self.cookie = cookie
+        self.src = src
+        self.dst = dst
+        self.path = path
+        self.priority = priority
+        self.installed = installed
+        self.rerouted = rerouted
+
+    @property
+    def ingress(self) -> int:
+        return self.path[0]
+
+    @property
+    def links(self) -> List[Link]:
+        return list(zip(self.path, self.path[1:]))
+
+    def __repr__(self) -> str:
+        return f"InstalledFlow({self.cookie:#x}, {self.src} -> {self.dst}, {list(self.path)})"
+
+
+class FlowRegistry:
+    """Remembers which flow rules were installed along which path.
+
+    A flow is one ``(ingress, eth_src, eth_dst)`` rule set. Flows live in
+    fixed-width NumPy columns; MACs and paths are interned, so a row is a few
+    integers and two timestamps whatever the path length, and there is no
+    Python object per flow. Freed rows are reused (O(1) insert and delete);
+    the row's generation goes into the cookie, so an ``OFPFlowRemoved`` for
+    an older occupant of the row is recognised as stale.
+
+    The controller puts the cookie on each of the flow's rules (with
+    ``OFPFF_SEND_FLOW_REM``). A flow is dropped once its ingress rule, or its
+    last rule, is reported removed: later packets come back to the controller
+    anyway. The reverse index goes link -> paths -> rows: each path keeps
+    the rows on it in a small array (a row knows its slot there, so moving
+    or dropping a flow is O(1)), and ``affected(links)`` only gathers the
+    rows on those paths, highest ``priority`` first and oldest first within
+    a priority.
+
+    The interning tables only grow: they are bounded by the hosts and the
+    distinct paths of the fabric, not by the number of flows.
+    """
+
+    def __init__(self, capacity: int = 1024, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self._macs: Dict[str, int] = {}
+        self._mac_names: List[str] = []
+        self._path_ids: Dict[Path, int] = {}
+        self._paths: List[Path] = []
+        self._paths_by_link: Dict[Link, List[int]] = {}
+        self._paths_by_switch: Dict[int, List[int]] = {}
+        # Per path id: rows on the path in [0, size), in no particular order
+        self._members: List[np.ndarray] = []
+        self._sizes: List[int] = []
+
+        capacity = max(capacity, 1)
+        self._src = np.zeros(capacity, dtype=np.uint32)
+        self._dst = np.zeros(capacity, dtype=np.uint32)
+        self._path = np.full(capacity, _FREE, dtype=np.int32)
+        self._priority = np.zeros(capacity, dtype=np.int32)
+        self._installed = np.zeros(capacity, dtype=np.float64)
+        self._rerouted = np.full(capacity, np.nan, dtype=np.float64)
+        # Bit i set: the rule on path[i] has not been reported removed
+        self._live = np.zeros(capacity, dtype=np.uint64)
+        # Starts at 1 so no cookie is 0, the cookie of every unregistered rule
+        self._generation = np.ones(capacity, dtype=np.uint32)
+        self._slot = np.zeros(capacity, dtype=np.int32)  # index of the row in its path's members
+
+        self._by_key: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._high = 0  # rows [0, _high) have been used at least once
+        self._count = 0
+        self.counters = {
+            "registered": 0,
+            "replaced": 0,
+            "rerouted": 0,
+            "removed": 0,
+            "unknown_removals": 0,
+        }
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[InstalledFlow]:
+        yield from self._views(np.flatnonzero(self._path[:self._high] != _FREE))
+
+    @property
+    def capacity(self) -> int:
+        return len(self._path)
+
+    def nbytes(self) -> int:
+        """Bytes held by the row columns (excluding the key index and interning tables)."""
+        return sum(column.nbytes for column in self._columns())
+
+    def get(self, cookie: int) -> Optional[InstalledFlow]:
+        row = self._row(cookie)
+        return self._view(row) if row is not None else None
+
+    def lookup(self, ingress: int, src: str, dst: str) -> Optional[InstalledFlow]:
+        src_id = self._macs.get(src)
+        dst_id = self._macs.get(dst)
+        if src_id is None or dst_id is None:
+            return None
+        row = self._by_key.get(self._key(ingress, src_id, dst_id))
+        return self._view(row) if row is not None else None
+
+    def add(self, src: str, dst: str, path: Iterable[int], priority: int = 0) -> InstalledFlow:
+        """Register a flow about to be installed along ``path``; returns it with a fresh cookie."""
+        path_id = self._intern_path(path)
+        src_id, dst_id = self._intern_mac(src), self._intern_mac(dst)
+        key = self._key(self._paths[path_id][0], src_id, dst_id)
+        old = self._by_key.get(key)
+        if old is not None:
+            self._drop(old)
+            self.counters["replaced"] += 1
+
+        row = self._free.pop() if self._free else self._grow_row()
+        self._src[row] = src_id
+        self._dst[row] = dst_id
+        self._path[row] = path_id
+        self._attach(row, path_id)
+        self._priority[row] = priority
+        self._installed[row] = self.clock()
+        self._rerouted[row] = np.nan
+        self._live[row] = (1 << len(self._paths[path_id])) - 1
+        self._by_key[key] = row
+        self._count += 1
+        self.counters["registered"] += 1
+        return self._view(row)
+
+    def reroute(self, cookie: int, path: Iterable[int]) -> List[int]:
+        """Move a flow onto ``path``; returns the switches whose old rule should be deleted."""
+        row = self._row(cookie)
+        if row is None:
+            raise KeyError(cookie)
+        old = self._paths[self._path[row]]
+        path_id = self._intern_path(path)
+        new = self._paths[path_id]
+        if new[0] != old[0]:
+            raise ValueError("a reroute keeps the flow's ingress switch")
+        self._detach(row, int(self._path[row]))
+        self._path[row] = path_id
+        self._attach(row, path_id)
+        self._live[row] = (1 << len(new)) - 1
+        self._rerouted[row] = self.clock()
+        self.counters["rerouted"] += 1
+        return [dpid for dpid in old if dpid not in new]
+
+    def removed(self, dpid: int, cookie: int) -> Optional[InstalledFlow]:
+        """Record an ``OFPFlowRemoved``; returns the flow if it is now gone entirely."""
+        row = self._row(cookie)
+        path = self._paths[self._path[row]] if row is not None else ()
+        live = int(self._live[row]) if row is not None else 0
+        bit = 1 << path.index(dpid) if dpid in path else 0
+        if not live & bit:
+            # Rules deleted by a reroute, or left over from an older occupant of the row
+            self.counters["unknown_removals"] += 1
+            return None
+        live &= ~bit
+        self._live[row] = live
+        if dpid != path[0] and live:
+            return None
+        flow = self._view(row)
+        self._drop(row)
+        self.counters["removed"] += 1
+        return flow
+
+    def flows_on(self, src: int, dst: int) -> List[InstalledFlow]:
+        return self._views(self._rows_on(self._paths_by_link.get((src, dst), ())))
+
+    def flows_at(self, dpid: int) -> Iterator[InstalledFlow]:
+        """Flows with a rule on ``dpid``."""
+        rows = self._rows_on(self._paths_by_switch.get(dpid, ()))
+        for start in range(0, len(rows), 4096):
+            yield from self._views(rows[start:start + 4096])
+
+    def links_at(self, dpid: int) -> List[Link]:
+        return [link for link in self._paths_by_link if dpid in link]
+
+    def affected(self, links: Iterable[Link], hold_down: float = 0.0) -> List[InstalledFlow]:
+        """Flows crossing any of ``links`` in reroute order.
+
+        Flows rerouted less than ``hold_down`` seconds ago are left alone so
+        that a congested link does not bounce the same flows back and forth.
+        """
+        path_ids = {pid for link in links for pid in self._paths_by_link.get(link, ())}
+        rows = self._rows_on(path_ids)
+        if hold_down > 0 and len(rows):
+            since = self.clock() - self._rerouted[rows]
+            rows = rows[~(since < hold_down)]  # NaN (never rerouted) passes
+        order = np.lexsort((rows, self._installed[rows],
+                            -self._priority[rows].astype(np.int64)))
+        return self._views(rows[order])
+
+    def expire(self, max_age: float, now: Optional[float] = None) -> List[int]:
+        """Drop flows installed (or last moved) more than ``max_age`` ago, for
+        removals that never arrived, e.g. an install whose barrier timed out."""
+        now = self.clock() if now is None else now
+        used = self._path[:self._high] != _FREE
+        last = np.fmax(self._installed[:self._high], self._rerouted[:self._high])
+        rows = np.flatnonzero(used & (now - last > max_age))
+        cookies = [self._cookie(int(row)) for row in rows]
+        for row in rows:
+            self._drop(int(row))
+        return cookies
+
+    def forget_switch(self, dpid: int) -> List[InstalledFlow]:
+        """Drop flows entering at ``dpid`` (its rules are gone); returns them."""
+        path_ids = [pid for pid in self._paths_by_switch.get(dpid, ()) if self._paths[pid][0] == dpid]
+        gone = self._views(self._rows_on(path_ids))
+        for flow in gone:
+            self._drop(flow.cookie & _ROW_MASK)
+        return gone
+
+    def export(self, limit: Optional[int] = None) -> List[dict]:
+        """Installed flows as records for the dashboard's flow table, oldest first."""
+        now = self.clock()
+        rows = np.flatnonzero(self._path[:self._high] != _FREE)
+        rows = rows[np.argsort(self._installed[rows], kind="stable")][:limit]
+        records = []
+        for flow in self._views(rows):
+            records.append({
+                "cookie": flow.cookie,
+                "src": flow.src,
+                "dst": flow.dst,
+                "path": " → ".join(str(dpid) for dpid in flow.path),
+                "hop_count": len(flow.path),
+                "priority": flow.priority,
+                "age": round(now - flow.installed, 1),
+                "rerouted": flow.rerouted is not None,
+            })
+        return records
+
+    def _columns(self) -> Sequence[np.ndarray]:
+        return (self._src, self._dst, self._path, self._priority, self._installed,
+                self._rerouted, self._live, self._generation, self._slot)
+
+    @staticmethod
+    def _key(ingress: int, src_id: int, dst_id: int) -> int:
+        return (ingress << 64) | (src_id << 32) | dst_id
+
+    def _cookie(self, row: int) -> int:
+        return (int(self._generation[row]) << _ROW_BITS) | row
+
+    def _row(self, cookie: int) -> Optional[int]:
+        row = cookie & _ROW_MASK
+        if row >= self._high or self._path[row] == _FREE or self._cookie(row) != cookie:
+            return None
+        return row
+
+    def _view(self, row: int) -> InstalledFlow:
+        rerouted = float(self._rerouted[row])
+        return InstalledFlow(self._cookie(row), self._mac_names[self._src[row]],
+                             self._mac_names[self._dst[row]], self._paths[self._path[row]],
+                             int(self._priority[row]), float(self._installed[row]),
+                             None if math.isnan(rerouted) else rerouted)
+
+    def _views(self, rows: np.ndarray) -> List[InstalledFlow]:
+        # Column gathers and tolist() instead of per-row NumPy scalar reads
+        names, paths = self._mac_names, self._paths
+        generations = self._generation[rows].tolist()
+        rerouted = self._rerouted[rows].tolist()
+        return [InstalledFlow((gen << _ROW_BITS) | row, names[src], names[dst], paths[path], priority,
+                              installed, None if math.isnan(moved) else moved)
+                for row, gen, src, dst, path, priority, installed, moved in zip(
+                    rows.tolist(), generations, self._src[rows].tolist(), self._dst[rows].tolist(),
+                    self._path[rows].tolist(), self._priority[rows].tolist(),
+                    self._installed[rows].tolist(), rerouted)]
+
+    def _rows_on(self, path_ids: Iterable[int]) -> np.ndarray:
+        """Rows on any of ``path_ids`` in ascending order; touches only those rows."""
+        chunks = [self._members[pid][:self._sizes[pid]] for pid in path_ids if self._sizes[pid]]
+        if not chunks:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(chunks)).astype(np.intp)
+
+    def _attach(self, row: int, path_id: int) -> None:
+        members = self._members[path_id]
+        size = self._sizes[path_id]
+        if size == len(members):
+            members = self._members[path_id] = np.concatenate((members, np.empty_like(members)))
+        members[size] = row
+        self._slot[row] = size
+        self._sizes[path_id] = size + 1
+
+    def _detach(self, row: int, path_id: int) -> None:
+        # The path's last member takes the row's slot
+        members = self._members[path_id]
+        last = self._sizes[path_id] - 1
+        slot = int(self._slot[row])
+        moved = int(members[last])
+        members[slot] = moved
+        self._slot[moved] = slot
+        self._sizes[path_id] = last
+
+    def _drop(self, row: int) -> None:
+        path_id = int(self._path[row])
+        path = self._paths[path_id]
+        self._detach(row, path_id)
+        del self._by_key[self._key(path[0], int(self._src[row]), int(self._dst[row]))]
+        self._path[row] = _FREE
+        self._live[row] = 0
+        self._generation[row] = max(int(self._generation[row]) + 1 & 0xFFFFFFFF, 1)
+        self._free.append(row)
+        self._count -= 1
+
+    def _grow_row(self) -> int:
+        if self._high == len(self._path):
+            size = 2 * len(self._path)
+            for name in ("_src", "_dst", "_path", "_priority", "_installed", "_rerouted",
+                         "_live", "_generation", "_slot"):
+                old = getattr(self, name)
+                fill = {"_path": _FREE, "_rerouted": np.nan, "_generation": 1}.get(name, 0)
+                grown = np.full(size, fill, dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+        self._high += 1
+        return self._high - 1
+
+    def _intern_mac(self, mac: str) -> int:
+        mac_id = self._macs.get(mac)
+        if mac_id is None:
+            mac_id = self._macs[sys.intern(mac)] = len(self._mac_names)
+            self._mac_names.append(sys.intern(mac))
+        return mac_id
+
+    def _intern_path(self, path: Iterable[int]) -> int:
+        path = tuple(path)
+        path_id = self._path_ids.get(path)
+        if path_id is None:
+            if len(path) > 64:
+                raise ValueError("paths longer than 64 switches are not supported")
+            path_id = self._path_ids[path] = len(self._paths)
+            self._paths.append(path)
+            self._members.append(np.empty(4, dtype=np.int32))
+            self._sizes.append(0)
+            for link in zip(path, path[1:]):
+                self._paths_by_link.setdefault(link, []).append(path_id)
+            for dpid in set(path):
+                self._paths_by_switch.setdefault(dpid, []).append(path_id)
+        return path_id
@@ -0,0 +1,126 @@
+"""
+MAC -> (edge dpid, port) host location table with aging and move detection.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+Location = Tuple[int, int]
+
+
+def is_unicast(mac: str) -> bool:
+    return not int(mac[:2], 16) & 1
+
+
+@dataclass
+class HostEntry:
+    dpid: int
+    port: int
+    last_seen: float
+    ip: Optional[str] = None
+
+
+class HostTable:
+    """Where each host attaches to the fabric, learned only from edge-port packet-ins.
+
+    Every operation on a single MAC is a dict lookup, independent of the
+    number of switches or hosts. Entries older than ``max_age`` seconds are
+    treated as absent on lookup and removed by :meth:`expire`.
+    """
+
+    def __init__(self, max_age: float = 300.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_age = max_age
+        self.clock = clock
+        self._hosts: Dict[str, HostEntry] = {}
+        self._by_port: Dict[Location, Set[str]] = {}
+        self.moves = 0
+        self.aged_out = 0
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def __contains__(self, mac: str) -> bool:
+        return self.lookup(mac) is not None
+
+    def learn(self, mac: str, dpid: int, port: int, now: Optional[float] = None,
+              ip: Optional[str] = None) -> Optional[Location]:
+        """Record ``mac`` at ``(dpid, port)``; returns the previous location if the host moved."""
+        if not is_unicast(mac):
+            return None
+        now = self.clock() if now is None else now
+        entry = self._hosts.get(mac)
+        if entry is None:
+            self._hosts[mac] = HostEntry(dpid, port, now, ip)
+            self._by_port.setdefault((dpid, port), set()).add(mac)
+            return None
+
+        previous = (entry.dpid, entry.port)
+        entry.last_seen = now
+        if ip is not None:
+            entry.ip = ip
+        if previous == (dpid, port):
+            return None
+
+        self._unindex(mac, previous)
+        entry.dpid, entry.port = dpid, port
+        self._by_port.setdefault((dpid, port), set()).add(mac)
+        self.moves += 1
+        return previous
+
+    def lookup(self, mac: str, now: Optional[float] = None) -> Optional[Location]:
+        entry = self._hosts.get(mac)
+        if entry is None:
+            return None
+        now = self.clock() if now is None else now
+        if now - entry.last_seen > self.max_age:
+            self._remove(mac)
+            self.aged_out += 1
+            return None
+        return entry.dpid, entry.port
+
+    def ip_of(self, mac: str) -> Optional[str]:
+        entry = self._hosts.get(mac)
+        return entry.ip if entry is not None else None
+
+    def hosts_at(self, dpid: int, port: int) -> Set[str]:
+        return set(self._by_port.get((dpid, port), ()))
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        now = self.clock() if now is None else now
+        stale = [mac for mac, entry in self._hosts.items() if now - entry.last_seen > self.max_age]
+        for mac in stale:
+            self._remove(mac)
+        self.aged_out += len(stale)
+        return stale
+
+    def forget_port(self, dpid: int, port: int) -> List[str]:
+        """Drop hosts learned on a port that turned out to be an inter-switch link."""
+        macs = list(self._by_port.get((dpid, port), ()))
+        for mac in macs:
+            self._remove(mac)
+        return macs
+
+    def forget_switch(self, dpid: int) -> List[str]:
+        macs = [mac for mac, entry in self._hosts.items() if entry.dpid == dpid]
+        for mac in macs:
+            self._remove(mac)
+        return macs
+
+    def items(self):
+        for mac, entry in self._hosts.items():
+            yield mac, (entry.dpid, entry.port)
+
+    def _remove(self, mac: str) -> None:
+        entry = self._hosts.pop(mac, None)
+        if entry is not None:
+            self._unindex(mac, (entry.dpid, entry.port))
+
+    def _unindex(self, mac: str, location: Location) -> None:
+        macs = self._by_port.get(location)
+        if macs is not None:
+            macs.discard(mac)
+            if not macs:
+                del self._by_port[location]
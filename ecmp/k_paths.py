@@ -0,0 +1,173 @@
+"""
+Yen's k shortest loopless paths with bounded stretch, for spilling onto unequal-cost paths (UCMP).
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import networkx as nx
+
+Path = Tuple[int, ...]
+Pair = Tuple[int, int]
+Edge = Tuple[int, int]
+
+
+def _bounded_bfs(adj: Dict[int, List[int]], to_dst: Dict[int, int], src: int, dst: int,
+                 blocked_nodes: Set[int], blocked_edges: Set[Edge], budget: int) -> Optional[Path]:
+    parent = {src: src}
+    frontier = [src]
+    for depth in range(1, budget + 1):
+        reached = []
+        for u in frontier:
+            for v in adj.get(u, ()):
+                if v in parent or v in blocked_nodes or (u, v) in blocked_edges:
+                    continue
+                if depth + to_dst.get(v, budget + 1) > budget:
+                    continue
+                parent[v] = u
+                if v == dst:
+                    path = [v]
+                    while path[-1] != src:
+                        path.append(parent[path[-1]])
+                    return tuple(reversed(path))
+                reached.append(v)
+        if not reached:
+            return None
+        frontier = reached
+    return None
+
+
+def _spur_path(adj: Dict[int, List[int]], to_dst: Dict[int, int], src: int, dst: int,
+               blocked_nodes: Set[int], blocked_edges: Set[Edge], max_hops: int) -> Optional[Path]:
+    """Fewest-hop path of at most ``max_hops`` avoiding the blocked nodes and edges.
+
+    ``to_dst`` (unblocked hop distances to ``dst``) is a lower bound on what
+    is left from any node. The search is repeated with a hop budget growing
+    from that bound, and nodes that cannot reach ``dst`` within the budget
+    are skipped, so a spur as short as the unblocked one only walks the
+    shortest-path DAG.
+    """
+    if src == dst:
+        return (src,)
+    for budget in range(to_dst.get(src, max_hops + 1), max_hops + 1):
+        path = _bounded_bfs(adj, to_dst, src, dst, blocked_nodes, blocked_edges, budget)
+        if path is not None:
+            return path
+    return None
+
+
+def shortest_simple_paths(graph: nx.DiGraph, src: int, dst: int, max_stretch: float = 2.0) -> Iterator[Path]:
+    """Loopless paths in order of hop count, up to ``max_stretch`` times the shortest.
+
+    Yen's algorithm with Lawler's refinement (a path only spurs from where
+    it deviated from its parent onwards). Spur paths are hop-count BFS runs
+    over a sorted adjacency with the root's nodes and the already-used root
+    edges masked out instead of removed from a graph copy; the stretch
+    bound and the distances to ``dst`` cap how far each run searches, so
+    longer candidates are never explored.
+    """
+    if src not in graph or dst not in graph or src == dst:
+        return
+    to_dst = nx.single_source_shortest_path_length(graph.reverse(copy=False), dst)
+    if src not in to_dst:
+        return
+    adj = {u: sorted(nbrs) for u, nbrs in graph.adj.items()}
+    max_hops = int(max_stretch * to_dst[src])
+    first = _spur_path(adj, to_dst, src, dst, set(), set(), max_hops)
+    found: List[Path] = []
+    seen = {first}
+    candidates = [(len(first), first, 0)]
+    while candidates:
+        _, path, deviation = heapq.heappop(candidates)
+        found.append(path)
+        yield path
+        for i in range(deviation, len(path) - 1):
+            root = path[:i + 1]
+            blocked_edges = {(p[i], p[i + 1]) for p in found if p[:i + 1] == root}
+            spur = _spur_path(adj, to_dst, root[-1], dst, set(root[:-1]), blocked_edges, max_hops - i)
+            if spur is None:
+                continue
+            candidate = root[:-1] + spur
+            if candidate not in seen:
+                seen.add(candidate)
+                heapq.heappush(candidates, (len(candidate), candidate, i))
+
+
+def k_shortest_paths(graph: nx.DiGraph, src: int, dst: int, k: int, max_stretch: float = 2.0) -> List[Path]:
+    """The ``k`` shortest loopless paths within ``max_stretch``; safe to run on a snapshot off the hub."""
+    return list(itertools.islice(shortest_simple_paths(graph, src, dst, max_stretch), k))
+
+
+def unequal_cost_paths(graph: nx.DiGraph, src: int, dst: int, extra: int,
+                       max_stretch: float = 2.0) -> List[Path]:
+    """Every shortest path plus up to ``extra`` longer ones within ``max_stretch``."""
+    paths: List[Path] = []
+    longer = 0
+    for path in shortest_simple_paths(graph, src, dst, max_stretch):
+        if paths and len(path) > len(paths[0]):
+            if longer == extra:
+                break
+            longer += 1
+        paths.append(path)
+    return paths
+
+
+class KPathCache:
+    """:func:`unequal_cost_paths` per switch pair, valid for one topology version.
+
+    Entries are computed by :meth:`get` on first use, or off the hub on a
+    graph snapshot and stored with :meth:`put`, and all dropped once
+    ``topology.version`` moves on; the same list object is handed back for
+    as long as it is valid, so compiled path scorers can be reused.
+    """
+
+    def __init__(self, topology, extra: int = 4, max_stretch: float = 2.0) -> None:
+        self.topology = topology
+        self.extra = extra
+        self.max_stretch = max_stretch
+        self._version: Optional[int] = None
+        self._paths: Dict[Pair, List[Path]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def cached(self, src: int, dst: int) -> bool:
+        self._check_version()
+        return (src, dst) in self._paths
+
+    def get(self, src: int, dst: int) -> List[Path]:
+        self._check_version()
+        paths = self._paths.get((src, dst))
+        if paths is not None:
+            self.hits += 1
+            return paths
+        self.misses += 1
+        paths = unequal_cost_paths(self.topology.graph, src, dst, self.extra, self.max_stretch)
+        self._paths[(src, dst)] = paths
+        return paths
+
+    def put(self, src: int, dst: int, paths: List[Path], version: int) -> None:
+        """Store paths computed elsewhere (e.g. on a snapshot) for topology ``version``."""
+        self._check_version()
+        if version == self._version:
+            self._paths.setdefault((src, dst), paths)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._paths),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _check_version(self) -> None:
+        if self._version != self.topology.version:
+            self._version = self.topology.version
+            self._paths.clear()
@@ -0,0 +1,141 @@
+"""
+Per-port transmit rates and EWMA-smoothed link utilization from OpenFlow port stats.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+PortKey = Tuple[int, int]
+
+# Some switches still keep 32-bit port counters; OpenFlow 1.3 mandates 64.
+COUNTER_WIDTHS = (32, 64)
+MIN_FRAME_BYTES = 64
+
+
+@dataclass
+class PortLoad:
+    tx_bytes: int
+    tx_packets: int
+    duration: float
+    tx_bps: float = 0.0
+    tx_pps: float = 0.0
+    utilization: float = 0.0
+    samples: int = 0
+
+
+def _port_duration(stat) -> float:
+    return stat.duration_sec + stat.duration_nsec * 1e-9
+
+
+def _counter_delta(new: int, old: int, max_delta: float) -> Optional[int]:
+    """Counter increase between two readings, or None if the counter was reset."""
+    if new >= old:
+        return new - old
+    for width in COUNTER_WIDTHS:
+        limit = 1 << width
+        if old < limit and new < limit:
+            wrapped = new + limit - old
+            if wrapped <= max_delta:
+                return wrapped
+    return None
+
+
+class LinkLoad:
+    """Turns cumulative ``OFPPortStats`` counters into rates and utilization.
+
+    Intervals come from each port's ``duration_sec``/``duration_nsec`` rather
+    than the controller clock, so late or bunched replies do not distort the
+    rate. Utilization is a fraction of the port's capacity smoothed with an
+    exponential moving average whose weight scales with the sample interval
+    (time constant ``tau`` seconds).
+    """
+
+    def __init__(self, default_capacity_bps: float = 10e6, tau: float = 4.0) -> None:
+        self.default_capacity_bps = default_capacity_bps
+        self.tau = tau
+        self._ports: Dict[PortKey, PortLoad] = {}
+        self._capacity: Dict[PortKey, float] = {}
+        self.resets = 0
+        self.wraps = 0
+
+    def set_capacity(self, dpid: int, port: int, capacity_bps: float) -> None:
+        self._capacity[(dpid, port)] = capacity_bps
+
+    def capacity(self, dpid: int, port: int) -> float:
+        return self._capacity.get((dpid, port), self.default_capacity_bps)
+
+    def update(self, dpid: int, stats: Iterable) -> None:
+        for stat in stats:
+            self._update_port(dpid, stat)
+
+    def utilization(self, dpid: int, port: int) -> float:
+        load = self._ports.get((dpid, port))
+        return load.utilization if load is not None else 0.0
+
+    def tx_bps(self, dpid: int, port: int) -> float:
+        load = self._ports.get((dpid, port))
+        return load.tx_bps if load is not None else 0.0
+
+    def forget_switch(self, dpid: int) -> None:
+        for key in [key for key in self._ports if key[0] == dpid]:
+            del self._ports[key]
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            f"{dpid}:{port}": {
+                "tx_bps": load.tx_bps,
+                "tx_pps": load.tx_pps,
+                "utilization": load.utilization,
+            }
+            for (dpid, port), load in self._ports.items()
+        }
+
+    def _update_port(self, dpid: int, stat) -> None:
+        key = (dpid, stat.port_no)
+        duration = _port_duration(stat)
+        load = self._ports.get(key)
+        if load is None:
+            self._ports[key] = PortLoad(stat.tx_bytes, stat.tx_packets, duration)
+            return
+
+        interval = duration - load.duration
+        if interval < 0:
+            # Port (or switch) restarted: counters and duration start over.
+            self.resets += 1
+            self._rebase(load, stat, duration)
+            return
+        if interval == 0:
+            return
+
+        capacity = self.capacity(*key)
+        max_bytes = capacity / 8.0 * interval * 2.0
+        d_bytes = _counter_delta(stat.tx_bytes, load.tx_bytes, max_bytes)
+        d_packets = _counter_delta(stat.tx_packets, load.tx_packets, max_bytes / MIN_FRAME_BYTES)
+        if d_bytes is None or d_packets is None:
+            self.resets += 1
+            self._rebase(load, stat, duration)
+            return
+        if stat.tx_bytes < load.tx_bytes or stat.tx_packets < load.tx_packets:
+            self.wraps += 1
+
+        load.tx_bps = d_bytes * 8.0 / interval
+        load.tx_pps = d_packets / interval
+        sample = load.tx_bps / capacity if capacity > 0 else 0.0
+        if load.samples == 0:
+            load.utilization = sample
+        else:
+            alpha = 1.0 - math.exp(-interval / self.tau)
+            load.utilization += alpha * (sample - load.utilization)
+        load.samples += 1
+        load.tx_bytes = stat.tx_bytes
+        load.tx_packets = stat.tx_packets
+        load.duration = duration
+
+    @staticmethod
+    def _rebase(load: PortLoad, stat, duration: float) -> None:
+        load.tx_bytes = stat.tx_bytes
+        load.tx_packets = stat.tx_packets
+        load.duration = duration
@@ -0,0 +1,168 @@
+"""
+Table-miss protection: metered packet-in rules and a prioritized, budgeted packet-in queue.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+# Highest priority first; load is shed from the end of this list.
+CLASSES = ("lldp", "arp", "new_flow", "repeat")
+
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_VLAN = 0x8100
+ETH_TYPE_LLDP = 0x88CC
+
+TABLE_MISS_METER_ID = 1
+
+
+def metered_table_miss(datapath, rate_pps: int, burst: int, meter_id: int = TABLE_MISS_METER_ID,
+                       priority: int = 0) -> list:
+    """A packets-per-second meter and the table-miss rule that sends through it to the controller.
+
+    Packets above ``rate_pps`` (plus ``burst``) are dropped on the switch,
+    so a scanning host cannot flood the controller with packet-ins.
+    """
+    parser = datapath.ofproto_parser
+    ofproto = datapath.ofproto
+    bands = [parser.OFPMeterBandDrop(rate=rate_pps, burst_size=burst)]
+    meter = parser.OFPMeterMod(datapath, command=ofproto.OFPMC_ADD,
+                               flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST,
+                               meter_id=meter_id, bands=bands)
+    actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+    inst = [parser.OFPInstructionMeter(meter_id),
+            parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+    flow = parser.OFPFlowMod(datapath=datapath, priority=priority,
+                             match=parser.OFPMatch(), instructions=inst)
+    return [meter, flow]
+
+
+def flow_key(data: bytes) -> Tuple[int, bytes]:
+    """(ethertype, bytes identifying the flow) read straight from the frame header."""
+    offset = 12
+    eth_type = int.from_bytes(data[offset:offset + 2], "big")
+    if eth_type == ETH_TYPE_VLAN:
+        offset += 4
+        eth_type = int.from_bytes(data[offset:offset + 2], "big")
+    key = data[:12]
+    if eth_type == ETH_TYPE_IP:
+        # IPv4 protocol, source and destination address
+        l3 = offset + 2
+        key += data[l3 + 9:l3 + 10] + data[l3 + 12:l3 + 20]
+    return eth_type, key
+
+
+class PacketInDispatcher:
+    """Queues packet-in events by class and hands them to ``handler`` within a budget.
+
+    Events are classified from the raw frame: LLDP, ARP, the first packet of
+    a flow, and repeats of a flow seen within ``repeat_window`` seconds
+    (usually packets that arrived before its rules were installed). Each call
+    to :meth:`dispatch` serves classes in that order, at most ``budget``
+    events per second overall. Once ``max_queued`` events are waiting, a new
+    event evicts the oldest event of a lower class, or is dropped itself if
+    there is none.
+    """
+
+    def __init__(self, handler: Callable[[object], None], budget: float = 1000.0,
+                 max_queued: int = 2000, repeat_window: float = 1.0, max_tracked: int = 65536,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.handler = handler
+        self.budget = budget
+        self.max_queued = max_queued
+        self.repeat_window = repeat_window
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self._queues: Dict[str, Deque[Tuple[float, object]]] = {name: deque() for name in CLASSES}
+        self._recent: "OrderedDict[bytes, float]" = OrderedDict()
+        self._tokens = budget
+        self._refilled = clock()
+        self.counters: Dict[str, Dict[str, float]] = {
+            name: {"received": 0, "handled": 0, "dropped": 0, "wait_total": 0.0, "wait_max": 0.0,
+                   "handler_total": 0.0}
+            for name in CLASSES}
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def classify(self, data: bytes, now: Optional[float] = None) -> str:
+        eth_type, key = flow_key(data)
+        if eth_type == ETH_TYPE_LLDP:
+            return "lldp"
+        if eth_type == ETH_TYPE_ARP:
+            return "arp"
+        now = self.clock() if now is None else now
+        last = self._recent.get(key)
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.max_tracked:
+            self._recent.popitem(last=False)
+        if last is not None and now - last <= self.repeat_window:
+            return "repeat"
+        return "new_flow"
+
+    def submit(self, ev, now: Optional[float] = None) -> bool:
+        """Queue ``ev``; returns False if it was shed."""
+        now = self.clock() if now is None else now
+        cls = self.classify(ev.msg.data, now)
+        self.counters[cls]["received"] += 1
+        if len(self) >= self.max_queued and not self._evict_below(cls):
+            self.counters[cls]["dropped"] += 1
+            return False
+        self._queues[cls].append((now, ev))
+        return True
+
+    def dispatch(self, now: Optional[float] = None) -> int:
+        """Handle queued events in class order until the budget is spent."""
+        now = self.clock() if now is None else now
+        self._tokens = min(self.budget, self._tokens + (now - self._refilled) * self.budget)
+        self._refilled = now
+        handled = 0
+        for cls in CLASSES:
+            queue = self._queues[cls]
+            counters = self.counters[cls]
+            while queue and self._tokens >= 1:
+                queued_at, ev = queue.popleft()
+                self._tokens -= 1
+                wait = now - queued_at
+                counters["wait_total"] += wait
+                counters["wait_max"] = max(counters["wait_max"], wait)
+                start = time.perf_counter()
+                self.handler(ev)
+                counters["handler_total"] += time.perf_counter() - start
+                counters["handled"] += 1
+                handled += 1
+        return handled
+
+    def run(self, sleep: Callable[[float], None], interval: float = 0.01) -> None:
+        """Dispatch loop for a ``hub.spawn``-ed thread."""
+        while True:
+            self.dispatch()
+            sleep(interval)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-class counters with mean queue wait and handler time in milliseconds."""
+        out = {}
+        for cls, counters in self.counters.items():
+            handled = counters["handled"] or 1
+            out[cls] = {
+                "received": counters["received"],
+                "handled": counters["handled"],
+                "dropped": counters["dropped"],
+                "queued": len(self._queues[cls]),
+                "wait_ms": round(counters["wait_total"] / handled * 1e3, 3),
+                "wait_max_ms": round(counters["wait_max"] * 1e3, 3),
+                "handler_ms": round(counters["handler_total"] / handled * 1e3, 3),
+            }
+        return out
+
+    def _evict_below(self, cls: str) -> bool:
+        for lower in reversed(CLASSES[CLASSES.index(cls) + 1:]):
+            if self._queues[lower]:
+                self._queues[lower].popleft()
+                self.counters[lower]["dropped"] += 1
+                return True
+        return False
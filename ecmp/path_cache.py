@@ -0,0 +1,205 @@
+"""
+Per-(src_dpid, dst_dpid) equal-cost path cache shared by the ECMP controllers.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import networkx as nx
+
+Path = Tuple[int, ...]
+Pair = Tuple[int, int]
+Edge = Tuple[int, int]
+
+
+def _paths_from_predecessors(pred: Dict[int, List[int]], src: int, dst: int) -> List[Path]:
+    if dst not in pred:
+        return []
+    paths: List[Path] = []
+    stack = [(dst, (dst,))]
+    while stack:
+        node, suffix = stack.pop()
+        if node == src:
+            paths.append(suffix)
+            continue
+        for prev in pred[node]:
+            stack.append((prev, (prev,) + suffix))
+    paths.sort()
+    return paths
+
+
+def shortest_paths(graph: nx.DiGraph, src: int, dst: int) -> List[Path]:
+    """Sorted hop-count shortest paths from ``src`` to ``dst``; safe to run on a snapshot off the hub."""
+    if src not in graph or dst not in graph:
+        return []
+    try:
+        return sorted(tuple(p) for p in nx.all_shortest_paths(graph, src, dst))
+    except nx.NetworkXNoPath:
+        return []
+
+
+def all_pairs_paths(graph: nx.DiGraph, nodes: Optional[Iterable[int]] = None) -> Dict[Pair, List[Path]]:
+    """Path sets between every pair of ``nodes`` (default: all switches) of ``graph``."""
+    nodes = list(graph.nodes if nodes is None else nodes)
+    result: Dict[Pair, List[Path]] = {}
+    for src in nodes:
+        if src not in graph:
+            continue
+        pred = nx.predecessor(graph, src)
+        for dst in nodes:
+            if dst != src and dst in graph:
+                result[(src, dst)] = _paths_from_predecessors(pred, src, dst)
+    return result
+
+
+def path_table(graph: nx.DiGraph, nodes: Optional[Iterable[int]] = None
+               ) -> Tuple[Dict[Pair, List[Path]], Dict[Edge, Set[Pair]]]:
+    """:func:`all_pairs_paths` plus its edge index, ready for :meth:`PathCache.adopt`."""
+    entries = all_pairs_paths(graph, nodes)
+    by_edge: Dict[Edge, Set[Pair]] = {}
+    for key, paths in entries.items():
+        for path in paths:
+            for edge in zip(path, path[1:]):
+                by_edge.setdefault(edge, set()).add(key)
+    return entries, by_edge
+
+
+class PathCache:
+    """Hop-count shortest paths between switch pairs, computed once per topology change.
+
+    Entries are dropped only for the pairs a link or switch event can affect:
+    a removed link invalidates the pairs whose cached paths cross it, an added
+    link invalidates the pairs it creates an equal or shorter path for.
+    """
+
+    def __init__(self, graph: nx.DiGraph) -> None:
+        self.graph = graph
+        self._paths: Dict[Pair, List[Path]] = {}
+        self._by_edge: Dict[Edge, Set[Pair]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.warmed_version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def get(self, src: int, dst: int) -> List[Path]:
+        key = (src, dst)
+        paths = self._paths.get(key)
+        if paths is not None:
+            self.hits += 1
+            return paths
+
+        self.misses += 1
+        if src not in self.graph or dst not in self.graph:
+            return []
+        paths = shortest_paths(self.graph, src, dst)
+        self._store(key, paths)
+        return paths
+
+    def cached(self, src: int, dst: int) -> bool:
+        return (src, dst) in self._paths
+
+    def put(self, src: int, dst: int, paths: List[Path]) -> None:
+        """Store paths computed elsewhere (e.g. on a graph snapshot); the caller
+        must only do so while the topology is still the one they came from."""
+        if (src, dst) not in self._paths:
+            self._store((src, dst), paths)
+
+    def warm(self, nodes: Optional[Iterable[int]] = None) -> None:
+        """Precompute the path sets between every pair of ``nodes`` (default: all switches)."""
+        self.load(all_pairs_paths(self.graph, nodes))
+
+    def load(self, entries: Dict[Pair, List[Path]], version: Optional[int] = None) -> None:
+        """Store the result of :func:`all_pairs_paths` for pairs not cached yet.
+
+        With ``version`` the cache counts as warmed for that topology version.
+        """
+        for key, paths in entries.items():
+            if key not in self._paths:
+                self._store(key, paths)
+        if version is not None:
+            self.warmed_version = version
+
+    def sync(self, version: int) -> bool:
+        """Warm the cache once per topology version; returns True if work was done."""
+        if version == self.warmed_version:
+            return False
+        self.warm()
+        self.warmed_version = version
+        return True
+
+    def adopt(self, table: Tuple[Dict[Pair, List[Path]], Dict[Edge, Set[Pair]]], version: int) -> None:
+        """Replace the cache with a :func:`path_table` of every switch built for
+        topology ``version`` (e.g. off the hub); O(1), nothing is re-indexed."""
+        self.invalidations += len(self._paths)
+        self._paths, self._by_edge = table
+        self.warmed_version = version
+
+    def link_added(self, src: int, dst: int) -> None:
+        # A cached pair (s, d) changes only if the new edge lies on a path no
+        # longer than the cached ones: dist(s, src) + 1 + dist(dst, d) <= len.
+        if not self._paths:
+            return
+        to_src = nx.single_source_shortest_path_length(self.graph.reverse(copy=False), src)
+        from_dst = nx.single_source_shortest_path_length(self.graph, dst)
+        stale = []
+        for (s, d), paths in self._paths.items():
+            if s not in to_src or d not in from_dst:
+                continue
+            cached_hops = len(paths[0]) - 1 if paths else float("inf")
+            if to_src[s] + 1 + from_dst[d] <= cached_hops:
+                stale.append((s, d))
+        self._invalidate(stale)
+
+    def link_removed(self, src: int, dst: int) -> None:
+        self._invalidate(list(self._by_edge.get((src, dst), ())))
+
+    def switch_added(self, dpid: int) -> None:
+        # An isolated switch cannot shorten any path; its own pairs are never
+        # cached while it is absent from the graph.
+        pass
+
+    def switch_removed(self, dpid: int) -> None:
+        stale = [pair for pair in self._paths if dpid in pair]
+        for (u, v), pairs in self._by_edge.items():
+            if u == dpid or v == dpid:
+                stale.extend(pairs)
+        self._invalidate(stale)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._paths)
+        self._paths.clear()
+        self._by_edge.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._paths),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+    def _store(self, key: Pair, paths: List[Path]) -> None:
+        self._paths[key] = paths
+        for path in paths:
+            for edge in zip(path, path[1:]):
+                self._by_edge.setdefault(edge, set()).add(key)
+
+    def _invalidate(self, pairs: Iterable[Pair]) -> None:
+        for key in set(pairs):
+            paths = self._paths.pop(key, None)
+            if paths is None:
+                continue
+            self.invalidations += 1
+            for path in paths:
+                for edge in zip(path, path[1:]):
+                    indexed = self._by_edge.get(edge)
+                    if indexed is not None:
+                        indexed.discard(key)
+                        if not indexed:
+                            del self._by_edge[edge]
@@ -0,0 +1,214 @@
+"""
+Path selection that keeps flows in place when the set of equal-cost paths changes.
+"""
+
+from __future__ import annotations
+
+import itertools
+import zlib
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from ecmp.flow_hash import FlowHasher, FlowKey, fmix32
+
+T = TypeVar("T")
+Path = Tuple[int, ...]
+Pair = Tuple[int, int]
+
+_MASK32 = 0xFFFFFFFF
+
+
+@lru_cache(maxsize=65536)
+def member_hash(member: Hashable) -> int:
+    """Stable 32-bit identity of a path (or port), independent of its list position."""
+    return zlib.crc32(repr(member).encode())
+
+
+def rendezvous(choices: Sequence[T], flow_hash: int) -> T:
+    """Highest-random-weight choice: removing a member only moves the flows that were on it,
+    and adding one takes a fair share from every other member."""
+    best, best_score = None, -1
+    for choice in choices:
+        score = fmix32((flow_hash ^ member_hash(choice)) & _MASK32)
+        if score > best_score:
+            best, best_score = choice, score
+    return best
+
+
+class BucketTable:
+    """Resilient hashing with a fixed number of buckets per group of members.
+
+    A flow hashes to a bucket and each bucket points at a member, as in the
+    resilient ECMP tables of switch ASICs. When the member set of a group
+    changes, buckets of removed members and the surplus of over-full members
+    are handed to under-full ones; every other bucket keeps its member.
+    """
+
+    def __init__(self, buckets: int = 256) -> None:
+        if buckets < 1:
+            raise ValueError("buckets must be positive")
+        self.buckets = buckets
+        self._tables: Dict[Hashable, Tuple[frozenset, List[object]]] = {}
+        self.counters = {"rebalances": 0, "buckets_moved": 0}
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def select(self, group: Hashable, members: Sequence[T], flow_hash: int) -> T:
+        entry = self._tables.get(group)
+        if entry is None or entry[0] != frozenset(members):
+            entry = self._rebalance(group, members)
+        return entry[1][flow_hash % self.buckets]
+
+    def forget(self, group: Hashable) -> None:
+        self._tables.pop(group, None)
+
+    def _rebalance(self, group: Hashable, members: Sequence[T]) -> Tuple[frozenset, List[object]]:
+        # Deterministic member order so every controller builds the same table
+        ordered = sorted(set(members), key=lambda m: (member_hash(m), repr(m)))
+        n = len(ordered)
+        quota = {m: self.buckets // n + (1 if i < self.buckets % n else 0) for i, m in enumerate(ordered)}
+
+        old = self._tables.get(group)
+        table: List[object] = list(old[1]) if old is not None else [None] * self.buckets
+        held: Dict[object, int] = {m: 0 for m in ordered}
+        free: List[int] = []
+        for index, member in enumerate(table):
+            if member in held and held[member] < quota[member]:
+                held[member] += 1
+            else:
+                free.append(index)
+
+        moved = 0
+        for member in ordered:
+            while held[member] < quota[member]:
+                index = free.pop()
+                if table[index] is not None:
+                    moved += 1
+                table[index] = member
+                held[member] += 1
+
+        entry = (frozenset(ordered), table)
+        self._tables[group] = entry
+        self.counters["rebalances"] += 1
+        self.counters["buckets_moved"] += moved
+        return entry
+
+
+MODES = ("modulo", "rendezvous", "buckets")
+
+
+class PathSelector:
+    """Chooses a flow's path from the equal-cost set using a :class:`~ecmp.flow_hash.FlowHasher`.
+
+    ``modulo`` is plain ``hash % len(paths)``, which remaps most flows
+    whenever the path list changes; ``rendezvous`` and ``buckets`` move only
+    the flows of paths that disappeared, plus a fair share onto new ones.
+    """
+
+    def __init__(self, hasher: FlowHasher, mode: str = "rendezvous", buckets: int = 256) -> None:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        self.hasher = hasher
+        self.mode = mode
+        self.table = BucketTable(buckets)
+
+    def select(self, choices: Sequence[T], key: FlowKey, dpid: Optional[int] = None,
+               group: Optional[Hashable] = None) -> T:
+        """``group`` names the choice set for ``buckets`` mode (default: the first and last hop)."""
+        flow_hash = self.hasher.hash(key, dpid)
+        if self.mode == "rendezvous":
+            return rendezvous(choices, flow_hash)
+        if self.mode == "buckets":
+            if group is None:
+                group = (choices[0][0], choices[0][-1])
+            return self.table.select(group, choices, flow_hash)
+        return choices[flow_hash % len(choices)]
+
+
+class InstalledPaths:
+    """The path every installed flow was given, kept in step with its equal-cost set.
+
+    :meth:`add` records a flow under the path list it was selected from and
+    returns the cookie for its rules (the same one again for a flow that is
+    already installed on that path). :meth:`remap` looks up the current
+    list of every (ingress, egress) pair with installed flows, re-runs the
+    selector only for pairs whose list changed and returns the flows whose
+    path moved, for the caller to reinstall; flows left without a path are
+    forgotten. Counters record how many installed flows were re-checked and
+    how many of them moved.
+    """
+
+    def __init__(self, selector: PathSelector) -> None:
+        self.selector = selector
+        self._flows: Dict[int, Tuple[FlowKey, Path]] = {}
+        self._by_key: Dict[FlowKey, int] = {}
+        self._pairs: Dict[Pair, Tuple[List[Path], Set[int]]] = {}
+        self._cookies = itertools.count(1)
+        self.counters = {"installed": 0, "removed": 0, "checked": 0, "remapped": 0, "unroutable": 0}
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def add(self, key: FlowKey, paths: List[Path], path: Path) -> int:
+        cookie = self._by_key.get(key)
+        if cookie is not None:
+            if self._flows[cookie][1] == path:
+                return cookie
+            self.remove(cookie)
+        cookie = self._by_key[key] = next(self._cookies)
+        self._flows[cookie] = (key, path)
+        pair = (path[0], path[-1])
+        # A pair keeps the list its oldest unchecked flows were selected from,
+        # so a set that changed before the next remap still gets them re-checked
+        entry = self._pairs.get(pair)
+        if entry is None:
+            entry = self._pairs[pair] = (paths, set())
+        entry[1].add(cookie)
+        self.counters["installed"] += 1
+        return cookie
+
+    def get(self, cookie: int) -> Optional[Tuple[FlowKey, Path]]:
+        return self._flows.get(cookie)
+
+    def remove(self, cookie: int) -> Optional[Tuple[FlowKey, Path]]:
+        flow = self._flows.pop(cookie, None)
+        if flow is None:
+            return None
+        del self._by_key[flow[0]]
+        pair = (flow[1][0], flow[1][-1])
+        cookies = self._pairs[pair][1]
+        cookies.discard(cookie)
+        if not cookies:
+            del self._pairs[pair]
+        self.counters["removed"] += 1
+        return flow
+
+    def remap(self, paths_for: Callable[[int, int], List[Path]]
+              ) -> List[Tuple[int, FlowKey, Path, Optional[Path]]]:
+        """(cookie, key, old path, new path or None) for every flow that has to move."""
+        moved = []
+        for pair, (selected_from, cookies) in list(self._pairs.items()):
+            paths = paths_for(*pair)
+            if paths is selected_from or paths == selected_from:
+                continue
+            self.counters["checked"] += len(cookies)
+            for cookie in list(cookies):
+                key, old = self._flows[cookie]
+                new = self.selector.select(paths, key, pair[0]) if paths else None
+                if new == old:
+                    continue
+                moved.append((cookie, key, old, new))
+                if new is None:
+                    del self._flows[cookie]
+                    del self._by_key[key]
+                    cookies.discard(cookie)
+                    self.counters["unroutable"] += 1
+                else:
+                    self._flows[cookie] = (key, new)
+                    self.counters["remapped"] += 1
+            if cookies:
+                self._pairs[pair] = (paths, cookies)
+            else:
+                del self._pairs[pair]
+        return moved
@@ -0,0 +1,239 @@
+"""
+Staggered, load-adaptive scheduling of OpenFlow statistics requests, with request-to-reply latency per xid.
+"""
+
+from __future__ import annotations
+
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ecmp.compute_pool import LatencyStats
+
+KINDS = ("port", "flow", "group")
+JobKey = Tuple[int, str, Optional[int]]
+
+# Fractional parts of multiples of the golden ratio: every prefix of the
+# sequence is spread almost evenly over [0, 1), however many jobs there are.
+_GOLDEN = 0.6180339887498949
+
+
+@dataclass
+class PollJob:
+    dpid: int
+    kind: str  # "port", "flow" or "group"
+    port: Optional[int]  # a single port for hot-port polls; None for the whole switch
+    period: float
+    due: float
+    xid: Optional[int] = None  # of the request still waiting for its reply
+    sent_at: float = 0.0
+
+
+def stats_request(datapath, job: PollJob):
+    """The multipart request ``job`` stands for."""
+    parser = datapath.ofproto_parser
+    ofproto = datapath.ofproto
+    if job.kind == "port":
+        port = job.port if job.port is not None else ofproto.OFPP_ANY
+        return parser.OFPPortStatsRequest(datapath, 0, port)
+    if job.kind == "flow":
+        return parser.OFPFlowStatsRequest(datapath)
+    if job.kind == "group":
+        return parser.OFPGroupStatsRequest(datapath, 0, ofproto.OFPG_ALL)
+    raise ValueError(f"kind must be one of {KINDS}, got {job.kind!r}")
+
+
+class StatsPoller:
+    """Decides which statistics request goes to which switch, and when.
+
+    Each (switch, kind) job polls every ``interval`` seconds from its own
+    phase, so requests (and their replies) are spread over the interval
+    instead of leaving in one burst per round. Ports reported at or above
+    ``hot_threshold`` utilization through :meth:`port_load` get a job of
+    their own every ``hot_interval`` until they cool below
+    ``cool_threshold``; the rest of the switch is still covered by its
+    all-ports job.
+
+    Sent requests are tracked by xid until their (last) reply comes back.
+    A reply slower than ``slow_reply`` seconds, or none within ``timeout``,
+    doubles every poll period of that switch up to ``max_backoff`` times;
+    each timely reply shrinks the factor by ``recovery`` again. A job is not
+    re-sent while its previous request is outstanding.
+    """
+
+    def __init__(self, interval: float = 2.0, hot_interval: Optional[float] = 0.5,
+                 hot_threshold: float = 0.5, cool_threshold: Optional[float] = None,
+                 slow_reply: float = 0.5, timeout: float = 5.0, max_backoff: float = 8.0,
+                 recovery: float = 0.75, clock: Callable[[], float] = time.monotonic) -> None:
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.hot_interval = hot_interval
+        self.hot_threshold = hot_threshold
+        self.cool_threshold = cool_threshold if cool_threshold is not None else hot_threshold / 2
+        self.slow_reply = slow_reply
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.recovery = recovery
+        self.clock = clock
+        self._jobs: Dict[JobKey, PollJob] = {}
+        self._heap: List[Tuple[float, int, JobKey]] = []
+        self._inflight: Dict[Tuple[int, int], PollJob] = {}
+        self._backoff: Dict[int, float] = {}
+        self._created = 0
+        self._seq = 0
+        self.latency = {kind: LatencyStats() for kind in KINDS}
+        self.counters = {
+            "sent": 0,
+            "replies": 0,
+            "slow": 0,
+            "timeouts": 0,
+            "skipped": 0,
+            "unmatched": 0,
+            "hot_added": 0,
+            "hot_removed": 0,
+        }
+
+    def __contains__(self, key: JobKey) -> bool:
+        return key in self._jobs
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def watch(self, dpid: int, kind: str = "port", port: Optional[int] = None,
+              period: Optional[float] = None, now: Optional[float] = None) -> bool:
+        """Start polling; False if the job already exists."""
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}, got {kind!r}")
+        key = (dpid, kind, port)
+        if key in self._jobs:
+            return False
+        now = self.clock() if now is None else now
+        period = period or self.interval
+        phase = (self._created * _GOLDEN) % 1.0
+        self._created += 1
+        job = PollJob(dpid, kind, port, period, now + phase * period)
+        self._jobs[key] = job
+        self._push(job)
+        return True
+
+    def unwatch(self, dpid: int, kind: str = "port", port: Optional[int] = None) -> bool:
+        job = self._jobs.pop((dpid, kind, port), None)
+        if job is None:
+            return False
+        if job.xid is not None:
+            self._inflight.pop((dpid, job.xid), None)
+        return True
+
+    def forget_switch(self, dpid: int) -> None:
+        for key in [key for key in self._jobs if key[0] == dpid]:
+            self.unwatch(*key)
+        self._backoff.pop(dpid, None)
+
+    def backoff(self, dpid: int) -> float:
+        return self._backoff.get(dpid, 1.0)
+
+    def due(self, now: Optional[float] = None) -> List[PollJob]:
+        """Jobs whose request should be sent now; pass each one's xid to :meth:`sent`."""
+        now = self.clock() if now is None else now
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, key = heapq.heappop(self._heap)
+            job = self._jobs.get(key)
+            if job is None or job.due != due:
+                continue  # unwatched or rescheduled since
+            if job.xid is not None:
+                if now - job.sent_at < self.timeout:
+                    self.counters["skipped"] += 1
+                    self._reschedule(job, now)
+                    continue
+                self.counters["timeouts"] += 1
+                self._inflight.pop((job.dpid, job.xid), None)
+                job.xid = None
+                self._slow_down(job.dpid)
+            self._reschedule(job, now)
+            ready.append(job)
+        return ready
+
+    def sent(self, job: PollJob, xid: int, now: Optional[float] = None) -> None:
+        job.xid = xid
+        job.sent_at = self.clock() if now is None else now
+        self._inflight[(job.dpid, xid)] = job
+        self.counters["sent"] += 1
+
+    def replied(self, dpid: int, xid: int, more: bool = False,
+                now: Optional[float] = None) -> Optional[float]:
+        """Seconds from request to its last reply; None for partial or unknown replies.
+
+        ``more`` is set while the switch has further parts of the reply to
+        send (``OFPMPF_REPLY_MORE``).
+        """
+        job = self._inflight.get((dpid, xid))
+        if job is None:
+            self.counters["unmatched"] += 1
+            return None
+        if more:
+            return None
+        del self._inflight[(dpid, xid)]
+        job.xid = None
+        latency = (self.clock() if now is None else now) - job.sent_at
+        self.counters["replies"] += 1
+        self.latency[job.kind].add(latency)
+        if latency > self.slow_reply:
+            self.counters["slow"] += 1
+            self._slow_down(dpid)
+        elif dpid in self._backoff:
+            factor = self._backoff[dpid] * self.recovery
+            if factor <= 1.0:
+                del self._backoff[dpid]
+            else:
+                self._backoff[dpid] = factor
+        return latency
+
+    def port_load(self, dpid: int, port: int, utilization: float, now: Optional[float] = None) -> None:
+        """Latest utilization of an uplink; hot uplinks get polled on their own."""
+        if not self.hot_interval:
+            return
+        key = (dpid, "port", port)
+        if utilization >= self.hot_threshold:
+            if self.watch(dpid, "port", port, self.hot_interval, now):
+                self.counters["hot_added"] += 1
+        elif utilization < self.cool_threshold and key in self._jobs:
+            self.unwatch(*key)
+            self.counters["hot_removed"] += 1
+
+    def sleep_for(self, now: Optional[float] = None, longest: Optional[float] = None) -> float:
+        """Seconds until the next job is due, capped at ``longest`` (default: ``interval``)."""
+        now = self.clock() if now is None else now
+        longest = self.interval if longest is None else longest
+        while self._heap:
+            due, _, key = self._heap[0]
+            job = self._jobs.get(key)
+            if job is not None and job.due == due:
+                return min(max(due - now, 0.0), longest)
+            heapq.heappop(self._heap)
+        return longest
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "hot_ports": sum(1 for key in self._jobs if key[2] is not None),
+            "outstanding": len(self._inflight),
+            "backed_off": {dpid: round(factor, 2) for dpid, factor in self._backoff.items()},
+            "latency": {kind: stats.summary() for kind, stats in self.latency.items() if stats.count},
+            **self.counters,
+        }
+
+    def _reschedule(self, job: PollJob, now: float) -> None:
+        # Keep the job's phase unless it has fallen more than a period behind
+        step = job.period * self._backoff.get(job.dpid, 1.0)
+        job.due = job.due + step if job.due + step > now else now + step
+        self._push(job)
+
+    def _push(self, job: PollJob) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (job.due, self._seq, (job.dpid, job.kind, job.port)))
+
+    def _slow_down(self, dpid: int) -> None:
+        self._backoff[dpid] = min(self._backoff.get(dpid, 1.0) * 2.0, self.max_backoff)
@@ -0,0 +1,239 @@
+"""
+Global traffic engineering: a measured traffic matrix and path splits minimizing the maximum link utilization.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+Path = Tuple[int, ...]
+Pair = Tuple[int, int]
+Link = Tuple[int, int]
+
+
+class TrafficMatrix:
+    """Switch-to-switch demand in bits/s from cumulative per-rule byte counters.
+
+    Each rule (e.g. an ingress rule from a flow stats reply) is observed with
+    its byte count and its own age (``duration_sec``/``duration_nsec``), so
+    rates are exact over the rule's lifetime between replies and a re-added
+    rule (younger than the last reading) simply starts over. Rates are EWMA
+    smoothed with time constant ``tau`` seconds; rules not seen for
+    ``max_age`` seconds stop counting.
+    """
+
+    def __init__(self, tau: float = 4.0, max_age: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.tau = tau
+        self.max_age = max_age
+        self.clock = clock
+        # rule -> [src, dst, byte_count, duration, rate_bps, last_seen]
+        self._rules: Dict[Hashable, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def observe(self, src: int, dst: int, rule: Hashable, byte_count: int, duration: float) -> None:
+        now = self.clock()
+        entry = self._rules.get(rule)
+        if entry is None or entry[:2] != [src, dst] or duration <= entry[3] or byte_count < entry[2]:
+            self._rules[rule] = [src, dst, byte_count, duration, 0.0 if entry is None else entry[4], now]
+            return
+        interval = duration - entry[3]
+        sample = (byte_count - entry[2]) * 8.0 / interval
+        alpha = 1.0 - math.exp(-interval / self.tau)
+        entry[2:] = [byte_count, duration, entry[4] + alpha * (sample - entry[4]), now]
+
+    def demands(self) -> Dict[Pair, float]:
+        now = self.clock()
+        stale = [rule for rule, entry in self._rules.items() if now - entry[5] > self.max_age]
+        for rule in stale:
+            del self._rules[rule]
+        out: Dict[Pair, float] = {}
+        for src, dst, _, _, rate, _ in self._rules.values():
+            if rate > 0:
+                out[(src, dst)] = out.get((src, dst), 0.0) + rate
+        return out
+
+
+@dataclass
+class TEProblem:
+    """Commodities with candidate paths in flat (CSR-like) arrays.
+
+    Paths of one commodity are contiguous; ``entry_path``/``entry_link``
+    list every (path, link) incidence, so link loads and path costs are each
+    one ``bincount``.
+    """
+
+    pairs: List[Pair]
+    demand: np.ndarray  # (K,) bits/s
+    paths: List[Path]
+    commodity: np.ndarray  # (P,) commodity of each path
+    starts: np.ndarray  # (K,) first path of each commodity
+    links: List[Link]
+    capacity: np.ndarray  # (L,) bits/s
+    entry_path: np.ndarray  # (E,)
+    entry_link: np.ndarray  # (E,)
+
+    def link_load(self, fractions: np.ndarray) -> np.ndarray:
+        flow = fractions * self.demand[self.commodity]
+        return np.bincount(self.entry_link, weights=flow[self.entry_path], minlength=len(self.links))
+
+    def utilization(self, fractions: np.ndarray) -> np.ndarray:
+        return self.link_load(fractions) / self.capacity
+
+    def equal_split(self) -> np.ndarray:
+        sizes = np.diff(np.append(self.starts, len(self.paths)))
+        return 1.0 / sizes[self.commodity]
+
+
+def build_problem(demands: Mapping[Pair, float], paths: Mapping[Pair, Sequence[Path]],
+                  capacity: Mapping[Link, float]) -> TEProblem:
+    """Problem over the pairs of ``demands`` that have at least one path in ``paths``."""
+    pairs, demand, all_paths, commodity, starts = [], [], [], [], []
+    link_ids: Dict[Link, int] = {}
+    entry_path: List[int] = []
+    entry_link: List[int] = []
+    for pair, rate in demands.items():
+        candidates = paths.get(pair)
+        if not candidates or rate <= 0:
+            continue
+        k = len(pairs)
+        pairs.append(pair)
+        demand.append(rate)
+        starts.append(len(all_paths))
+        for path in candidates:
+            p = len(all_paths)
+            all_paths.append(path)
+            commodity.append(k)
+            for link in zip(path, path[1:]):
+                link_id = link_ids.get(link)
+                if link_id is None:
+                    link_id = link_ids[link] = len(link_ids)
+                entry_path.append(p)
+                entry_link.append(link_id)
+    links = list(link_ids)
+    return TEProblem(pairs, np.array(demand, dtype=np.float64), all_paths,
+                     np.array(commodity, dtype=np.intp), np.array(starts, dtype=np.intp), links,
+                     np.array([capacity[link] for link in links], dtype=np.float64),
+                     np.array(entry_path, dtype=np.intp), np.array(entry_link, dtype=np.intp))
+
+
+@dataclass
+class TESolution:
+    fractions: np.ndarray  # (P,) share of its commodity's demand on each path
+    max_utilization: float
+    equal_split_utilization: float
+    iterations: int
+
+
+def min_max_utilization(problem: TEProblem, iterations: int = 100, sharpness: float = 30.0,
+                        tolerance: float = 1e-4) -> TESolution:
+    """Path splits that (approximately) minimize the maximum link utilization.
+
+    Frank-Wolfe on the log-sum-exp of utilizations, a smooth stand-in for
+    their maximum: each iteration prices links by their softmax weight over
+    capacity, moves every commodity towards its cheapest path with the step
+    that best lowers the smooth objective, and keeps the best true maximum
+    seen. ``sharpness`` is the softmax temperature relative to the current
+    maximum. Starts from the equal (ECMP) split, so the result is never
+    worse than it.
+    """
+    if not problem.paths:
+        return TESolution(np.zeros(0), 0.0, 0.0, 0)
+    x = problem.equal_split()
+    util = problem.utilization(x)
+    ecmp = best_max = float(util.max())
+    best = x.copy()
+    steps = np.array([1.0, 0.5, 0.25, 0.125, 0.0625, 0.03125, 0.015625])
+    n_paths = len(problem.paths)
+    done = 0
+    for done in range(1, iterations + 1):
+        peak = max(float(util.max()), 1e-12)
+        beta = sharpness / peak
+        weight = np.exp(beta * (util - peak))
+        weight /= weight.sum()
+        price = weight / problem.capacity
+        cost = np.bincount(problem.entry_path, weights=price[problem.entry_link], minlength=n_paths)
+
+        # All of each commodity on its cheapest path (first one on ties)
+        cheapest = np.minimum.reduceat(cost, problem.starts)
+        candidates = np.flatnonzero(cost <= cheapest[problem.commodity])
+        _, first = np.unique(problem.commodity[candidates], return_index=True)
+        target = np.zeros(n_paths)
+        target[candidates[first]] = 1.0
+
+        direction = target - x
+        delta = problem.utilization(direction)
+        if not delta.any():
+            break
+        # Smooth objective for each step size, evaluated for all at once
+        trial = util[None, :] + steps[:, None] * delta[None, :]
+        top = trial.max(axis=1, keepdims=True)
+        smooth = top[:, 0] + np.log(np.exp(beta * (trial - top)).sum(axis=1)) / beta
+        step = steps[int(smooth.argmin())]
+        x = x + step * direction
+        util = util + step * delta
+
+        current = float(util.max())
+        if current < best_max - tolerance * best_max:
+            best_max, best = current, x.copy()
+    return TESolution(best, best_max, ecmp, done)
+
+
+def next_hop_shares(problem: TEProblem, fractions: np.ndarray, port: Mapping[Link, int]
+                    ) -> Dict[Pair, Dict[int, float]]:
+    """(switch, destination) -> {egress port: share} realizing ``fractions`` hop by hop.
+
+    Destination-based select groups cannot tell sources apart, so every
+    switch splits the traffic it carries towards a destination in the
+    proportion of the optimized flow on each of its egress links; the link
+    loads are then exactly those of the optimized path flows.
+    """
+    flow = fractions * problem.demand[problem.commodity]
+    destinations = sorted({pair[1] for pair in problem.pairs})
+    dst_index = {dst: i for i, dst in enumerate(destinations)}
+    commodity_dst = np.array([dst_index[pair[1]] for pair in problem.pairs], dtype=np.int64)
+    # Optimized flow summed per (link, destination)
+    keys = (problem.entry_link.astype(np.int64) * len(destinations)
+            + commodity_dst[problem.commodity[problem.entry_path]])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=flow[problem.entry_path])
+
+    shares: Dict[Pair, Dict[int, float]] = {}
+    for key, total in zip(unique.tolist(), totals.tolist()):
+        link, dst = divmod(key, len(destinations))
+        sw, nxt = problem.links[link]
+        out = shares.setdefault((sw, destinations[dst]), {})
+        out[port[(sw, nxt)]] = out.get(port[(sw, nxt)], 0.0) + total
+    for split in shares.values():
+        total = sum(split.values())
+        for out_port in split:
+            split[out_port] = split[out_port] / total if total > 0 else 1.0 / len(split)
+    return shares
+
+
+def bucket_weights(shares: Mapping[int, float], ports: Sequence[int], scale: int = 100) -> Tuple[int, ...]:
+    """Integer select-group weights for ``ports`` summing to ``scale`` (largest remainder)."""
+    raw = np.array([shares.get(p, 0.0) for p in ports], dtype=np.float64)
+    if raw.sum() <= 0:
+        return tuple(1 for _ in ports)
+    raw = raw / raw.sum() * scale
+    weights = np.floor(raw).astype(int)
+    for i in np.argsort(-(raw - weights), kind="stable")[:scale - int(weights.sum())]:
+        weights[i] += 1
+    return tuple(int(w) for w in weights)
+
+
+def optimize(demands: Mapping[Pair, float], paths: Mapping[Pair, Sequence[Path]],
+             capacity: Mapping[Link, float], port: Mapping[Link, int],
+             iterations: int = 100) -> Tuple[TESolution, Dict[Pair, Dict[int, float]]]:
+    """Build, solve and map to next-hop shares; a self-contained job for a worker thread."""
+    problem = build_problem(demands, paths, capacity)
+    solution = min_max_utilization(problem, iterations)
+    return solution, next_hop_shares(problem, solution.fractions, port)
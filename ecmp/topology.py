@@ -0,0 +1,124 @@
+"""
+Incrementally maintained switch graph driven by Ryu topology events.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import networkx as nx
+
+
+class Topology:
+    """Owns the controller's ``nx.DiGraph`` and applies one switch/link event at a time.
+
+    ``version`` increases on every change that alters the graph, so derived
+    state (path caches, broadcast trees, group tables) can tell whether it is
+    stale without diffing the graph. Listeners receive ``switch_added``,
+    ``switch_removed``, ``link_added`` and ``link_removed`` callbacks after the
+    graph has been updated for additions and before it is updated for removals.
+    """
+
+    def __init__(self, graph: Optional[nx.DiGraph] = None) -> None:
+        self.graph = graph if graph is not None else nx.DiGraph()
+        self.version = 0
+        self._listeners: List[object] = []
+        # (dpid, port) -> number of links using it, at either end
+        self._link_ports: Dict[Tuple[int, int], int] = {}
+        self._ports: Dict[int, Set[int]] = {}
+
+    def subscribe(self, listener: object) -> None:
+        self._listeners.append(listener)
+
+    def is_edge_port(self, dpid: int, port: int) -> bool:
+        """True unless LLDP has discovered an inter-switch link on ``(dpid, port)``, in either direction."""
+        return (dpid, port) not in self._link_ports
+
+    def edge_ports(self, dpid: int) -> List[int]:
+        """Known ports of ``dpid`` that do not lead to another switch."""
+        return sorted(port for port in self._ports.get(dpid, ())
+                      if (dpid, port) not in self._link_ports)
+
+    def add_switch(self, dpid: int, ports: Iterable[int] = ()) -> bool:
+        ports = set(ports)
+        if ports:
+            self._ports[dpid] = ports
+        if dpid in self.graph:
+            return False
+        self.graph.add_node(dpid)
+        self.version += 1
+        self._notify("switch_added", dpid)
+        return True
+
+    def remove_switch(self, dpid: int) -> bool:
+        if dpid not in self.graph:
+            return False
+        self._notify("switch_removed", dpid)
+        for src, dst, attrs in list(self.graph.in_edges(dpid, data=True)):
+            self._release(src, attrs.get("port"))
+            self._release(dst, attrs.get("dst_port"))
+        for src, dst, attrs in list(self.graph.out_edges(dpid, data=True)):
+            self._release(src, attrs.get("port"))
+            self._release(dst, attrs.get("dst_port"))
+        self.graph.remove_node(dpid)
+        self._ports.pop(dpid, None)
+        self.version += 1
+        return True
+
+    def add_link(self, src: int, dst: int, port: int, weight: int = 1,
+                 dst_port: Optional[int] = None) -> bool:
+        """``port`` is the egress port on ``src``; ``dst_port``, if known, the ingress port on ``dst``.
+
+        Both ends stop being edge ports, so a port whose link has only been
+        discovered in the other direction is not mistaken for a host port.
+        """
+        attrs = self.graph.get_edge_data(src, dst)
+        if attrs is not None:
+            if dst_port is None:
+                dst_port = attrs.get("dst_port")
+            if attrs.get("port") == port and attrs.get("dst_port") == dst_port:
+                return False
+            # Same switch pair re-cabled on another port: the path set is
+            # unchanged, but listeners deriving ports from the link (flood
+            # ports, installed rules) must still hear about it.
+            self._release(src, attrs.get("port"))
+            self._release(dst, attrs.get("dst_port"))
+            self._claim(src, port)
+            self._claim(dst, dst_port)
+            attrs["port"] = port
+            attrs["dst_port"] = dst_port
+            self.version += 1
+            self._notify("link_added", src, dst)
+            return True
+        self.graph.add_edge(src, dst, port=port, dst_port=dst_port, weight=weight)
+        self._claim(src, port)
+        self._claim(dst, dst_port)
+        self.version += 1
+        self._notify("link_added", src, dst)
+        return True
+
+    def remove_link(self, src: int, dst: int) -> bool:
+        if not self.graph.has_edge(src, dst):
+            return False
+        self._notify("link_removed", src, dst)
+        attrs = self.graph[src][dst]
+        self._release(src, attrs.get("port"))
+        self._release(dst, attrs.get("dst_port"))
+        self.graph.remove_edge(src, dst)
+        self.version += 1
+        return True
+
+    def _claim(self, dpid: int, port: Optional[int]) -> None:
+        if port is not None:
+            self._link_ports[(dpid, port)] = self._link_ports.get((dpid, port), 0) + 1
+
+    def _release(self, dpid: int, port: Optional[int]) -> None:
+        count = self._link_ports.pop((dpid, port), 0) - 1
+        if count > 0:
+            self._link_ports[(dpid, port)] = count
+
+    def _notify(self, method: str, *args: int) -> None:
+        for listener in self._listeners:
+            callback = getattr(listener, method, None)
+            if callback is not None:
+                callback(*args)
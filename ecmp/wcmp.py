@@ -0,0 +1,126 @@
+"""
+Weighted-cost multipath (WCMP): select group bucket weights from uplink capacity and residual bandwidth.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Hashable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def residual_shares(capacity: Sequence[float], used: Sequence[float], floor: float = 0.05) -> np.ndarray:
+    """Traffic share per uplink in proportion to its unused bandwidth.
+
+    Every uplink with capacity keeps at least ``floor`` of its capacity as
+    headroom in the calculation, so a saturated uplink still gets a small
+    share instead of flapping to zero and back; uplinks without capacity
+    (down) get none. All shares are equal if nothing has capacity.
+    """
+    capacity = np.asarray(capacity, dtype=np.float64)
+    used = np.asarray(used, dtype=np.float64)
+    free = np.where(capacity > 0, np.maximum(capacity - used, floor * capacity), 0.0)
+    total = free.sum()
+    if total <= 0:
+        return np.full(len(capacity), 1.0 / len(capacity)) if len(capacity) else free
+    return free / total
+
+
+def quantize(shares: Sequence[float], budget: int) -> Tuple[int, ...]:
+    """Integer weights for ``shares`` using at most ``budget`` buckets in total.
+
+    For every total from 1 to ``budget`` the shares are rounded by largest
+    remainder (which minimizes the largest per-bucket error for that total);
+    the total with the smallest maximum deviation from ``shares`` wins, then
+    the smallest summed deviation, then the smallest total, so equal shares
+    come out as all ones.
+    """
+    shares = np.asarray(shares, dtype=np.float64)
+    n = len(shares)
+    if n == 0:
+        return ()
+    if budget < 1:
+        raise ValueError("budget must be positive")
+    total = shares.sum()
+    shares = shares / total if total > 0 else np.full(n, 1.0 / n)
+    totals = np.arange(1, budget + 1, dtype=np.float64)[:, None]
+    raw = totals * shares[None, :]
+    weights = np.floor(raw)
+    short = (totals[:, 0] - weights.sum(axis=1)).round().astype(np.intp)
+    # Rank of each bucket's remainder within its row; the ``short`` largest get one more
+    order = np.argsort(-(raw - weights), axis=1, kind="stable")
+    rank = np.empty_like(order)
+    rank[np.arange(budget)[:, None], order] = np.arange(n)
+    weights += rank < short[:, None]
+    deviation = np.abs(weights / totals - shares[None, :])
+    worst = deviation.max(axis=1)
+    tied = np.flatnonzero(worst <= worst.min() + 1e-12)
+    summed = deviation[tied].sum(axis=1)
+    best = int(tied[np.flatnonzero(summed <= summed.min() + 1e-12)[0]])
+    return tuple(int(w) for w in weights[best])
+
+
+class WcmpWeights:
+    """Installed uplink weights per select group, re-weighted from port statistics.
+
+    :meth:`reset` records equal weights when a group is (re)created;
+    :meth:`update` turns the uplinks' capacities and measured rates into
+    quantized weights and returns them only when the resulting traffic
+    distribution differs from the installed one by more than ``min_delta``
+    on some uplink, so small fluctuations cause no ``OFPGC_MODIFY`` at all.
+    """
+
+    def __init__(self, budget: int = 64, min_delta: float = 0.05, floor: float = 0.05) -> None:
+        if budget < 1:
+            raise ValueError("budget must be positive")
+        self.budget = budget
+        self.min_delta = min_delta
+        self.floor = floor
+        self._installed: Dict[Hashable, Dict[int, int]] = {}
+        self.counters = {
+            "updates": 0,
+            "modified": 0,
+            "suppressed": 0,
+        }
+
+    def __contains__(self, group: Hashable) -> bool:
+        return group in self._installed
+
+    def installed(self, group: Hashable) -> Optional[Dict[int, int]]:
+        return self._installed.get(group)
+
+    def reset(self, group: Hashable, ports: Sequence[int]) -> Dict[int, int]:
+        """Equal weights for a group being installed; returns them for the ADD."""
+        weights = {port: 1 for port in ports}
+        self._installed[group] = weights
+        return dict(weights)
+
+    def forget(self, group: Hashable) -> None:
+        self._installed.pop(group, None)
+
+    def update(self, group: Hashable, capacity: Mapping[int, float],
+               used: Mapping[int, float]) -> Optional[Dict[int, int]]:
+        """New weights for the uplinks in ``capacity`` (bits/s), or None to keep the installed ones.
+
+        ``used`` is each uplink's measured transmit rate in bits/s.
+        """
+        self.counters["updates"] += 1
+        ports = sorted(capacity)
+        shares = residual_shares([capacity[p] for p in ports], [used.get(p, 0.0) for p in ports], self.floor)
+        weights = dict(zip(ports, quantize(shares, self.budget)))
+        installed = self._installed.get(group)
+        if installed is not None and set(installed) == set(weights) and \
+                self.distance(installed, weights) <= self.min_delta:
+            self.counters["suppressed"] += 1
+            return None
+        self._installed[group] = weights
+        self.counters["modified"] += 1
+        return dict(weights)
+
+    @staticmethod
+    def distance(old: Mapping[int, int], new: Mapping[int, int]) -> float:
+        """Largest change of any port's traffic share between two weight sets."""
+        old_total = sum(old.values()) or 1
+        new_total = sum(new.values()) or 1
+        return max(abs(old.get(port, 0) / old_total - new.get(port, 0) / new_total)
+                   for port in set(old) | set(new))
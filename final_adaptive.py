@@ -1,4 +1,5 @@
 
+import time
 from operator import attrgetter
 
 from ryu.base import app_manager
@@ -14,25 +15,88 @@ from ryu.lib.packet import ipv4
 from ryu.lib.packet import tcp
 from ryu.lib.packet import udp,arp
 from ryu.lib import hub
+from ryu.topology import event
+
+from ecmp.arp_proxy import ArpProxy
+from ecmp.event_log import EventLog
+from ecmp.fabric_roles import LEAF, SPINE, FabricRoles
+from ecmp.failover import uplink_group_mods
+from ecmp.fast_parse import parse_headers
+from ecmp.host_table import HostTable
+from ecmp.packet_in import PacketInDispatcher, metered_table_miss
+from ecmp.stats_poller import StatsPoller, stats_request
+from ecmp.topology import Topology
+from ecmp.wcmp import WcmpWeights
 
 
 class SimpleSwitch13(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
+    FLOW_PRIORITY = 3  # forwarding rules installed from packet-ins
+    UPLINK_GROUP_BASE = 50  # select group id of the first leaf seen; every leaf gets its own
+    UPLINK_CAPACITY_BPS = 3e6  # bw=3 TCLinks in simple_topo
+    WCMP_BUCKET_BUDGET = 64  # total bucket weight the switch can realize per group
+    WCMP_MIN_DELTA = 0.05  # share change on some uplink below which weights are not re-sent
+    FAST_PARSER = True  # read headers in place; False decodes every packet with Ryu
+    FAILOVER_MODE = 'chained'  # 'none', 'watch' (live select buckets) or 'chained' (OFPGT_FF per uplink)
+    PACKET_IN_METER = True  # rate-limit table misses on the switch (needs OF1.3 meter support)
+    PACKET_IN_RATE = 1000  # packets/s per switch let through by the meter
+    PACKET_IN_BURST = 200
+    PACKET_IN_BUDGET = 2000  # packet-ins/s handled by the controller, the rest is shed
+    STATS_HOT_INTERVAL = 0.5  # seconds between polls of an uplink above STATS_HOT_THRESHOLD; 0 disables
+    STATS_HOT_THRESHOLD = 0.5  # fraction of UPLINK_CAPACITY_BPS
+    STATS_SLOW_REPLY = 0.5  # seconds; slower stats replies back off polling of that switch
+    EVENT_LOG = None  # opt-in JSONL file for per-packet events, e.g. 'final_adaptive_events.jsonl'
+    EVENT_LOG_MAX_BYTES = 64 << 20  # the file is rotated at this size
+    EVENT_LOG_BACKUPS = 3  # rotated files kept
+    EVENT_FIELDS = {  # names of the values each event type is emitted with
+        'forward': ('sw', 'in_port', 'src', 'dst', 'port'),
+        'uplink': ('leaf', 'port', 'tx_bps'),
+        'group_flow': ('leaf', 'dst', 'group'),
+        'arp': ('sw', 'src', 'dst'),
+        'arp_reply': ('sw', 'who_has', 'to'),
+        'flow_stats': ('sw', 'flows'),
+        'group_stats': ('sw', 'groups'),
+        'port_stats': ('sw', 'ports'),
+    }
+    EVENT_SAMPLE = {'forward': 10, 'uplink': 10}  # only every Nth event of these types is logged
+    EVENT_RATE = 200  # events/s logged per type at most
+
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.logger.info('SimpleSwitch13 initialized')
         self.mac_to_port = {}
-        self.group_mod_flag = {}
+        # Leaves, spines, uplinks and host ports come from LLDP discovery
+        # (run with --observe-links)
+        self.topology = Topology()
+        self.roles = FabricRoles(self.topology, self.UPLINK_GROUP_BASE)
+        self.hosts = HostTable()
+        self.arp_proxy = ArpProxy()
+        self.wcmp = WcmpWeights(self.WCMP_BUCKET_BUDGET, self.WCMP_MIN_DELTA)
+        # Per-packet and per-poll records go to a writer thread, not the hub
+        self.events = EventLog(self.EVENT_LOG, self.EVENT_FIELDS, self.EVENT_SAMPLE, default_rate=self.EVENT_RATE,
+                               max_bytes=self.EVENT_LOG_MAX_BYTES, backups=self.EVENT_LOG_BACKUPS)
+        if not self.events.enabled:
+            self.logger.info("[LOG] Per-packet events are off; set EVENT_LOG to a file name to record them")
 
         # monitor
         self.sleep = 2
         self.datapaths = {}
+        self.stats_poller = StatsPoller(self.sleep, self.STATS_HOT_INTERVAL, self.STATS_HOT_THRESHOLD,
+                                        slow_reply=self.STATS_SLOW_REPLY)
         self.monitor_thread = hub.spawn(self._monitor)
+        self.packet_in_dispatcher = PacketInDispatcher(self._handle_packet_in, budget=self.PACKET_IN_BUDGET)
+        self.dispatch_thread = hub.spawn(self.packet_in_dispatcher.run, hub.sleep)
         self.tx_pkt_cur = {}    # currently monitoring TX packets
         self.tx_byte_cur = {}   # currently monitoring TX bytes
         self.tx_pkt_int = {}    # TX packets in the last monitoring interval
         self.tx_byte_int = {}    # TX bytes in the last monitoring interval
+        self.tx_duration_cur = {}  # port duration of the last reply, seconds
+        self.tx_bps = {}    # TX rate over the last monitoring interval
+
+    def close(self):
+        self.events.close()
+        super(SimpleSwitch13, self).close()
 
     @set_ev_cls(ofp_event.EventOFPStateChange,
                 [MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -42,10 +106,17 @@ class SimpleSwitch13(app_manager.RyuApp):
             if not datapath.id in self.datapaths:
                 self.logger.debug('register datapath: %016x', datapath.id)
                 self.datapaths[datapath.id] = datapath
+                self.stats_poller.forget_switch(datapath.id)
+                for kind in ('port', 'flow', 'group'):
+                    self.stats_poller.watch(datapath.id, kind)
+                self._update_uplink_groups()
         elif ev.state == DEAD_DISPATCHER:
             if datapath.id in self.datapaths:
                 self.logger.debug('unregister datapath: %016x', datapath.id)
                 del self.datapaths[datapath.id]
+                self.stats_poller.forget_switch(datapath.id)
+                self.roles.forget(datapath.id)
+                self.wcmp.forget(datapath.id)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -63,16 +134,56 @@ class SimpleSwitch13(app_manager.RyuApp):
         # 128, OVS will send Packet-In with invalid buffer_id and
         # truncated packet data. In that case, we cannot output packets
         # correctly.  The bug has been fixed in OVS v2.1.0.
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, 0, match, actions)
-
-        self.group_mod_flag[dpid] = True
-        if self.group_mod_flag[dpid] is True and dpid in [513, 514]:
-                    self.send_group_mod(datapath)
-                    self.logger.info("send_group_mod")
-                    self.group_mod_flag[dpid] = False
+        #
+        # The entry goes through a per-switch meter so a scanning host cannot
+        # saturate the controller with packet-ins.
+        if self.PACKET_IN_METER:
+            for mod in metered_table_miss(datapath, self.PACKET_IN_RATE, self.PACKET_IN_BURST):
+                datapath.send_msg(mod)
+        else:
+            match = parser.OFPMatch()
+            actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
+                                              ofproto.OFPCML_NO_BUFFER)]
+            self.add_flow(datapath, 0, 0, match, actions)
+
+    @set_ev_cls(event.EventSwitchEnter)
+    def on_switch_enter(self, ev):
+        dpid = ev.switch.dp.id
+        if self.topology.add_switch(dpid, [p.port_no for p in ev.switch.ports]):
+            self.logger.info("[TOPO] Switch joined: %s", dpid)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def on_switch_leave(self, ev):
+        dpid = ev.switch.dp.id
+        self.hosts.forget_switch(dpid)
+        self.roles.forget(dpid)
+        self.wcmp.forget(dpid)
+        if self.topology.remove_switch(dpid):
+            self.logger.info("[TOPO] Switch left: %s", dpid)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventLinkAdd)
+    def on_link_add(self, ev):
+        src = ev.link.src.dpid
+        port = ev.link.src.port_no
+        self.hosts.forget_port(src, port)
+        self.hosts.forget_port(ev.link.dst.dpid, ev.link.dst.port_no)
+        if self.topology.add_link(src, ev.link.dst.dpid, port, dst_port=ev.link.dst.port_no):
+            self.logger.info("[TOPO] Link added: %s -> %s via port %s", src, ev.link.dst.dpid, port)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventLinkDelete)
+    def on_link_delete(self, ev):
+        if self.topology.remove_link(ev.link.src.dpid, ev.link.dst.dpid):
+            self.logger.info("[TOPO] Link removed: %s -> %s", ev.link.src.dpid, ev.link.dst.dpid)
+            self._update_uplink_groups()
+
+    def _update_uplink_groups(self):
+        # Every leaf spreads over the uplinks discovered on it; its group is
+        # re-sent only when spines or links come or go
+        for dpid, group in sorted(self.roles.take_changed(ready=self.datapaths).items()):
+            self.send_group_mod(self.datapaths[dpid], group)
 
     def add_flow(self, datapath, hard_timeout, priority, match, actions, buffer_id=None):
         ofproto = datapath.ofproto
@@ -91,38 +202,80 @@ class SimpleSwitch13(app_manager.RyuApp):
 
         datapath.send_msg(mod)
 
-    def send_group_mod(self, datapath):
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        group_id = 50
-        port_1 = 1
-        port_2 = 2
-
-        actions_1 = [parser.OFPActionSetQueue(0), parser.OFPActionOutput(port_1)]
-        actions_2 = [parser.OFPActionSetQueue(0), parser.OFPActionOutput(port_2)]
-
-        weight_1 = 50
-        weight_2 = 50
-
-        watch_port = ofproto.OFPP_ANY
-        watch_group = ofproto.OFPG_ANY
-
-        buckets = [
-            parser.OFPBucket(weight=weight_1, watch_port=watch_port,
-                            watch_group=watch_group, actions=actions_1),
-            parser.OFPBucket(weight=weight_2, watch_port=watch_port,
-                            watch_group=watch_group, actions=actions_2)
-        ]
+    def send_group_mod(self, datapath, group):
+        # Equal weights whenever the uplink set changes, until port
+        # statistics say otherwise
+        weights = self.wcmp.reset(datapath.id, group.ports)
+
+        # Buckets watch their uplink (directly or through a fast-failover
+        # group), so the switch stops using a dead uplink on its own
+        for req in uplink_group_mods(datapath, group.group_id, group.ports, weights,
+                                     mode=self.FAILOVER_MODE, add=not group.previous,
+                                     previous=group.previous):
+            datapath.send_msg(req)
+        self.logger.info("Group ID %d on switch %d spreads over uplinks %s", group.group_id,
+                         datapath.id, list(group.ports))
+
+    def update_group_weights(self, datapath):
+        # Uplink weights follow residual bandwidth; shifts below
+        # WCMP_MIN_DELTA are not worth a GroupMod
+        group_id = self.roles.group_id(datapath.id)
+        ports = sorted(self.wcmp.installed(datapath.id))
+        tx_bps = self.tx_bps.get(datapath.id, {})
+        capacity = {port: self.UPLINK_CAPACITY_BPS for port in ports}
+        used = {port: tx_bps.get(port, 0.0) for port in ports}
+        weights = self.wcmp.update(datapath.id, capacity, used)
+        if weights is None:
+            return
+        for req in uplink_group_mods(datapath, group_id, ports, weights,
+                                     mode=self.FAILOVER_MODE, add=False):
+            datapath.send_msg(req)
+        self.logger.info("Group ID %d on switch %d re-weighted: %s", group_id,
+                         datapath.id, weights)
 
-        req = parser.OFPGroupMod(datapath, ofproto.OFPFC_ADD,
-                                ofproto.OFPGT_SELECT, group_id, buckets)
-        datapath.send_msg(req)
-        self.logger.info("Group ID %d installed on switch %d", group_id, datapath.id)
 
+    def _handle_arp(self, msg, in_port, eth, arp_pkt):
+        # ARP is answered from the cache where possible instead of installing
+        # a FLOOD rule, which looped broadcasts between the leaves and spines
+        datapath = msg.datapath
+        dpid = datapath.id
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if self.roles.is_host_port(dpid, in_port):
+            self.hosts.learn(eth.src, dpid, in_port, ip=arp_pkt.src_ip)
+            self.arp_proxy.learn(arp_pkt.src_ip, arp_pkt.src_mac)
+
+        if arp_pkt.opcode == arp.ARP_REQUEST:
+            reply = self.arp_proxy.reply_for(arp_pkt.src_mac, arp_pkt.src_ip, arp_pkt.dst_ip)
+            if reply is not None:
+                actions = [parser.OFPActionOutput(in_port)]
+                out = parser.OFPPacketOut(datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                                          in_port=ofproto.OFPP_CONTROLLER, actions=actions, data=reply)
+                datapath.send_msg(out)
+                self.events.emit('arp_reply', dpid, arp_pkt.dst_ip, arp_pkt.src_ip)
+                return
+
+        location = self.hosts.lookup(eth.dst)
+        targets = [location] if location is not None else [
+            (leaf, port) for leaf in self.roles.leaves() for port in self.roles.host_ports(leaf)
+            if (leaf, port) != (dpid, in_port)]
+        for leaf, port in targets:
+            dp = self.datapaths.get(leaf)
+            if dp is None:
+                continue
+            out = dp.ofproto_parser.OFPPacketOut(datapath=dp, buffer_id=dp.ofproto.OFP_NO_BUFFER,
+                                                 in_port=dp.ofproto.OFPP_CONTROLLER,
+                                                 actions=[dp.ofproto_parser.OFPActionOutput(port)],
+                                                 data=msg.data)
+            dp.send_msg(out)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        # LLDP, ARP and first packets of a flow are served before repeats;
+        # past the budget the lowest class is shed
+        self.packet_in_dispatcher.submit(ev)
+
+    def _handle_packet_in(self, ev):
         # Only log PacketIn if not ARP
 
         # If you hit this you might want to increase
@@ -138,8 +291,11 @@ class SimpleSwitch13(app_manager.RyuApp):
         in_port = msg.match['in_port']
         dpid = datapath.id
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        eth, arp_pkt, _ = parse_headers(msg.data, fast=self.FAST_PARSER)
+
+        if eth.ethertype == ether_types.ETH_TYPE_LLDP:
+            # link discovery, handled by ryu.topology
+            return
 
         # if eth.dst.startswith('33:33'):
         #     # Ignore IPv6 multicast packets
@@ -149,21 +305,9 @@ class SimpleSwitch13(app_manager.RyuApp):
         #     # ignore lldp packet
         #     return
 
-        arp_pkt = pkt.get_protocol(arp.arp)
-
-        if not arp_pkt:
-            self.logger.info('Packets inn plsssss')
-
         if arp_pkt:
-            self.logger.info("Received ARP: %s -> %s", arp_pkt.src_ip, arp_pkt.dst_ip)
-            match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP)
-            actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
-            self.add_flow(datapath, hard_timeout=0, priority=1, match=match, actions=actions)
-
-            data = msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None
-            out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
-                                    in_port=in_port, actions=actions, data=data)
-            datapath.send_msg(out)
+            self.events.emit('arp', dpid, arp_pkt.src_ip, arp_pkt.dst_ip)
+            self._handle_arp(msg, in_port, eth, arp_pkt)
             return
 
         dst = eth.dst
@@ -177,20 +321,19 @@ class SimpleSwitch13(app_manager.RyuApp):
         self.mac_to_port[dpid][src] = in_port
 
         # self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
-        self.logger.info(f'{dpid}')
-        if dpid == 513 or dpid == 514:
+        role = self.roles.role(dpid)
+        if role == LEAF:
             # leaf switch
-            self.logger.info('leaf if')
             # Always learn the source MAC and port
             # self.mac_to_port[dpid][src] = in_port
-            if in_port in [3, 4]:
+            if self.roles.is_host_port(dpid, in_port):
                 # Packet from host port
                 if dst in self.mac_to_port[dpid]:
                     # Destination MAC is known (intra-leaf or learned)
                     out_port = self.mac_to_port[dpid][dst]
                     actions = [parser.OFPActionOutput(out_port)]
                     match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
-                    self.add_flow(datapath, 1000, 3, match, actions)
+                    self.add_flow(datapath, 1000, self.FLOW_PRIORITY, match, actions)
                     data = None
                     if msg.buffer_id == ofproto.OFP_NO_BUFFER:
                         data = msg.data
@@ -198,34 +341,40 @@ class SimpleSwitch13(app_manager.RyuApp):
                                               in_port=in_port, actions=actions, data=data)
                     datapath.send_msg(out)
                 else:
-                    # Destination MAC not known, flood to the other host port AND both spine ports (no flow install)
-                    tx_bytes_1 = self.tx_byte_int.get(dpid, {}).get(1, None)
-                    tx_bytes_2 = self.tx_byte_int.get(dpid, {}).get(2, None)
-
-                    if tx_bytes_1 is not None and tx_bytes_2 is not None:
-                        if tx_bytes_2 < tx_bytes_1:
-                            out_port = 2
-                        else:
-                            out_port = 1
-                            self.logger.info(
-                                "Adaptive ECMP: Port stats ready. TX Bytes: port1=%d, port2=%d → Selected port %d",
-                                tx_bytes_1, tx_bytes_2, out_port
-                            )
+                    # Destination MAC not known, spread over the uplinks through the leaf's group
+                    uplinks = self.roles.uplinks(dpid)
+                    tx_bps = self.tx_bps.get(dpid, {})
+
+                    if not uplinks:
+                        # No leaf->spine link discovered (yet, or any more): only
+                        # this leaf's other hosts are reachable, and no group flow
+                        # is installed until the uplinks are back
+                        actions = [parser.OFPActionOutput(port) for port in self.roles.host_ports(dpid)
+                                   if port != in_port]
+                        data = None
+                        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+                            data = msg.data
+                        out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
+                                                  in_port=in_port, actions=actions, data=data)
+                        datapath.send_msg(out)
+                        self.events.emit('uplink', dpid, None, None)
+                        return
+
+                    if all(port in tx_bps for port in uplinks):
+                        out_port = min(uplinks, key=lambda port: tx_bps[port])
+                        self.events.emit('uplink', dpid, out_port,
+                                         [round(tx_bps[port]) for port in uplinks])
                     else:
-                        out_port = 1  # Fallback to port 1 until stats are ready
-                        self.logger.warning("Adaptive ECMP: Port stats NOT ready, falling back to port 1")
-
-
-                    # Log port selection decision
-                    self.logger.info("Adaptive ECMP selected port %d at leaf %s", out_port, dpid)
+                        out_port = uplinks[0]  # Fallback to the first uplink until stats are ready
+                        self.events.emit('uplink', dpid, out_port, None)
 
                     # Actions and flow install
                     # Use group action for unknown destination MAC
-                    group_id = 50
+                    group_id = self.roles.group_id(dpid)
                     actions = [parser.OFPActionGroup(group_id)]
                     match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
 
-                    self.add_flow(datapath, 0, 3, match, actions)
+                    self.add_flow(datapath, 0, self.FLOW_PRIORITY, match, actions)
 
                     data = None
                     if msg.buffer_id == ofproto.OFP_NO_BUFFER:
@@ -235,15 +384,15 @@ class SimpleSwitch13(app_manager.RyuApp):
                                             in_port=in_port, actions=actions, data=data)
                     datapath.send_msg(out)
 
-                    self.logger.info("Group flow installed for dst %s on leaf %d via group %d", dst, dpid, group_id)
+                    self.events.emit('group_flow', dpid, dst, group_id)
 
-            elif in_port in [1, 2]:
+            elif self.roles.is_uplink(dpid, in_port):
                 # Packet from spine port
                 if dst in self.mac_to_port[dpid]:
                     out_port = self.mac_to_port[dpid][dst]
                     actions = [parser.OFPActionOutput(out_port)]
                     match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
-                    self.add_flow(datapath, 0, 3, match, actions)
+                    self.add_flow(datapath, 0, self.FLOW_PRIORITY, match, actions)
 
                     data = None
                     if msg.buffer_id == ofproto.OFP_NO_BUFFER:
@@ -252,8 +401,8 @@ class SimpleSwitch13(app_manager.RyuApp):
                                               in_port=in_port, actions=actions, data=data)
                     datapath.send_msg(out)
                 else:
-                    # Flood to both host ports
-                    actions = [parser.OFPActionOutput(3), parser.OFPActionOutput(4)]
+                    # Flood to the leaf's host ports
+                    actions = [parser.OFPActionOutput(port) for port in self.roles.host_ports(dpid)]
                     data = None
                     if msg.buffer_id == ofproto.OFP_NO_BUFFER:
                         data = msg.data
@@ -263,15 +412,10 @@ class SimpleSwitch13(app_manager.RyuApp):
             else:
                 # Unknown port, fallback: do nothing or log
                 self.logger.warning('Unknown in_port %s on leaf switch %s', in_port, dpid)
-        else:
+        elif role == SPINE:
             # spine switch
             # learn a mac address to avoid FLOOD next time.
-            self.logger.info("Learned MAC %s at port %s on switch %s", src, in_port, dpid)
-            self.logger.info("Looking for MAC %s on switch %s", dst, dpid)
-
-
             if dst in self.mac_to_port[dpid]:
-                self.logger.info("Destination MAC %s found on port %s", dst, self.mac_to_port[dpid][dst])
                 out_port = self.mac_to_port[dpid][dst]
             else:
                 out_port = ofproto.OFPP_FLOOD
@@ -284,10 +428,10 @@ class SimpleSwitch13(app_manager.RyuApp):
                 # verify if we have a valid buffer_id, if yes avoid to send both
                 # flow_mod & packet_out
                 if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                    self.add_flow(datapath, 0, 3, match, actions, msg.buffer_id)
+                    self.add_flow(datapath, 0, self.FLOW_PRIORITY, match, actions, msg.buffer_id)
                     return
                 else:
-                    self.add_flow(datapath, 0, 3, match, actions)
+                    self.add_flow(datapath, 0, self.FLOW_PRIORITY, match, actions)
 
             data = None
             if msg.buffer_id == ofproto.OFP_NO_BUFFER:
@@ -296,71 +440,88 @@ class SimpleSwitch13(app_manager.RyuApp):
             out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                       in_port=in_port, actions=actions, data=data)
             datapath.send_msg(out)
+        else:
+            # No link discovered on the switch yet, so leaf or spine is unknown
+            self.logger.debug('No role yet for switch %s, dropping packet from port %s', dpid, in_port)
+            return
 
-        self.logger.info('''
-                         
-                         
-                         [FORWARD] Sent packet from %s to %s via port %s dpid %s
-                         
-                         
-                         
-                         
-                         ''', src, dst, out_port, dpid)
+        self.events.emit('forward', dpid, in_port, src, dst, out_port)
 
 # ==================================================
 #                   Monitor
 # ==================================================
 
     def _monitor(self):
+        housekeeping = 0.0
         while True:
-            for dp in self.datapaths.values():
-                self._request_stats(dp)
-            hub.sleep(self.sleep)
-
-    def _request_stats(self, datapath):
-        self.logger.debug('send stats request: %016x', datapath.id)
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        req = parser.OFPFlowStatsRequest(datapath)
-        datapath.send_msg(req)
-
-        req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
-        datapath.send_msg(req)
-            
-        req_group = parser.OFPGroupStatsRequest(datapath, 0, ofproto.OFPG_ALL)
-        datapath.send_msg(req_group)
+            if time.monotonic() - housekeeping >= self.sleep:
+                housekeeping = time.monotonic()
+                self.hosts.expire()
+                self.arp_proxy.expire()
+                self.logger.debug('packet-in stats: %s', self.packet_in_dispatcher.stats())
+                self.logger.debug('stats polling: %s', self.stats_poller.stats())
+                self.logger.debug('event log: %s', self.events.stats())
+            self._poll_stats()
+            hub.sleep(self.stats_poller.sleep_for())
+
+    def _poll_stats(self):
+        # Flow, port and group requests of all switches are spread over the
+        # interval instead of sent in one burst; hot uplinks are polled more
+        # often and switches that answer slowly less
+        for job in self.stats_poller.due():
+            datapath = self.datapaths.get(job.dpid)
+            if datapath is None:
+                continue
+            self.logger.debug('send %s stats request: %016x', job.kind, datapath.id)
+            req = stats_request(datapath, job)
+            datapath.set_xid(req)
+            self.stats_poller.sent(job, req.xid)
+            datapath.send_msg(req)
+
+    def _stats_replied(self, msg):
+        more = bool(msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+        latency = self.stats_poller.replied(msg.datapath.id, msg.xid, more)
+        if latency is not None and latency > self.STATS_SLOW_REPLY:
+            self.logger.info('Slow stats reply from %016x: %.3f s', msg.datapath.id, latency)
 
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def _flow_stats_reply_handler(self, ev):
+        self._stats_replied(ev.msg)
         dpid = ev.msg.datapath.id
 
-        if dpid == 513 or dpid == 514:
+        if self.roles.is_leaf(dpid):
             body = ev.msg.body
 
-            self.logger.info('datapath         '
-                             'in-port  eth-dst           '
-                             'out-port packets  bytes')
-            self.logger.info('---------------- '
-                             '-------- ----------------- '
-                             '-------- -------- --------')
-            for stat in sorted([flow for flow in body if flow.priority == 1],
-                        key=lambda flow: (flow.match.get('in_port', -1), flow.match.get('eth_dst', '00:00:00:00:00:00'))
-                        ):
-                self.logger.info('%016x %8x %17s %8x %8d %8d',
-                                 ev.msg.datapath.id,
-                                 stat.match.get('in_port', -1), stat.match.get('eth_dst', '00:00:00:00:00:00'),
-                                 stat.instructions[0].actions[0].port,
-                                 stat.packet_count, stat.byte_count)
-            
-            for stat in ev.msg.body:
-                self.logger.info("Group ID: %d", stat.group_id)
-                self.logger.info("  Ref count: %d", stat.ref_count)
-                self.logger.info("  Packet Count: %d", stat.packet_count)
-                self.logger.info("  Byte Count: %d", stat.byte_count)
+            # One record per reply for the forwarding rules this app installs:
+            # in-port, eth-dst, out-port (or "group:<id>"), packets, bytes
+            self.events.emit('flow_stats', dpid, [
+                [stat.match.get('in_port', -1), stat.match.get('eth_dst', '00:00:00:00:00:00'),
+                 self._flow_target(stat), stat.packet_count, stat.byte_count]
+                for stat in sorted([flow for flow in body if flow.priority == self.FLOW_PRIORITY],
+                                   key=lambda flow: (flow.match.get('in_port', -1),
+                                                     flow.match.get('eth_dst', '00:00:00:00:00:00')))])
+
+    @staticmethod
+    def _flow_target(stat):
+        for inst in stat.instructions:
+            for action in getattr(inst, 'actions', ()):
+                if hasattr(action, 'group_id'):
+                    return 'group:%s' % action.group_id
+                if hasattr(action, 'port'):
+                    return action.port
+        return None
+
+    @set_ev_cls(ofp_event.EventOFPGroupStatsReply, MAIN_DISPATCHER)
+    def _group_stats_reply_handler(self, ev):
+        self._stats_replied(ev.msg)
+        if self.roles.is_leaf(ev.msg.datapath.id):
+            # group id, ref count, packets, bytes
+            self.events.emit('group_stats', ev.msg.datapath.id, [
+                [stat.group_id, stat.ref_count, stat.packet_count, stat.byte_count] for stat in ev.msg.body])
 
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
     def _port_stats_reply_handler(self, ev):
+        self._stats_replied(ev.msg)
         dpid = ev.msg.datapath.id
 
         body = ev.msg.body
@@ -371,9 +532,8 @@ class SimpleSwitch13(app_manager.RyuApp):
         # self.logger.info('---------------- -------- '
         #                  '-------- -------- -------- '
         #                  '-------- -------- --------')
-        if dpid == 513:
-            self.logger.info('datapath         port     tx-pkts  tx-bytes')
-            self.logger.info('---------------- -------- -------- --------')
+        leaf = self.roles.is_leaf(dpid)
+        rows = []  # port, tx-pkts, tx-bytes in the last interval, tx bit/s
         for stat in sorted(body, key=attrgetter('port_no')):
             # self.logger.info('%016x %8x %8d %8d %8d %8d %8d %8d',
             #                  ev.msg.datapath.id, stat.port_no,
@@ -385,6 +545,8 @@ class SimpleSwitch13(app_manager.RyuApp):
             self.tx_byte_cur.setdefault(dpid, {})
             self.tx_pkt_int.setdefault(dpid, {})
             self.tx_byte_int.setdefault(dpid, {})
+            self.tx_duration_cur.setdefault(dpid, {})
+            self.tx_bps.setdefault(dpid, {})
 
             if port_no in self.tx_pkt_cur[dpid]:
                 self.tx_pkt_int[dpid][port_no] = stat.tx_packets - self.tx_pkt_cur[dpid][port_no]
@@ -398,8 +560,23 @@ class SimpleSwitch13(app_manager.RyuApp):
                     self.logger.warning('Negative value of interval TX bytes')
             self.tx_byte_cur[dpid][port_no] = stat.tx_bytes
 
-            if dpid == 513:
-                if port_no in self.tx_pkt_int[dpid] and port_no in self.tx_byte_int[dpid]:
-                    self.logger.info('%016x %8x %8d %8d', dpid, port_no,
-                                    self.tx_pkt_int[dpid][port_no],
-                                    self.tx_byte_int[dpid][port_no])
\ No newline at end of file
+            # Hot uplinks are polled on their own, so intervals differ per
+            # port; the switch's port duration says how long each one was
+            duration = stat.duration_sec + stat.duration_nsec * 1e-9
+            interval = duration - self.tx_duration_cur[dpid].get(port_no, duration)
+            if interval > 0 and port_no in self.tx_byte_int[dpid]:
+                self.tx_bps[dpid][port_no] = max(self.tx_byte_int[dpid][port_no], 0) * 8.0 / interval
+                if self.roles.is_uplink(dpid, port_no):
+                    self.stats_poller.port_load(dpid, port_no,
+                                                self.tx_bps[dpid][port_no] / self.UPLINK_CAPACITY_BPS)
+            self.tx_duration_cur[dpid][port_no] = duration
+
+            if leaf and port_no in self.tx_pkt_int[dpid] and port_no in self.tx_byte_int[dpid]:
+                rows.append([port_no, self.tx_pkt_int[dpid][port_no], self.tx_byte_int[dpid][port_no],
+                             round(self.tx_bps[dpid].get(port_no, 0.0))])
+
+        if rows:
+            self.events.emit('port_stats', dpid, rows)
+
+        if dpid in self.wcmp:
+            self.update_group_weights(ev.msg.datapath)
\ No newline at end of file
@@ -28,15 +28,30 @@ from ryu.lib.packet import ipv4
 from ryu.lib.packet import tcp
 from ryu.lib.packet import udp
 from ryu.lib import hub
+from ryu.topology import event
+
+from ecmp.fabric_roles import LEAF, SPINE, FabricRoles
+from ecmp.failover import uplink_group_mods
+from ecmp.topology import Topology
+from ecmp.wcmp import WcmpWeights
 
 
 class SimpleSwitch13(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    FAILOVER_MODE = 'chained'  # 'none', 'watch' (live select buckets) or 'chained' (OFPGT_FF per uplink)
+    UPLINK_GROUP_BASE = 50  # select group id of the first leaf seen; every leaf gets its own
+    UPLINK_CAPACITY_BPS = 3e6  # bw=3 TCLinks in simple_topo
+    WCMP_BUCKET_BUDGET = 64  # total bucket weight the switch can realize per group
+    WCMP_MIN_DELTA = 0.05  # share change on some uplink below which weights are not re-sent
 
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.mac_to_port = {}
-        self.group_mod_flag = {}
+        # Leaves, spines, uplinks and host ports come from LLDP discovery
+        # (run with --observe-links)
+        self.topology = Topology()
+        self.roles = FabricRoles(self.topology, self.UPLINK_GROUP_BASE)
+        self.wcmp = WcmpWeights(self.WCMP_BUCKET_BUDGET, self.WCMP_MIN_DELTA)
 
         # monitor
         self.sleep = 2
@@ -55,10 +70,13 @@ class SimpleSwitch13(app_manager.RyuApp):
             if not datapath.id in self.datapaths:
                 self.logger.debug('register datapath: %016x', datapath.id)
                 self.datapaths[datapath.id] = datapath
+                self._update_uplink_groups()
         elif ev.state == DEAD_DISPATCHER:
             if datapath.id in self.datapaths:
                 self.logger.debug('unregister datapath: %016x', datapath.id)
                 del self.datapaths[datapath.id]
+                self.roles.forget(datapath.id)
+                self.wcmp.forget(datapath.id)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -79,7 +97,45 @@ class SimpleSwitch13(app_manager.RyuApp):
                                           ofproto.OFPCML_NO_BUFFER)]
         self.add_flow(datapath, 0, 0, match, actions)
 
-        self.group_mod_flag[dpid] = True
+        # A reconnecting leaf gets its group added again
+        self.roles.forget(dpid)
+        self.wcmp.forget(dpid)
+
+    @set_ev_cls(event.EventSwitchEnter)
+    def on_switch_enter(self, ev):
+        dpid = ev.switch.dp.id
+        if self.topology.add_switch(dpid, [p.port_no for p in ev.switch.ports]):
+            self.logger.info("[TOPO] Switch joined: %s", dpid)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def on_switch_leave(self, ev):
+        dpid = ev.switch.dp.id
+        self.roles.forget(dpid)
+        self.wcmp.forget(dpid)
+        if self.topology.remove_switch(dpid):
+            self.logger.info("[TOPO] Switch left: %s", dpid)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventLinkAdd)
+    def on_link_add(self, ev):
+        src = ev.link.src.dpid
+        port = ev.link.src.port_no
+        if self.topology.add_link(src, ev.link.dst.dpid, port, dst_port=ev.link.dst.port_no):
+            self.logger.info("[TOPO] Link added: %s -> %s via port %s", src, ev.link.dst.dpid, port)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventLinkDelete)
+    def on_link_delete(self, ev):
+        if self.topology.remove_link(ev.link.src.dpid, ev.link.dst.dpid):
+            self.logger.info("[TOPO] Link removed: %s -> %s", ev.link.src.dpid, ev.link.dst.dpid)
+            self._update_uplink_groups()
+
+    def _update_uplink_groups(self):
+        # Every leaf spreads over the uplinks discovered on it; its group is
+        # re-sent only when spines or links come or go
+        for dpid, group in sorted(self.roles.take_changed(ready=self.datapaths).items()):
+            self.send_group_mod(self.datapaths[dpid], group)
 
     def add_flow(self, datapath, hard_timeout, priority, match, actions, buffer_id=None):
     # def add_flow(self, datapath, priority, match, actions, buffer_id=None):
@@ -99,33 +155,34 @@ class SimpleSwitch13(app_manager.RyuApp):
                                     match=match, instructions=inst)
         datapath.send_msg(mod)
 
-    def send_group_mod(self, datapath):
-        ofproto = datapath.ofproto
-        ofp_parser = datapath.ofproto_parser
-
-        port_1 = 1
-        queue_1 = ofp_parser.OFPActionSetQueue(0)
-        actions_1 = [queue_1, ofp_parser.OFPActionOutput(port_1)]
-
-        port_2 = 2
-        queue_2 = ofp_parser.OFPActionSetQueue(0)
-        actions_2 = [queue_2, ofp_parser.OFPActionOutput(port_2)]
-
-        weight_1 = 50
-        weight_2 = 50
-
-        watch_port = ofproto_v1_3.OFPP_ANY
-        watch_group = ofproto_v1_3.OFPQ_ALL
-
-        buckets = [
-            ofp_parser.OFPBucket(weight_1, watch_port, watch_group, actions_1),
-            ofp_parser.OFPBucket(weight_2, watch_port, watch_group, actions_2)]
-
-        group_id = 50
-        req = ofp_parser.OFPGroupMod(datapath, ofproto.OFPFC_ADD,
-                                     ofproto.OFPGT_SELECT, group_id, buckets)
-
-        datapath.send_msg(req)
+    def send_group_mod(self, datapath, group):
+        # Equal weights whenever the uplink set changes, until port
+        # statistics say otherwise
+        weights = self.wcmp.reset(datapath.id, group.ports)
+
+        # Buckets watch their uplink (directly or through a fast-failover
+        # group), so the switch stops using a dead uplink on its own
+        for req in uplink_group_mods(datapath, group.group_id, group.ports, weights,
+                                     mode=self.FAILOVER_MODE, add=not group.previous,
+                                     previous=group.previous):
+            datapath.send_msg(req)
+
+    def update_group_weights(self, datapath):
+        # Uplink weights follow residual bandwidth; shifts below
+        # WCMP_MIN_DELTA are not worth a GroupMod
+        group_id = self.roles.group_id(datapath.id)
+        ports = sorted(self.wcmp.installed(datapath.id))
+        tx_bytes = self.tx_byte_int.get(datapath.id, {})
+        capacity = {port: self.UPLINK_CAPACITY_BPS for port in ports}
+        used = {port: tx_bytes.get(port, 0) * 8.0 / self.sleep for port in ports}
+        weights = self.wcmp.update(datapath.id, capacity, used)
+        if weights is None:
+            return
+        for req in uplink_group_mods(datapath, group_id, ports, weights,
+                                     mode=self.FAILOVER_MODE, add=False):
+            datapath.send_msg(req)
+        self.logger.info("Group ID %d on switch %d re-weighted: %s", group_id,
+                         datapath.id, weights)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -154,9 +211,10 @@ class SimpleSwitch13(app_manager.RyuApp):
 
         # self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
 
-        if dpid == 513 or dpid == 514:
+        role = self.roles.role(dpid)
+        if role == LEAF:
             # leaf switch
-            if in_port == 1 or in_port == 2:
+            if self.roles.is_uplink(dpid, in_port):
                 # packet from spine switch
                 if dst in self.mac_to_port[dpid]:
                     out_port = self.mac_to_port[dpid][dst]
@@ -185,15 +243,10 @@ class SimpleSwitch13(app_manager.RyuApp):
                     datapath.send_msg(out)
 
                 else:
-                    actions = [parser.OFPActionOutput(3)]
+                    actions = [parser.OFPActionOutput(port) for port in self.roles.host_ports(dpid)]
                     out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                           in_port=in_port, actions=actions, data=data)
                     datapath.send_msg(out)
-
-                    actions = [parser.OFPActionOutput(4)]
-                    out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
-                                          in_port=in_port, actions=actions, data=data)
-                    datapath.send_msg(out)                    
             else:
                 # packet from host
                 # learn a mac address to avoid FLOOD next time.
@@ -223,14 +276,26 @@ class SimpleSwitch13(app_manager.RyuApp):
                     datapath.send_msg(out)
                     return
     
+                uplinks = self.roles.uplinks(dpid)
+                if not uplinks:
+                    # No leaf->spine link discovered (yet, or any more): only this
+                    # leaf's other hosts are reachable, and nothing is installed
+                    data = None
+                    if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+                        data = msg.data
+                    actions = [parser.OFPActionOutput(port) for port in self.roles.host_ports(dpid)
+                               if port != in_port]
+                    out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
+                                              in_port=in_port, actions=actions, data=data)
+                    datapath.send_msg(out)
+                    return
+
                 ip_pkt = pkt.get_protocol(ipv4.ipv4)
 
                 if isinstance(ip_pkt, ipv4.ipv4):
                     # load balancing based on traffic monitoring
-                    if self.tx_byte_int[dpid][1] > self.tx_byte_int[dpid][2]:
-                        out_port = 2
-                    else:
-                        out_port = 1
+                    tx_bytes = self.tx_byte_int.get(dpid, {})
+                    out_port = min(uplinks, key=lambda port: tx_bytes.get(port, 0))
 
                     ip_dst = ip_pkt.dst
                     ip_proto = ip_pkt.proto
@@ -290,12 +355,7 @@ class SimpleSwitch13(app_manager.RyuApp):
                         return
 
                 # multipath implementation
-                if self.group_mod_flag[dpid] is True:
-                    self.send_group_mod(datapath)
-                    self.logger.info("send_group_mod")
-                    self.group_mod_flag[dpid] = False
-
-                actions = [parser.OFPActionGroup(group_id=50)]
+                actions = [parser.OFPActionGroup(group_id=self.roles.group_id(dpid))]
                 match = parser.OFPMatch(in_port=in_port,
                                         eth_type=eth.ethertype)
                 if msg.buffer_id != ofproto.OFP_NO_BUFFER:
@@ -332,7 +392,7 @@ class SimpleSwitch13(app_manager.RyuApp):
                 #     out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                 #                             in_port=in_port, actions=actions, data=data)
                 #     datapath.send_msg(out)
-        else:
+        elif role == SPINE:
             # spine switch
             # learn a mac address to avoid FLOOD next time.
             self.mac_to_port[dpid][src] = in_port
@@ -361,6 +421,9 @@ class SimpleSwitch13(app_manager.RyuApp):
             out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                       in_port=in_port, actions=actions, data=data)
             datapath.send_msg(out)
+        else:
+            # No link discovered on the switch yet, so leaf or spine is unknown
+            self.logger.debug('No role yet for switch %s, dropping packet from port %s', dpid, in_port)
 
 # ==================================================
 #                   Monitor
@@ -387,7 +450,7 @@ class SimpleSwitch13(app_manager.RyuApp):
     def _flow_stats_reply_handler(self, ev):
         dpid = ev.msg.datapath.id
 
-        if dpid == 513 or dpid == 514:
+        if self.roles.is_leaf(dpid):
             body = ev.msg.body
 
             self.logger.info('datapath         '
@@ -417,7 +480,7 @@ class SimpleSwitch13(app_manager.RyuApp):
         # self.logger.info('---------------- -------- '
         #                  '-------- -------- -------- '
         #                  '-------- -------- --------')
-        if dpid == 513:
+        if self.roles.is_leaf(dpid):
             self.logger.info('datapath         port     tx-pkts  tx-bytes')
             self.logger.info('---------------- -------- -------- --------')
         for stat in sorted(body, key=attrgetter('port_no')):
@@ -444,8 +507,12 @@ class SimpleSwitch13(app_manager.RyuApp):
                     self.logger.warning('Negative value of interval TX bytes')
             self.tx_byte_cur[dpid][port_no] = stat.tx_bytes
 
-            if dpid == 513:
+            if self.roles.is_leaf(dpid):
                 if port_no in self.tx_pkt_int[dpid] and port_no in self.tx_byte_int[dpid]:
                     self.logger.info('%016x %8x %8d %8d', dpid, port_no,
                                     self.tx_pkt_int[dpid][port_no],
-                                    self.tx_byte_int[dpid][port_no])
\ No newline at end of file
+                                    self.tx_byte_int[dpid][port_no])
+
+        # Only once the leaf's group exists
+        if dpid in self.wcmp:
+            self.update_group_weights(ev.msg.datapath)
\ No newline at end of file
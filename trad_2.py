@@ -28,15 +28,24 @@ from ryu.lib.packet import ipv4
 from ryu.lib.packet import tcp
 from ryu.lib.packet import udp,arp
 from ryu.lib import hub
+from ryu.topology import event
+
+from ecmp.fabric_roles import LEAF, SPINE, FabricRoles
+from ecmp.failover import uplink_group_mods
+from ecmp.topology import Topology
 
 
 class SimpleSwitch13(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    UPLINK_GROUP_BASE = 50  # select group id of the first leaf seen; every leaf gets its own
 
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.mac_to_port = {}
-        self.group_mod_flag = {}
+        # Leaves, spines, uplinks and host ports come from LLDP discovery
+        # (run with --observe-links)
+        self.topology = Topology()
+        self.roles = FabricRoles(self.topology, self.UPLINK_GROUP_BASE)
 
         # monitor
         self.sleep = 2
@@ -55,10 +64,12 @@ class SimpleSwitch13(app_manager.RyuApp):
             if not datapath.id in self.datapaths:
                 self.logger.debug('register datapath: %016x', datapath.id)
                 self.datapaths[datapath.id] = datapath
+                self._update_uplink_groups()
         elif ev.state == DEAD_DISPATCHER:
             if datapath.id in self.datapaths:
                 self.logger.debug('unregister datapath: %016x', datapath.id)
                 del self.datapaths[datapath.id]
+                self.roles.forget(datapath.id)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -80,11 +91,40 @@ class SimpleSwitch13(app_manager.RyuApp):
                                           ofproto.OFPCML_NO_BUFFER)]
         self.add_flow(datapath, 0, 0, match, actions)
 
-        self.group_mod_flag[dpid] = True
-        if self.group_mod_flag[dpid] is True:
-                    self.send_group_mod(datapath)
-                    self.logger.info("send_group_mod")
-                    self.group_mod_flag[dpid] = False
+    @set_ev_cls(event.EventSwitchEnter)
+    def on_switch_enter(self, ev):
+        dpid = ev.switch.dp.id
+        if self.topology.add_switch(dpid, [p.port_no for p in ev.switch.ports]):
+            self.logger.info("[TOPO] Switch joined: %s", dpid)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def on_switch_leave(self, ev):
+        dpid = ev.switch.dp.id
+        self.roles.forget(dpid)
+        if self.topology.remove_switch(dpid):
+            self.logger.info("[TOPO] Switch left: %s", dpid)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventLinkAdd)
+    def on_link_add(self, ev):
+        src = ev.link.src.dpid
+        port = ev.link.src.port_no
+        if self.topology.add_link(src, ev.link.dst.dpid, port, dst_port=ev.link.dst.port_no):
+            self.logger.info("[TOPO] Link added: %s -> %s via port %s", src, ev.link.dst.dpid, port)
+            self._update_uplink_groups()
+
+    @set_ev_cls(event.EventLinkDelete)
+    def on_link_delete(self, ev):
+        if self.topology.remove_link(ev.link.src.dpid, ev.link.dst.dpid):
+            self.logger.info("[TOPO] Link removed: %s -> %s", ev.link.src.dpid, ev.link.dst.dpid)
+            self._update_uplink_groups()
+
+    def _update_uplink_groups(self):
+        # Every leaf spreads over the uplinks discovered on it; its group is
+        # re-sent only when spines or links come or go
+        for dpid, group in sorted(self.roles.take_changed(ready=self.datapaths).items()):
+            self.send_group_mod(self.datapaths[dpid], group)
 
     def add_flow(self, datapath, hard_timeout, priority, match, actions, buffer_id=None):
     # def add_flow(self, datapath, priority, match, actions, buffer_id=None):
@@ -104,33 +144,13 @@ class SimpleSwitch13(app_manager.RyuApp):
                                     match=match, instructions=inst)
         datapath.send_msg(mod)
 
-    def send_group_mod(self, datapath):
-            ofproto = datapath.ofproto
-            ofp_parser = datapath.ofproto_parser
-
-            port_1 = 1
-            queue_1 = ofp_parser.OFPActionSetQueue(0)
-            actions_1 = [queue_1, ofp_parser.OFPActionOutput(port_1)]
-
-            port_2 = 2
-            queue_2 = ofp_parser.OFPActionSetQueue(0)
-            actions_2 = [queue_2, ofp_parser.OFPActionOutput(port_2)]
-
-            weight_1 = 50
-            weight_2 = 50
-
-            watch_port = ofproto_v1_3.OFPP_ANY
-            watch_group = ofproto_v1_3.OFPQ_ALL
-
-            buckets = [
-                ofp_parser.OFPBucket(weight_1, watch_port, watch_group, actions_1),
-                ofp_parser.OFPBucket(weight_2, watch_port, watch_group, actions_2)]
-
-            group_id = 50
-            req = ofp_parser.OFPGroupMod(datapath, ofproto.OFPFC_ADD,
-                                        ofproto.OFPGT_SELECT, group_id, buckets)
-
-            datapath.send_msg(req)
+    def send_group_mod(self, datapath, group):
+            # One equal-weight bucket per uplink, each through queue 0
+            for req in uplink_group_mods(datapath, group.group_id, group.ports, mode='none',
+                                         queue_id=0, add=not group.previous, previous=group.previous):
+                datapath.send_msg(req)
+            self.logger.info("Group ID %d on switch %d spreads over uplinks %s", group.group_id,
+                             datapath.id, list(group.ports))
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -163,11 +183,12 @@ class SimpleSwitch13(app_manager.RyuApp):
 
         # self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
         self.logger.info(f'{dpid}')
-        if dpid == 513 or dpid == 514:
+        role = self.roles.role(dpid)
+        if role == LEAF:
             # leaf switch
             self.logger.info('leaf if')
             self.mac_to_port[dpid][src] = in_port
-            if in_port in [3, 4]:
+            if self.roles.is_host_port(dpid, in_port):
                 # Packet from host port
                 if dst in self.mac_to_port[dpid]:
                     # Destination MAC is known (intra-leaf or learned)
@@ -183,23 +204,23 @@ class SimpleSwitch13(app_manager.RyuApp):
                     datapath.send_msg(out)
                 else:
                     # Destination MAC not known, flood to the other host port AND both spine ports (no flow install)
-                    actions = []
-                    if in_port == 3:
-                        actions = [parser.OFPActionOutput(4)]
-                    elif in_port == 4:
-                        actions = [parser.OFPActionOutput(3)]
+                    actions = [parser.OFPActionOutput(port) for port in self.roles.host_ports(dpid)
+                               if port != in_port]
                     # Always add spine ports for inter-leaf reachability
                     # actions += [parser.OFPActionOutput(1), parser.OFPActionOutput(2)]
-                    match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
-                    actions.append(parser.OFPActionGroup(group_id=50))
-                    self.add_flow(datapath, 0, 3, match, actions)
+                    # Without a discovered uplink the leaf has no group yet; reach
+                    # its own hosts only and install nothing until it does
+                    if self.roles.uplinks(dpid):
+                        match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
+                        actions.append(parser.OFPActionGroup(group_id=self.roles.group_id(dpid)))
+                        self.add_flow(datapath, 0, 3, match, actions)
                     data = None
                     if msg.buffer_id == ofproto.OFP_NO_BUFFER:
                         data = msg.data
                     out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                               in_port=in_port, actions=actions, data=data)
                     datapath.send_msg(out)
-            elif in_port in [1, 2]:
+            elif self.roles.is_uplink(dpid, in_port):
                 # Packet from spine port
                 if dst in self.mac_to_port[dpid]:
                     out_port = self.mac_to_port[dpid][dst]
@@ -213,8 +234,8 @@ class SimpleSwitch13(app_manager.RyuApp):
                                               in_port=in_port, actions=actions, data=data)
                     datapath.send_msg(out)
                 else:
-                    # Flood to both host ports
-                    actions = [parser.OFPActionOutput(3), parser.OFPActionOutput(4)]
+                    # Flood to the leaf's host ports
+                    actions = [parser.OFPActionOutput(port) for port in self.roles.host_ports(dpid)]
                     data = None
                     if msg.buffer_id == ofproto.OFP_NO_BUFFER:
                         data = msg.data
@@ -225,7 +246,7 @@ class SimpleSwitch13(app_manager.RyuApp):
                 # Unknown port, fallback: do nothing or log
                 self.logger.warning('Unknown in_port %s on leaf switch %s', in_port, dpid)
   
-        else:
+        elif role == SPINE:
             # spine switch
             # learn a mac address to avoid FLOOD next time.
             self.logger.info("Learned MAC %s at port %s on switch %s", src, in_port, dpid)
@@ -257,6 +278,10 @@ class SimpleSwitch13(app_manager.RyuApp):
             out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                       in_port=in_port, actions=actions, data=data)
             datapath.send_msg(out)
+        else:
+            # No link discovered on the switch yet, so leaf or spine is unknown
+            self.logger.debug('No role yet for switch %s, dropping packet from port %s', dpid, in_port)
+            return
 
         self.logger.info('''
                          
@@ -293,7 +318,7 @@ class SimpleSwitch13(app_manager.RyuApp):
     def _flow_stats_reply_handler(self, ev):
         dpid = ev.msg.datapath.id
 
-        if dpid == 513 or dpid == 514:
+        if self.roles.is_leaf(dpid):
             body = ev.msg.body
 
             self.logger.info('datapath         '
@@ -323,7 +348,7 @@ class SimpleSwitch13(app_manager.RyuApp):
         # self.logger.info('---------------- -------- '
         #                  '-------- -------- -------- '
         #                  '-------- -------- --------')
-        if dpid == 513:
+        if self.roles.is_leaf(dpid):
             self.logger.info('datapath         port     tx-pkts  tx-bytes')
             self.logger.info('---------------- -------- -------- --------')
         for stat in sorted(body, key=attrgetter('port_no')):
@@ -350,7 +375,7 @@ class SimpleSwitch13(app_manager.RyuApp):
                     self.logger.warning('Negative value of interval TX bytes')
             self.tx_byte_cur[dpid][port_no] = stat.tx_bytes
 
-            if dpid == 513:
+            if self.roles.is_leaf(dpid):
                 if port_no in self.tx_pkt_int[dpid] and port_no in self.tx_byte_int[dpid]:
                     self.logger.info('%016x %8x %8d %8d', dpid, port_no,
                                     self.tx_pkt_int[dpid][port_no],
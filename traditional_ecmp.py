@@ -365,22 +365,43 @@ from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
+from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3
 from ryu.topology import event
-from ryu.topology.api import get_switch, get_link
-from ryu.lib.packet import packet, ethernet, ipv4
-import networkx as nx
-import random
+
+from ecmp.fast_parse import parse_headers
+from ecmp.flow_hash import FlowHasher, five_tuple
+from ecmp.host_table import HostTable
+from ecmp.path_cache import PathCache
+from ecmp.resilient_hash import InstalledPaths, PathSelector
+from ecmp.topology import Topology
 
 
 class ECMPTraditional(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    FAST_PARSER = True  # read headers in place; False decodes every packet with Ryu
+    HASH_FUNCTION = 'crc32'  # 'crc32', 'fnv1a' or 'murmur' over the 5-tuple
+    HASH_SEED = 0
+    HASH_PER_SWITCH = True  # seed each switch differently to avoid hash polarization
+    HASH_MODE = 'rendezvous'  # 'modulo', 'rendezvous' or 'buckets' (resilient table)
+    FLOW_PRIORITY = 10
+    FLOW_IDLE_TIMEOUT = 30  # seconds; per-flow rules age out of the switch tables
+    PATH_WARM_DELAY = 0.5  # seconds a burst of topology events settles before paths are warmed
+    HOST_EXPIRE_INTERVAL = 30  # seconds between host table age-outs
 
     def __init__(self, *args, **kwargs):
         super(ECMPTraditional, self).__init__(*args, **kwargs)
-        self.graph = nx.DiGraph()
-        self.mac_to_port = {}
+        self.topology = Topology()
+        self.graph = self.topology.graph
+        self.hosts = HostTable()
         self.datapaths = {}
+        self.path_cache = PathCache(self.graph)
+        self.topology.subscribe(self.path_cache)
+        self.flow_hasher = FlowHasher(self.HASH_FUNCTION, self.HASH_SEED, self.HASH_PER_SWITCH)
+        self.path_selector = PathSelector(self.flow_hasher, self.HASH_MODE)
+        self.installed = InstalledPaths(self.path_selector)
+        self._warm_scheduled = False
+        self.monitor_thread = hub.spawn(self._monitor)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -399,29 +420,130 @@ class ECMPTraditional(app_manager.RyuApp):
         self.logger.info("[BOOT] Default FLOOD rule installed on switch %s", datapath.id)
 
     @set_ev_cls(event.EventSwitchEnter)
-    def get_topology(self, ev):
-        switch_list = get_switch(self, None)
-        switches = [sw.dp.id for sw in switch_list]
-        self.graph.add_nodes_from(switches)
-        self.logger.info("[TOPO] Switches: %s", switches)
-
-        link_list = get_link(self, None)
-        for link in link_list:
-            src = link.src.dpid
-            dst = link.dst.dpid
-            port = link.src.port_no
-            self.graph.add_edge(src, dst, port=port, weight=1)
+    def on_switch_enter(self, ev):
+        dpid = ev.switch.dp.id
+        if self.topology.add_switch(dpid, [p.port_no for p in ev.switch.ports]):
+            self.logger.info("[TOPO] Switch joined: %s (version %s)", dpid, self.topology.version)
+            self._warm_paths()
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def on_switch_leave(self, ev):
+        dpid = ev.switch.dp.id
+        self.hosts.forget_switch(dpid)
+        if self.topology.remove_switch(dpid):
+            self.logger.info("[TOPO] Switch left: %s (version %s)", dpid, self.topology.version)
+            self._warm_paths()
+
+    @set_ev_cls(event.EventLinkAdd)
+    def on_link_add(self, ev):
+        src = ev.link.src.dpid
+        dst = ev.link.dst.dpid
+        port = ev.link.src.port_no
+        self.hosts.forget_port(src, port)
+        self.hosts.forget_port(dst, ev.link.dst.port_no)
+        if self.topology.add_link(src, dst, port, dst_port=ev.link.dst.port_no):
             self.logger.info("[TOPO] Link added: %s -> %s via port %s", src, dst, port)
+            self._warm_paths()
+
+    @set_ev_cls(event.EventLinkDelete)
+    def on_link_delete(self, ev):
+        src = ev.link.src.dpid
+        dst = ev.link.dst.dpid
+        if self.topology.remove_link(src, dst):
+            self.logger.info("[TOPO] Link removed: %s -> %s", src, dst)
+            self._warm_paths()
+
+    def _warm_paths(self):
+        # Discovery reports links one by one: warm once the burst has settled
+        # instead of once per event, so packet-ins find their paths cached
+        if not self._warm_scheduled:
+            self._warm_scheduled = True
+            hub.spawn_after(self.PATH_WARM_DELAY, self._sync_paths)
+
+    def _sync_paths(self):
+        self._warm_scheduled = False
+        version = self.topology.version
+        if self.path_cache.sync(version):
+            self.logger.info("[PATH] Paths warmed for topology version %s: %s", version, self.path_cache.stats())
+            self._remap_flows(version)
+
+    def _remap_flows(self, version):
+        # Installed rules never come back to the controller while traffic
+        # flows, so flows whose equal-cost set changed are re-selected here
+        # and only the ones the selector moves are reinstalled
+        installed = len(self.installed)
+        checked = self.installed.counters["checked"]
+        moved = self.installed.remap(self.path_cache.get)
+        for cookie, flow, old_path, new_path in moved:
+            keep = set()
+            if new_path is not None:
+                self._install_path(new_path, flow, cookie)
+                keep = set(new_path[:-1])
+            for dpid in old_path[:-1]:
+                if dpid not in keep:
+                    self._delete_rule(dpid, flow, cookie)
+        checked = self.installed.counters["checked"] - checked
+        if checked:
+            self.logger.info("[PATH] Topology version %s: %s of %s installed flows re-checked, %s moved (%.3f)",
+                             version, checked, installed, len(moved), len(moved) / installed)
+
+    def _monitor(self):
+        while True:
+            hub.sleep(self.HOST_EXPIRE_INTERVAL)
+            aged_out = self.hosts.expire()
+            if aged_out:
+                self.logger.info("[HOST] Aged out: %s", aged_out)
+
+    def _get_ecmp_path(self, src, dst, flow):
+        paths = self.path_cache.get(src, dst)
+        if not paths:
+            return paths, []
+
+        # Same flow, same path: a per-packet random pick reorders TCP
+        chosen_path = self.path_selector.select(paths, flow, src)
+        self.logger.info("[PATH] ECMP paths from %s to %s: %s -> chosen: %s", src, dst, paths, chosen_path)
+        return paths, chosen_path
 
-    def _get_ecmp_path(self, src, dst):
-        try:
-            paths = list(nx.all_shortest_paths(self.graph, src, dst))
-        except nx.NetworkXNoPath:
-            return []
+    def _install_path(self, path, flow, cookie):
+        # Rules match the 5-tuple that was hashed, so every flow gets its own
+        # path choice; the cookie ties them to the installed-path entry
+        fields = flow.match()
+        for i in range(len(path) - 1):
+            curr_sw = path[i]
+            dp = self.datapaths.get(curr_sw)
+            if dp is None:
+                continue
+            out_port = self.graph[curr_sw][path[i + 1]]['port']
+            match = dp.ofproto_parser.OFPMatch(**fields)
+            actions = [dp.ofproto_parser.OFPActionOutput(out_port)]
+            inst = [dp.ofproto_parser.OFPInstructionActions(dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
+            mod = dp.ofproto_parser.OFPFlowMod(datapath=dp, cookie=cookie, priority=self.FLOW_PRIORITY,
+                                               idle_timeout=self.FLOW_IDLE_TIMEOUT,
+                                               flags=dp.ofproto.OFPFF_SEND_FLOW_REM,
+                                               match=match, instructions=inst)
+            dp.send_msg(mod)
+            self.logger.info("[FLOW] ECMP rule: sw=%s flow=%s -> port %s", curr_sw, flow, out_port)
 
-        chosen_path = random.choice(paths)
-        self.logger.info("[PATH] ECMP paths from %s to %s: %s -> chosen: %s", src, dst, paths, chosen_path)
-        return chosen_path
+    def _delete_rule(self, dpid, flow, cookie):
+        dp = self.datapaths.get(dpid)
+        if dp is None:
+            return
+        mod = dp.ofproto_parser.OFPFlowMod(datapath=dp, cookie=cookie, cookie_mask=0xFFFFFFFFFFFFFFFF,
+                                           command=dp.ofproto.OFPFC_DELETE_STRICT,
+                                           priority=self.FLOW_PRIORITY,
+                                           out_port=dp.ofproto.OFPP_ANY, out_group=dp.ofproto.OFPG_ANY,
+                                           match=dp.ofproto_parser.OFPMatch(**flow.match()))
+        dp.send_msg(mod)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        # The ingress rule idling out ends the flow; deletions we sent after
+        # moving it (and the other hops' removals) leave the entry alone
+        msg = ev.msg
+        entry = self.installed.get(msg.cookie)
+        if entry is None or msg.datapath.id != entry[1][0] or msg.reason == msg.datapath.ofproto.OFPRR_DELETE:
+            return
+        self.installed.remove(msg.cookie)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
@@ -432,26 +554,21 @@ class ECMPTraditional(app_manager.RyuApp):
         dpid = datapath.id
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        ip_pkt = pkt.get_protocol(ipv4.ipv4)
+        eth, _, ip_pkt = parse_headers(msg.data, fast=self.FAST_PARSER)
         if not ip_pkt:
             return
 
         dst_mac = eth.dst
         src_mac = eth.src
 
-        self.mac_to_port.setdefault(dpid, {})
-        self.mac_to_port[dpid][src_mac] = in_port
+        if self.topology.is_edge_port(dpid, in_port):
+            moved_from = self.hosts.learn(src_mac, dpid, in_port)
+            if moved_from is not None:
+                self.logger.info("[HOST] %s moved from %s to %s", src_mac, moved_from, (dpid, in_port))
 
         # Find destination location
-        dst_dpid = None
-        for sw_id, mac_table in self.mac_to_port.items():
-            if dst_mac in mac_table:
-                dst_dpid = sw_id
-                break
-
-        if dst_dpid is None:
+        location = self.hosts.lookup(dst_mac)
+        if location is None:
             self.logger.info("[MAC_LOOKUP] Unknown destination MAC %s — flooding", dst_mac)
             actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
             out = parser.OFPPacketOut(
@@ -465,24 +582,15 @@ class ECMPTraditional(app_manager.RyuApp):
             return
 
         # Compute ECMP path
-        path = self._get_ecmp_path(dpid, dst_dpid)
+        dst_dpid = location[0]
+        flow = five_tuple(ip_pkt)
+        paths, path = self._get_ecmp_path(dpid, dst_dpid, flow)
         if not path or len(path) < 2:
             self.logger.warning("[PATH] No valid ECMP path found from %s to %s", dpid, dst_dpid)
             return
 
         # Install flow rules along path
-        for i in range(len(path) - 1):
-            curr_sw = path[i]
-            next_sw = path[i + 1]
-            out_port = self.graph[curr_sw][next_sw]['port']
-            dp = self.datapaths[curr_sw]
-            match = dp.ofproto_parser.OFPMatch(eth_dst=dst_mac)
-            actions = [dp.ofproto_parser.OFPActionOutput(out_port)]
-            inst = [dp.ofproto_parser.OFPInstructionActions(dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
-            mod = dp.ofproto_parser.OFPFlowMod(datapath=dp, priority=10,
-                                               match=match, instructions=inst)
-            dp.send_msg(mod)
-            self.logger.info("[FLOW] ECMP rule: sw=%s dst_mac=%s -> port %s", curr_sw, dst_mac, out_port)
+        self._install_path(path, flow, self.installed.add(flow, paths, path))
 
         # Forward current packet
         out_port = self.graph[dpid][path[1]]['port']